@@ -0,0 +1,185 @@
+"""
+=================== NFT-MINTER BENCHMARK ===================
+usage: benchmark.py [-h] [-sizes SIZES] [-cases CASES] [-latency LATENCY] [-block-time BLOCK_TIME]
+                    [-layers LAYERS] [-endpoints ENDPOINTS] [-rate-limit RATE_LIMIT] [-output OUTPUT]
+
+This program measures throughput of minting and splitter functions offline.
+
+Instead of the testnet from settings.json it uses a local stand-in chain (src/standin.py) - an in-process
+JSON-RPC server with an emulated mint contract, optional latency added to every request and blocks mined
+every BLOCK_TIME seconds. With ENDPOINTS > 1 the chain is served by many endpoints, which are used
+as the provider pool. With RATE_LIMIT every endpoint answers HTTP 429 to requests above that many
+per second, like providers do when the quota of the plan is exceeded. Nothing is sent to the real network and secrets.json isn't used.
+
+For every case and size it reports transactions per second, JSON-RPC calls and HTTP requests per mint
+and wall time of every phase. Results are saved as JSON, so they can be compared between versions.
+
+Example: python benchmark.py -sizes 10,100,1000 -latency 0.05 -output logs/benchmark.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import time
+
+from collections import Counter
+from hashlib import sha256
+from typing import List
+
+from web3 import Web3
+
+from minter import single_account_mint, multi_accounts_mint, streaming_multi_accounts_mint
+from src.accounts import AccountExt, get_derived_accounts
+from src.gas import gas_oracle
+from src.nonces import nonce_manager
+from src.state import account_states
+from src.splitter import send_one_to_many, send_many_to_many, send_many_to_one
+from src.standin import StandInChain, StandInServer, STANDIN_ABI, STANDIN_CONTRACT_ADDRESS
+from src.utils import estimate_multi_mint_fees
+from settings import config, FEES_MULT_FACTOR
+
+
+# Fixed key, so derived accounts (and their cached addresses) are the same in every run
+BENCHMARK_PRIVATE_KEY = '0x' + sha256(b'nft-minter benchmark').hexdigest()
+BENCHMARK_MINT_PRICE = 0.01
+GENESIS_BALANCE = 10 ** 30
+CASES = ['single_account_mint', 'multi_accounts_mint', 'streaming_multi_accounts_mint', 'splitter']
+
+
+def run_phase(phases: dict, name: str, func, *args):
+    """Runs func with printing disabled and saves its wall time in phases.
+    """
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = func(*args)
+    phases[name] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def run_case(servers: List[StandInServer], case: str, size: int) -> dict:
+    """Runs one case on a fresh chain and returns its measurements.
+    """
+    servers[0].reset()
+    for server in servers[1:]:
+        server.reset_counters()
+    nonce_manager.reset()
+    gas_oracle.reset()
+    account_states.reset()
+    master_account = AccountExt.from_key(BENCHMARK_PRIVATE_KEY)
+    config.NUMBER_OF_MINTS = size
+    phases = {}
+    start = time.perf_counter()
+
+    if case == 'single_account_mint':
+        run_phase(phases, 'mint', single_account_mint, master_account)
+        mints = size
+    elif case == 'multi_accounts_mint':
+        run_phase(phases, 'derive', get_derived_accounts, master_account, size * (config.EXTRA_MIXING_LAYERS + 1))
+        total_fees = run_phase(phases, 'estimate', estimate_multi_mint_fees) * FEES_MULT_FACTOR
+        run_phase(phases, 'mint', multi_accounts_mint, master_account, total_fees)
+        mints = size
+    elif case == 'streaming_multi_accounts_mint':
+        # accounts are derived and fees are estimated inside, window by window
+        run_phase(phases, 'mint', streaming_multi_accounts_mint, master_account)
+        mints = size
+    elif case == 'splitter':
+        accounts = run_phase(phases, 'derive', get_derived_accounts, master_account, 2 * size)
+        run_phase(phases, 'send_one_to_many', send_one_to_many, master_account, accounts[:size],
+                  Web3.toWei(BENCHMARK_MINT_PRICE, 'ether'))
+        run_phase(phases, 'send_many_to_many', send_many_to_many, accounts[:size], accounts[size:])
+        run_phase(phases, 'send_many_to_one', send_many_to_one, accounts[size:], master_account)
+        mints = 0
+    else:
+        raise Exception(f'Unknown case {case}')
+
+    wall_time = time.perf_counter() - start
+    chain = servers[0].chain
+    with chain.lock:
+        transactions = sum(len(block['transactions']) for block in chain.blocks)
+        minted = len(chain.token_owners)
+        rpc_calls = dict(sum((server.rpc_calls for server in servers), Counter()))
+        http_requests = sum(server.http_requests for server in servers)
+    total_rpc_calls = sum(rpc_calls.values())
+    return {'case': case,
+            'size': size,
+            'wall_time': round(wall_time, 4),
+            'phases': phases,
+            'transactions': transactions,
+            'transactions_per_second': round(transactions / wall_time, 2),
+            'minted': minted,
+            'rpc_calls': total_rpc_calls,
+            'http_requests': http_requests,
+            'rpc_calls_per_mint': round(total_rpc_calls / mints, 2) if mints else None,
+            'http_requests_per_mint': round(http_requests / mints, 2) if mints else None,
+            'rpc_calls_by_method': rpc_calls}
+
+
+parser = argparse.ArgumentParser(allow_abbrev=False,
+                                 description='This program measures throughput of minting and splitter functions '
+                                             'against a local stand-in chain.')
+parser.add_argument('-sizes', default='10,100,1000,5000',
+                    help='- comma separated numbers of mints (accounts in splitter case)')
+parser.add_argument('-cases', default=','.join(CASES),
+                    help=f'- comma separated cases to run, available: {", ".join(CASES)}')
+parser.add_argument('-latency', type=float, default=0,
+                    help='- seconds added to every HTTP request, emulates remote provider')
+parser.add_argument('-block-time', dest='block_time', type=float, default=1,
+                    help='- seconds between blocks of the stand-in chain')
+parser.add_argument('-layers', type=int, default=0,
+                    help='- EXTRA_MIXING_LAYERS used in multi_accounts_mint case')
+parser.add_argument('-endpoints', type=int, default=1,
+                    help='- number of endpoints serving the stand-in chain, used as the provider pool')
+parser.add_argument('-rate-limit', dest='rate_limit', type=float, default=None,
+                    help='- HTTP requests per second allowed by every endpoint, above it they answer HTTP 429')
+parser.add_argument('-output', default='logs/benchmark.json',
+                    help='- file to save results in JSON format')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    cases = args.cases.split(',')
+
+    # everything is pointed at the stand-in before the first request creates the connection
+    chain = StandInChain(config.CHAIN_ID, {AccountExt.from_key(BENCHMARK_PRIVATE_KEY).address: GENESIS_BALANCE},
+                         Web3.toWei(BENCHMARK_MINT_PRICE, 'ether'))
+    servers = [StandInServer(chain, block_time=args.block_time if i == 0 else None, latency=args.latency,
+                             rate_limit=args.rate_limit)
+               for i in range(args.endpoints)]
+    for server in servers:
+        server.start()
+    config.SECRETS = {'PRIVATE_KEY': BENCHMARK_PRIVATE_KEY, 'PROVIDER': [server.url for server in servers]}
+    config.CONTRACT_ADDRESS = STANDIN_CONTRACT_ADDRESS
+    config.CONTRACT_ABI = STANDIN_ABI
+    config.MINT_FUNCTION_NAME = 'mint'
+    config.MINT_PRICE = BENCHMARK_MINT_PRICE
+    config.EXTRA_MIXING_LAYERS = args.layers
+    config.SEND_BACK = True
+    config.LOGGING = False
+
+    print('=================== NFT-MINTER BENCHMARK ===================')
+    print(f'Stand-in chain at {", ".join(server.url for server in servers)} | block time: {args.block_time} s | '
+          f'latency: {args.latency} s')
+    results = []
+    try:
+        for case in cases:
+            for size in sizes:
+                result = run_case(servers, case, size)
+                results.append(result)
+                print(f'{case:<20} size: {size:<6} wall time: {result["wall_time"]:>9.2f} s | '
+                      f'tx/s: {result["transactions_per_second"]:>8.2f} | '
+                      f'RPC calls per mint: {result["rpc_calls_per_mint"]} | phases: {result["phases"]}')
+    finally:
+        for server in servers:
+            server.stop()
+
+    with open(args.output, 'w') as f:
+        json.dump({'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
+                   'python': platform.python_version(),
+                   'parameters': {'sizes': sizes, 'cases': cases, 'latency': args.latency,
+                                  'block_time': args.block_time, 'layers': args.layers,
+                                  'endpoints': args.endpoints, 'rate_limit': args.rate_limit},
+                   'results': results}, f, indent=4)
+    print(f'Results saved in {args.output}')
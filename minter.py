@@ -1,6 +1,7 @@
 """
 ======================= NFT-MINTER =======================
-usage: minter.py [-h] [-single | -multi | -newacc]
+usage: minter.py [-h] [-single | -multi | -newacc] [-presign] [-async] [-armed] [-stream] [-resume]
+                 [-jobs JOBS_FILE] [-inventory] [-daemon]
 
 This program allows you to mint NFTs in a batch from single or multiple addresses.
 
@@ -10,119 +11,729 @@ Run with one of the following command-line arguments:
   -single     - Single mode - uses master account to mint
   -multi      - Multi mode - uses master account to derive more accounts and mint using them
   -newacc     - New account mode - generates a new account, displays keys and quits the program
+  -presign    - Presign mode - signs all mint transactions first and then broadcasts them at once
+  -async      - Async mode - only with -multi, sends transactions of all accounts in a layer concurrently
+  -armed      - Armed mode - prepares everything in advance and fires mint transactions when TRIGGER
+                from settings.py is met
+  -stream     - Stream mode - only with -multi, processes accounts in windows of STREAM_WINDOW_SIZE,
+                for very large NUMBER_OF_MINTS
+  -resume     - Resume mode - only with -multi, continues the last interrupted run from its journal
+  -jobs JOBS_FILE
+              - Jobs mode - runs jobs from JOBS_FILE (e.g. other contracts or chains) concurrently
+  -inventory  - Inventory mode - finds tokens of CONTRACT_ADDRESS owned by the master and derived accounts
+                and exports them to INVENTORY_DIR
+  -daemon     - Daemon mode - keeps connections and accounts warm and runs jobs submitted to the HTTP API
+                on DAEMON_HOST:DAEMON_PORT
 
 Example: python minter.py -multi
 """
 
-from src.accounts import get_master_account, get_derived_accounts, display_accounts
-from src.splitter import send_many_to_many, send_one_to_many, send_many_to_one
-from src.interactions import contract_write, contract_write_from_one
-from src.utils import estimate_single_mint_fee, estimate_multi_mint_fees
-from settings import w3, MINT_FUNCTION_NAME, MINT_PRICE, NUMBER_OF_MINTS, EXTRA_MIXING_LAYERS,\
-    LOGGING, CONTRACT_ADDRESS, CHAIN_NAME, SEND_BACK, FEES_MULT_FACTOR, logger, parser
+import asyncio
+import contextvars
+import itertools
+import os
+import queue
+import threading
+import time
 
+from collections import Counter
+from functools import partial
 
-def single_account_mint(master_account):
+from src.accounts import get_master_account, get_derived_accounts, iter_derived_accounts, display_accounts
+from src.splitter import send_tx, send_all, send_many_to_one
+from src.interactions import get_contract, contract_write, contract_write_from_one, plan_mint_batches, simulate_contract_writes
+from src.async_engine import async_send_one_to_many, async_send_many_to_many, async_send_many_to_one,\
+    async_contract_write_from_many, async_wait_for_receipts
+from src.receipts import wait_for_receipts, display_receipts
+from src.presign import prepare_contract_writes, fire_transaction, fire_transactions
+from src.scheduler import TxScheduler, CONFIRMED
+from src.trigger import wait_for_trigger
+from src.gas import gas_oracle
+from src.journal import run_journal, find_unfinished_journal, load_journal, plan_differences
+from src.nonces import nonce_manager
+from src.state import account_states
+from src.metrics import phase, rpc_metrics
+from src.daemon import MintDaemon
+from src.inventory import get_inventory, display_inventory, export_inventory
+from src.utils import estimate_single_account_mint_fees, estimate_multi_mint_fees, estimate_chain_fees
+from settings import config, CONTRACT_FUNCTION_GAS, FEES_MULT_FACTOR, METRICS_DIR, SIMULATE_MINTS, TRIGGER,\
+    STREAM_WINDOW_SIZE, STREAM_QUEUE_SIZE, STREAM_FEES_MARGIN, JOURNAL_DIR, parser, bind_context, current_config,\
+    load_jobs
+
+
+def presigned_mint(accounts):
+    """Signs mint transaction for every account first and then broadcasts all of them at once.
+    Returns hashes of broadcast transactions.
+    """
+    prepared = prepare_contract_writes(accounts, config.MINT_FUNCTION_NAME, None,
+                                       config.w3.toWei(config.MINT_PRICE, 'ether'))
+    return fire_transactions(prepared)
+
+
+def prepare_single_mints(master_account, simulate=SIMULATE_MINTS):
+    """Signs all mint transactions of Single mode, returns them prepared for fire_transactions().
+    """
+    mint_price = config.w3.toWei(config.MINT_PRICE, 'ether')
+    batches = plan_mint_batches(config.MINT_FUNCTION_NAME, config.NUMBER_OF_MINTS, mint_price,
+                                sender_address=master_account.address)
+    if simulate == True:
+        simulations = simulate_contract_writes([{'sender': master_account, **batch} for batch in batches],
+                                               config.MINT_FUNCTION_NAME)
+        batches = [batch for batch, simulation in zip(batches, simulations) if simulation['passed']]
+    prepared = []
+    for batch in batches:
+        prepared += prepare_contract_writes([master_account], config.MINT_FUNCTION_NAME, batch['args'],
+                                            batch['amount'], batch['gas'])
+    return prepared
+
+
+def single_account_mint(master_account, presign=False):
     """Mints the NFT of smart contract defined in settings.py from single account.
 
-    EXTRA_MIXING_LAYERS and SEND_BACK don't have any effect here.
+    When the mint function takes the number of tokens, many tokens are minted in one transaction.
+    EXTRA_MIXING_LAYERS and SEND_BACK don't have any effect here. Returns results of wait_for_receipts().
     """
-    contract_write_from_one(master_account, MINT_FUNCTION_NAME, None, NUMBER_OF_MINTS, w3.toWei(MINT_PRICE, 'ether'))
+    with phase('mint'):
+        if presign:
+            tx_hashes = fire_transactions(prepare_single_mints(master_account))
+        else:
+            tx_hashes = contract_write_from_one(master_account, config.MINT_FUNCTION_NAME, None,
+                                                config.NUMBER_OF_MINTS, config.w3.toWei(config.MINT_PRICE, 'ether'),
+                                                wait=False, batch=True)
+        results = wait_for_receipts(tx_hashes)
+        display_receipts(results)
     display_accounts([master_account], balances=True)
+    return results
 
 
-def multi_accounts_mint(master_account, total_fees):
-    """Mints the NFT of smart contract defined in settings.py from multiple accounts.
+def get_accounts_layers(master_account, display=True):
+    """Derives accounts used in Multi mode and splits them into EXTRA_MIXING_LAYERS + 1 layers.
     """
-
-    total_accounts_num = NUMBER_OF_MINTS + NUMBER_OF_MINTS * EXTRA_MIXING_LAYERS
+    total_accounts_num = config.NUMBER_OF_MINTS + config.NUMBER_OF_MINTS * config.EXTRA_MIXING_LAYERS
     accounts = get_derived_accounts(master_account, number_of_accounts=total_accounts_num)
-    display_accounts([master_account] + accounts, balances=True, secrets=True)
+    if display:
+        display_accounts([master_account] + accounts, balances=True, secrets=True)
 
     accounts_layers = []
-    if EXTRA_MIXING_LAYERS > 0:
-        for i in range(EXTRA_MIXING_LAYERS + 1):
-            accounts_layers.append(accounts[i * NUMBER_OF_MINTS: i * NUMBER_OF_MINTS + NUMBER_OF_MINTS])
+    if config.EXTRA_MIXING_LAYERS > 0:
+        for i in range(config.EXTRA_MIXING_LAYERS + 1):
+            accounts_layers.append(accounts[i * config.NUMBER_OF_MINTS: (i + 1) * config.NUMBER_OF_MINTS])
     else:
         accounts_layers.append(accounts)
+    return accounts_layers
+
+
+def chain_step_keys(chain):
+    """Returns keys of steps of chain of transactions of accounts [first layer, ..., last layer]:
+    fund, mixing hops, mint and send back (if SEND_BACK). Keys contain addresses, so they are the same
+    when the run is resumed from the journal.
+    """
+    keys = [f'fund {chain[0].address}']
+    keys += [f'hop {account.address} -> {next_account.address}' for account, next_account in zip(chain, chain[1:])]
+    keys.append(f'mint {chain[-1].address}')
+    if config.SEND_BACK == True:
+        keys.append(f'send back {chain[-1].address}')
+    return keys
+
+
+def drop_finished_chains(accounts_layers, journaled):
+    """Drops chains whose last step has a result in the journal of the interrupted run.
+    """
+    chains = [chain for chain in zip(*accounts_layers)
+              if (journaled.get(chain_step_keys(chain)[-1]) or {}).get('result') is None]
+    return [[chain[i] for chain in chains] for i in range(len(accounts_layers))]
+
+
+def drop_reverting_mints(accounts_layers, journaled=None):
+    """Simulates mint from every account of the last layer and drops accounts whose mint would revert
+    from all layers, so their chains of transactions aren't even funded.
+    Chains which were started before the run was interrupted (see journaled) are continued without simulation.
+    """
+    if SIMULATE_MINTS != True:
+        return accounts_layers
+    chains = list(zip(*accounts_layers))
+    started = {i for i, chain in enumerate(chains)
+               if journaled is not None and any(key in journaled for key in chain_step_keys(chain))}
+    simulated = [i for i in range(len(chains)) if i not in started]
+    mint_price = config.w3.toWei(config.MINT_PRICE, 'ether')
+    writes = [{'sender': chains[i][-1], 'args': None, 'amount': mint_price, 'gas': CONTRACT_FUNCTION_GAS}
+              for i in simulated]
+    simulations = simulate_contract_writes(writes, config.MINT_FUNCTION_NAME, override_balances=True)
+    passed = started | {i for i, simulation in zip(simulated, simulations) if simulation['passed']}
+    return [[layer[i] for i in range(len(chains)) if i in passed] for layer in accounts_layers]
+
+
+def send_chain_funds(master_account, account, mint_price):
+    """Funds chain of transactions of account with the mint price and its fees estimated when it's sent,
+    times STREAM_FEES_MARGIN, as fees can rise before its mint.
+    """
+    return send_tx(master_account, account, int(mint_price + estimate_chain_fees(0) * STREAM_FEES_MARGIN))
+
+
+def run_accounts_chains(master_account, accounts_layers, chain_fees=None, presign=False, journaled=None):
+    """Runs chain of transactions of every account of the last layer: fund -> mixing hops -> mint -> send back.
+    Every chain is funded with mint price + chain_fees, or with send_chain_funds() if chain_fees is None.
+    Each step is sent as soon as the previous step of the same chain is confirmed,
+    so a slow transaction delays only its own chain. Steps recorded in journaled (the journal of an interrupted run)
+    continue from their recorded state. Returns results of TxScheduler.run().
+    """
+    mint_price = config.w3.toWei(config.MINT_PRICE, 'ether')
+    chains = list(zip(*accounts_layers))
+    if presign:
+        # nonces of derived accounts are known in advance, so mints are signed before anything is sent
+        with phase('mint'):
+            mint_accounts = [chain[-1] for chain in chains
+                             if journaled is None or f'mint {chain[-1].address}' not in journaled]
+            states = account_states.get_states(mint_accounts, balances=False)
+            for account in mint_accounts:
+                nonce_manager.seed(account.address, states[account.address]['nonce'])
+            prepared = dict(zip([account.address for account in mint_accounts],
+                                prepare_contract_writes(mint_accounts, config.MINT_FUNCTION_NAME, None, mint_price)))
+
+    scheduler = TxScheduler()
+    for chain in chains:
+        keys = chain_step_keys(chain)
+        if chain_fees is None:
+            fund_action = partial(send_chain_funds, master_account, chain[0], mint_price)
+        else:
+            fund_action = partial(send_tx, master_account, chain[0], int(mint_price + chain_fees))
+        step = scheduler.add(keys[0], fund_action, phase_name='fund')
+        for key, account, next_account in zip(keys[1:], chain, chain[1:]):
+            step = scheduler.add(key, partial(send_all, account, next_account), [step], phase_name='mix')
+        mint_account = chain[-1]
+        if presign and mint_account.address in prepared:
+            mint_action = partial(fire_transaction, prepared[mint_account.address])
+        else:
+            mint_action = partial(contract_write, mint_account, config.MINT_FUNCTION_NAME, None, mint_price)
+        step = scheduler.add(keys[len(chain)], mint_action, [step], phase_name='mint')
+        if config.SEND_BACK == True:
+            # remaining funds are sent back also when the mint reverted or failed
+            scheduler.add(keys[-1], partial(send_all, mint_account, master_account), [step],
+                          run_on_revert=True, phase_name='sweep')
+    if journaled is not None:
+        scheduler.restore(journaled)
 
-    send_one_to_many(master_account, accounts_layers[0], int(w3.toWei(MINT_PRICE, 'ether') + total_fees))
+    with phase('wait'):
+        # steps run in their own phases, only waiting for receipts is tagged as 'wait'
+        return scheduler.run()
+
+
+def multi_accounts_mint(master_account, total_fees, presign=False, journaled=None):
+    """Mints the NFT of smart contract defined in settings.py from multiple accounts.
+
+    Every derived account has its own chain of transactions: fund -> mixing hops -> mint -> send back.
+    With journaled (steps from the journal of an interrupted run, see -resume) only unfinished chains
+    are checked, displayed and continued. Returns results of run_accounts_chains().
+    """
+    accounts_layers = get_accounts_layers(master_account, display=journaled is None)
+    if journaled is not None:
+        accounts_layers = drop_finished_chains(accounts_layers, journaled)
+    with phase('simulate'):
+        accounts_layers = drop_reverting_mints(accounts_layers, journaled)
+    results = run_accounts_chains(master_account, accounts_layers, total_fees, presign, journaled)
+    display_receipts({result['tx_hash']: result for result in results.values() if result['tx_hash'] is not None})
+    display_accounts([master_account] + accounts_layers[-1], balances=True)
+    return results
+
+
+def iter_accounts_windows(master_account, window_size=STREAM_WINDOW_SIZE):
+    """Derives accounts of Multi mode as they are needed and yields them as accounts_layers of window_size chains.
+    Accounts of one chain are consecutive derived accounts, so the window doesn't need accounts of later ones.
+    """
+    chain_length = config.EXTRA_MIXING_LAYERS + 1
+    accounts = iter_derived_accounts(master_account, config.NUMBER_OF_MINTS * chain_length, compact=True)
+    while True:
+        window = list(itertools.islice(accounts, window_size * chain_length))
+        if not window:
+            return
+        yield [window[i::chain_length] for i in range(chain_length)]
+
+
+def prepare_windows(master_account, windows_queue, window_size=STREAM_WINDOW_SIZE, journaled=None):
+    """Puts windows of accounts into windows_queue, simulated and with states read, and None after the last one.
+    If preparing a window fails, the exception is put instead of None, so the run fails and can be resumed.
+    The queue is bounded, so only a few windows are prepared ahead of the one which runs.
+    When the run is resumed, chains finished before (see journaled) are dropped and empty windows are skipped.
+    """
+    try:
+        for accounts_layers in iter_accounts_windows(master_account, window_size):
+            if journaled is not None:
+                accounts_layers = drop_finished_chains(accounts_layers, journaled)
+                if not accounts_layers[0]:
+                    continue
+            with phase('simulate'):
+                accounts_layers = drop_reverting_mints(accounts_layers, journaled)
+            with phase('prepare'):
+                account_states.get_states([account for layer in accounts_layers for account in layer])
+            windows_queue.put(accounts_layers)
+    except Exception as e:
+        windows_queue.put(e)
+    else:
+        windows_queue.put(None)
+
+
+def streaming_multi_accounts_mint(master_account, presign=False, window_size=STREAM_WINDOW_SIZE, journaled=None):
+    """Same as multi_accounts_mint, but accounts are derived, funded, minted from and swept in windows
+    of STREAM_WINDOW_SIZE chains, while next windows are prepared in a thread. Accounts are CompactAccount
+    and their states are dropped after their window, so memory doesn't grow with NUMBER_OF_MINTS.
+    Private keys aren't displayed, they can be derived again from PRIVATE_KEY.
+    """
+    windows_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    producer = threading.Thread(target=bind_context(prepare_windows),
+                                args=(master_account, windows_queue, window_size, journaled), daemon=True)
+    producer.start()
+    # mints confirmed before the run was interrupted
+    recorded = {key for key, record in (journaled or {}).items()
+                if key.startswith('mint ') and record['result'] is not None and record['result']['status'] == 1}
+    totals = Counter({'minted': len(recorded)})
+    for window_number in itertools.count(1):
+        accounts_layers = windows_queue.get()
+        if accounts_layers is None:
+            break
+        if isinstance(accounts_layers, Exception):
+            # remaining windows weren't minted, the run isn't finished
+            raise accounts_layers
+        # unlike in multi_accounts_mint, every chain gets only its own fees (total_fees for each of many accounts
+        # wouldn't fit in the balance of master_account), estimated when it's funded, as fees change
+        results = run_accounts_chains(master_account, accounts_layers, presign=presign, journaled=journaled)
+        display_receipts({result['tx_hash']: result for result in results.values() if result['tx_hash'] is not None})
+        minted = sum(result['state'] == CONFIRMED for key, result in results.items() if key.startswith('mint '))
+        totals.update({'windows': 1, 'chains': len(accounts_layers[-1]),
+                       'minted': minted - len(recorded.intersection(results))})
+        info_msg = f'Window {window_number}: minted from {minted}/{len(accounts_layers[-1])} accounts, '\
+                   f'{totals["minted"]}/{config.NUMBER_OF_MINTS} so far'
+        print(info_msg)
+        if config.LOGGING == True:
+            config.logger.info(info_msg)
+        # accounts of finished windows aren't used anymore
+        addresses = [account.address for layer in accounts_layers for account in layer]
+        account_states.evict(addresses)
+        for address in addresses:
+            nonce_manager.reset(address)
+    producer.join()
+
+    info_msg = f'Minted from {totals["minted"]}/{config.NUMBER_OF_MINTS} accounts in {totals["windows"]} windows'
+    print(info_msg)
+    if config.LOGGING == True:
+        config.logger.info(info_msg)
+    display_accounts([master_account], balances=True)
+
+
+def armed_single_account_mint(master_account):
+    """Signs mint transactions of Single mode in advance and fires them when TRIGGER is met.
+    The sale isn't open before that, so mints aren't simulated.
+    """
+    with phase('prepare'):
+        prepared = prepare_single_mints(master_account, simulate=False)
+    with phase('trigger'):
+        wait_for_trigger(TRIGGER, config.WS_PROVIDER)
+    with phase('mint'):
+        tx_hashes = fire_transactions(prepared)
+        display_receipts(wait_for_receipts(tx_hashes))
+    display_accounts([master_account], balances=True)
+
+
+def armed_multi_accounts_mint(master_account, total_fees):
+    """Funds derived accounts (with mixing hops) and signs their mint transactions in advance,
+    fires the mints when TRIGGER is met and then sends the remaining funds back.
+    """
+    accounts_layers = get_accounts_layers(master_account)
+    mint_price = config.w3.toWei(config.MINT_PRICE, 'ether')
+    scheduler = TxScheduler()
+    chains_steps = []
+    for i, account in enumerate(accounts_layers[0]):
+        step = scheduler.add(f'fund {account.id}',
+                             partial(send_tx, master_account, account, int(mint_price + total_fees)),
+                             phase_name='fund')
+        steps = [step]
+        for layer, next_layer in zip(accounts_layers, accounts_layers[1:]):
+            step = scheduler.add(f'hop {layer[i].id} -> {next_layer[i].id}',
+                                 partial(send_all, layer[i], next_layer[i]), [step], phase_name='mix')
+            steps.append(step)
+        chains_steps.append(steps)
+    with phase('wait'):
+        results = scheduler.run()
+    display_receipts({result['tx_hash']: result for result in results.values() if result['tx_hash'] is not None})
+
+    # funds of every chain stay in the account after its last confirmed step, also when a mixing hop failed
+    funded_accounts = []
+    for i, steps in enumerate(chains_steps):
+        confirmed = len(list(itertools.takewhile(lambda step: results[step]['state'] == CONFIRMED, steps)))
+        if confirmed:
+            funded_accounts.append(accounts_layers[confirmed - 1][i])
+    # only accounts whose funds arrived can mint
+    mint_accounts = [accounts_layers[-1][i] for i, steps in enumerate(chains_steps)
+                     if results[steps[-1]]['state'] == CONFIRMED]
+    fired = False
+    try:
+        with phase('prepare'):
+            states = account_states.get_states(mint_accounts, balances=False)
+            for account in mint_accounts:
+                nonce_manager.seed(account.address, states[account.address]['nonce'])
+            prepared = prepare_contract_writes(mint_accounts, config.MINT_FUNCTION_NAME, None, mint_price)
+        with phase('trigger'):
+            wait_for_trigger(TRIGGER, config.WS_PROVIDER)
+        with phase('mint'):
+            fired = True
+            tx_hashes = fire_transactions(prepared)
+            display_receipts(wait_for_receipts(tx_hashes))
+        display_accounts([master_account] + mint_accounts, balances=True)
+    finally:
+        # accounts are already funded, so their funds are sent back also when waiting or minting failed
+        if not fired:
+            # nonces of mints which were signed but never fired are free again
+            for account in mint_accounts:
+                nonce_manager.reset(account.address)
+        if config.SEND_BACK == True:
+            with phase('sweep'):
+                send_many_to_one(funded_accounts, master_account)
+            display_accounts([master_account] + funded_accounts, balances=True)
+
+
+async def async_multi_accounts_mint(master_account, total_fees, presign=False):
+    """Same as multi_accounts_mint, but transactions of all accounts in a layer are sent concurrently.
+    """
+    accounts_layers = get_accounts_layers(master_account)
+    with phase('simulate'):
+        accounts_layers = drop_reverting_mints(accounts_layers)
+
+    with phase('fund'):
+        await async_send_one_to_many(master_account, accounts_layers[0],
+                                     int(config.w3.toWei(config.MINT_PRICE, 'ether') + total_fees))
     display_accounts([master_account] + accounts_layers[0], balances=True)
 
-    if EXTRA_MIXING_LAYERS > 0:
-        for i in range(EXTRA_MIXING_LAYERS):
-            send_many_to_many(accounts_layers[i], accounts_layers[i + 1])
+    if config.EXTRA_MIXING_LAYERS > 0:
+        for i in range(config.EXTRA_MIXING_LAYERS):
+            with phase('mix'):
+                await async_send_many_to_many(accounts_layers[i], accounts_layers[i + 1])
             display_accounts(accounts_layers[i] + accounts_layers[i + 1], balances=True)
 
-    for account in accounts_layers[-1]:
-        last_tx_hash = contract_write(account, MINT_FUNCTION_NAME, None, w3.toWei(MINT_PRICE, 'ether'))
-
-    w3.eth.wait_for_transaction_receipt(last_tx_hash, timeout=10)
+    with phase('mint'):
+        if presign:
+            # signing in processes and batched broadcast are blocking, so they run in a thread
+            tx_hashes = await asyncio.get_running_loop().run_in_executor(None, bind_context(presigned_mint),
+                                                                         accounts_layers[-1])
+            await async_wait_for_receipts(tx_hashes)
+        else:
+            await async_contract_write_from_many(accounts_layers[-1], config.MINT_FUNCTION_NAME, None,
+                                                 config.w3.toWei(config.MINT_PRICE, 'ether'))
     display_accounts([master_account] + accounts_layers[-1], balances=True)
 
-    if SEND_BACK == True:
-        send_many_to_one(accounts_layers[-1], master_account)
+    if config.SEND_BACK == True:
+        with phase('sweep'):
+            await async_send_many_to_one(accounts_layers[-1], master_account)
         display_accounts([master_account] + accounts_layers[-1], balances=True)
 
 
+def get_run_plan(master_account, mode, presign):
+    """Returns settings deciding which steps the run of Multi mode has, they are recorded in the journal
+    and have to be the same when the run is resumed. mode is 'multi' or 'stream', which put different
+    derived accounts in each chain when EXTRA_MIXING_LAYERS > 0.
+    """
+    return {'master': master_account.address, 'chain': config.CHAIN_NAME, 'contract': config.CONTRACT_ADDRESS,
+            'function': config.MINT_FUNCTION_NAME, 'number_of_mints': config.NUMBER_OF_MINTS,
+            'mint_price': config.MINT_PRICE, 'extra_mixing_layers': config.EXTRA_MIXING_LAYERS,
+            'send_back': config.SEND_BACK, 'mode': mode, 'presign': presign}
+
+
+def prepare_job(job):
+    """Estimates fees of the job and reads the balance of its master account, runs in the context of the job.
+    """
+    job['master_account'] = get_master_account(default=True)
+    with phase('estimate'):
+        if job['mode'] == 'multi':
+            job['total_fees'] = estimate_multi_mint_fees() * FEES_MULT_FACTOR
+        else:
+            job['total_fees'] = estimate_single_account_mint_fees()
+    job['required_balance'] = config.w3.toWei(config.MINT_PRICE, 'ether') * config.NUMBER_OF_MINTS + job['total_fees']
+    job['balance'] = account_states.get_balance(job['master_account'])
+
+
+# Multi mode jobs of the same master account would use the same derived accounts, so they run one after another
+multi_job_locks = {}
+multi_job_locks_lock = threading.Lock()
+
+
+def run_job(job, presign=False):
+    """Runs Single or Multi mode of the job, runs in the context of the job. Returns its results.
+    """
+    if job['mode'] != 'multi':
+        return single_account_mint(job['master_account'], presign)
+    with multi_job_locks_lock:
+        lock = multi_job_locks.setdefault(job['master_account'].address, threading.Lock())
+    with lock:
+        return multi_accounts_mint(job['master_account'], job['total_fees'], presign)
+
+
+def run_jobs(jobs, presign=False):
+    """Runs jobs concurrently, each in a thread with its own config. Jobs share provider connections, ABIs
+    and contract objects, and jobs on the same chain share gas oracle, nonces and states of accounts.
+    """
+    def run_in_thread(job):
+        try:
+            job['context'].run(run_job, job, presign)
+            job['result'] = 'finished'
+        except Exception as e:
+            print(e)
+            job['result'] = f'failed: {e}'
+
+    threads = [threading.Thread(target=run_in_thread, args=(job,)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def jobs_mint(jobs_path, presign=False):
+    """Runs jobs from jobs_path (see load_jobs() in settings.py) in one process, after displaying them
+    and asking for confirmation.
+    """
+    jobs = load_jobs(jobs_path)
+    for job in jobs:
+        job['context'] = contextvars.copy_context()
+        job['context'].run(current_config.set, job['config'])
+        job['context'].run(prepare_job, job)
+
+    # jobs of the same master account on the same chain are paid from the same balance
+    required_balances = Counter()
+    for job in jobs:
+        required_balances[(job['config'].CHAIN_ID, job['master_account'].address)] += job['required_balance']
+
+    print('======================= NFT-MINTER =======================')
+    print(f'[Jobs mode] {jobs_path}')
+    for job in jobs:
+        job_config = job['config']
+        print(f'- {job["name"]}: {job["mode"]} | {job_config.CHAIN_NAME} | {job_config.CONTRACT_ADDRESS} | '
+              f'{job_config.MINT_FUNCTION_NAME} x {job_config.NUMBER_OF_MINTS} | '
+              f'master_account {job["master_account"].address} | balance: {job["balance"] / 10 ** 18} | '
+              f'estimated required balance: {job["required_balance"] / 10 ** 18}')
+    print(f'- PRESIGN: {presign}')
+    for job in jobs:
+        key = (job['config'].CHAIN_ID, job['master_account'].address)
+        if job['balance'] < required_balances[key]:
+            raise Exception(f'Too low balance on master_acount {key[1]} on {job["config"].CHAIN_NAME} for its jobs. '
+                            f'Balance: {job["balance"]} Estimated required balance: {required_balances[key]}')
+
+    if input('Run? Enter y for yes ') in ['y', 'Y']:
+        print('Running...')
+        if config.LOGGING == True:
+            config.logger.info('======================= NFT-MINTER =======================')
+            config.logger.info(f'[Jobs mode] {jobs_path}')
+            for job in jobs:
+                config.logger.info(f'- {job["name"]}: {job["mode"]} | {job["config"].CHAIN_NAME} | '
+                                   f'{job["config"].CONTRACT_ADDRESS} | {job["config"].MINT_FUNCTION_NAME} x '
+                                   f'{job["config"].NUMBER_OF_MINTS} | master_account {job["master_account"].address}')
+            config.logger.info('Running...')
+        run_jobs(jobs, presign)
+        for job in jobs:
+            info_msg = f'{job["name"]}: {job["result"]}'
+            print(info_msg)
+            if config.LOGGING == True:
+                config.logger.info(info_msg)
+        save_rpc_metrics()
+    else:
+        print('Not executed.')
+
+
+def run_daemon_job(job):
+    """Runs a job submitted to -daemon mode. Nobody confirms it, it only fails when the balance is too low.
+    """
+    prepare_job(job)
+    if job['balance'] < job['required_balance']:
+        raise Exception(f'Too low balance on master_acount {job["master_account"].address}. '
+                        f'Balance: {job["balance"]} Estimated required balance: {job["required_balance"]}')
+    info_msg = f'Running {job["name"]}: {job["mode"]} | {config.CHAIN_NAME} | {config.CONTRACT_ADDRESS} | ' \
+               f'{config.MINT_FUNCTION_NAME} x {config.NUMBER_OF_MINTS} | master_account {job["master_account"].address}'
+    print(info_msg)
+    if config.LOGGING == True:
+        config.logger.info(info_msg)
+    return run_job(job, job['presign'])
+
+
+def daemon_mint():
+    """Warms up everything jobs of the settings from settings.json need (connection, ABI, contract object,
+    gas fees, derived accounts) and serves the API of MintDaemon until it's interrupted.
+    """
+    master_account = get_master_account(default=True)
+    with phase('estimate'):
+        get_contract()
+        gas_oracle.fees()
+        get_derived_accounts(master_account, config.NUMBER_OF_MINTS * (config.EXTRA_MIXING_LAYERS + 1))
+    daemon = MintDaemon(run_daemon_job)
+    print('======================= NFT-MINTER =======================')
+    info_msg = f'[Daemon mode] listening on {daemon.url} | {config.CHAIN_NAME} | master_account {master_account.address}'
+    print(info_msg)
+    if config.LOGGING == True:
+        config.logger.info(info_msg)
+    # the token isn't logged, only whoever started the daemon can submit jobs
+    print(f'Token (send it in header "Authorization: Bearer <token>"): {daemon.token}')
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopped.')
+    finally:
+        daemon.stop()
+        save_rpc_metrics()
+
+
+def inventory_mint(master_account):
+    """Finds tokens of CONTRACT_ADDRESS owned by the master account and accounts derived for Multi mode
+    with current settings, displays them and exports them to INVENTORY_DIR.
+    """
+    accounts = [master_account] + get_derived_accounts(
+        master_account, config.NUMBER_OF_MINTS + config.NUMBER_OF_MINTS * config.EXTRA_MIXING_LAYERS)
+    with phase('inventory'):
+        inventory = get_inventory([account.address for account in accounts])
+    display_inventory(inventory)
+    inventory_path = export_inventory(inventory)
+    info_msg = f'Inventory saved in {inventory_path}.json and {inventory_path}.csv'
+    print(info_msg)
+    if config.LOGGING == True:
+        config.logger.info(info_msg)
+    return inventory
+
+
+def save_rpc_metrics():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    metrics_path = os.path.join(METRICS_DIR, f'metrics_{time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())}')
+    rpc_metrics.dump_json(metrics_path + '.json')
+    rpc_metrics.dump_prometheus(metrics_path + '.prom')
+    info_msg = f'RPC metrics saved in {metrics_path}.json and {metrics_path}.prom'
+    print(info_msg)
+    if config.LOGGING == True:
+        config.logger.info(info_msg)
+
+
 if __name__ == '__main__':
     args = vars(parser.parse_args())
+    if args['daemon'] == True:
+        if any(args[name] == True for name in ('single', 'multi', 'newacc', 'presign', 'async_mode', 'armed',
+                                              'stream', 'resume')) or args['jobs'] is not None:
+            print("-daemon doesn't take other arguments, modes of jobs are set in submitted jobs")
+            exit(0)
+        daemon_mint()
+        exit(0)
+    if args['inventory'] == True:
+        if any(args[name] == True for name in ('single', 'multi', 'newacc', 'presign', 'async_mode', 'armed',
+                                              'stream', 'resume')) or args['jobs'] is not None:
+            print("-inventory doesn't take other arguments")
+            exit(0)
+        print('======================= NFT-MINTER =======================')
+        print(f'[Inventory mode] {config.CHAIN_NAME} | {config.CONTRACT_ADDRESS}')
+        inventory_mint(get_master_account(default=True))
+        exit(0)
+    if args['jobs'] is not None:
+        if args['async_mode'] == True or args['armed'] == True or args['stream'] == True or args['resume'] == True:
+            print('-jobs works only with -presign, modes of jobs are set in the jobs file')
+            exit(0)
+        jobs_mint(args['jobs'], args['presign'])
+        exit(0)
+    journal_path, journaled = None, None
+    if args['resume'] == True:
+        if args['multi'] != True or args['async_mode'] == True or args['armed'] == True:
+            print('-resume works only with -multi (also with -stream and -presign)')
+            exit(0)
+        journal_path = find_unfinished_journal()
+        if journal_path is None:
+            print(f'No interrupted run found in {JOURNAL_DIR}/')
+            exit(0)
+        plan, journaled = load_journal(journal_path)
+
     if args['newacc'] == True:
         # default=False in get_master_account also logs and prints the private key
         master_account = get_master_account(default=False)
         exit(0)
     elif args['single'] == True:
-        single_mint_fee = estimate_single_mint_fee()
-        total_fees = single_mint_fee * NUMBER_OF_MINTS
-        required_balance = w3.toWei(MINT_PRICE, 'ether') * NUMBER_OF_MINTS + total_fees
+        with phase('estimate'):
+            # in -armed mode the sale isn't open yet and the mint can't be estimated, its gas limit is used instead
+            total_fees = estimate_single_account_mint_fees(
+                CONTRACT_FUNCTION_GAS * gas_oracle.fees()['maxFeePerGas'] if args['armed'] == True else None)
+        required_balance = config.w3.toWei(config.MINT_PRICE, 'ether') * config.NUMBER_OF_MINTS + total_fees
+    elif args['multi'] == True and journaled is not None:
+        # the funds are already sent to derived accounts, chains which aren't funded yet get the same amount
+        total_fees = plan['total_fees']
+        required_balance = 0
     elif args['multi'] == True:
-        total_fees = estimate_multi_mint_fees() * FEES_MULT_FACTOR
-        required_balance = w3.toWei(MINT_PRICE, 'ether') * NUMBER_OF_MINTS + total_fees
+        with phase('estimate'):
+            total_fees = estimate_multi_mint_fees(0 if args['armed'] == True else None) * FEES_MULT_FACTOR
+        required_balance = config.w3.toWei(config.MINT_PRICE, 'ether') * config.NUMBER_OF_MINTS + total_fees
     else:
         parser.print_help()
         exit(0)
 
     master_account = get_master_account(default=True)
-    master_account_balance = master_account.get_balance()
+    if journaled is not None:
+        run_plan = get_run_plan(master_account, 'stream' if args['stream'] else 'multi', args['presign'])
+        differing = plan_differences(plan, run_plan)
+        if differing:
+            raise Exception(f'Settings differ from the interrupted run in {journal_path}: {", ".join(differing)}')
+    master_account_balance = account_states.get_balance(master_account)
     print('======================= NFT-MINTER =======================')
     print(f'[{"Single" if args["single"] == True else "Multi"} mode]')
     print('Settings:')
-    print(f'- CHAIN_NAME: {CHAIN_NAME}')
-    print(f'- CONTRACT_ADDRESS: {CONTRACT_ADDRESS}')
-    print(f'- MINT_FUNCTION_NAME: {MINT_FUNCTION_NAME}')
-    print(f'- MINT_PRICE: {MINT_PRICE}')
-    print(f'- NUMBER_OF_MINTS: {NUMBER_OF_MINTS}')
-    print(f'- EXTRA_MIXING_LAYERS: {EXTRA_MIXING_LAYERS}') if args['multi'] == True else None
-    print(f'- SEND_BACK: {SEND_BACK}') if args['multi'] == True else None
-    print(f'- LOGGING: {LOGGING}')
-    print(f'Using master_account {master_account.address} | balance: {w3.fromWei(master_account_balance, "ether")}')
-    print(f'Estimated required balance: {w3.fromWei(required_balance, "ether")}')
-    print(f'Estimated total transaction fees, not including mint prices: {w3.fromWei(total_fees, "ether")}')
+    print(f'- CHAIN_NAME: {config.CHAIN_NAME}')
+    print(f'- CONTRACT_ADDRESS: {config.CONTRACT_ADDRESS}')
+    print(f'- MINT_FUNCTION_NAME: {config.MINT_FUNCTION_NAME}')
+    print(f'- MINT_PRICE: {config.MINT_PRICE}')
+    print(f'- NUMBER_OF_MINTS: {config.NUMBER_OF_MINTS}')
+    print(f'- EXTRA_MIXING_LAYERS: {config.EXTRA_MIXING_LAYERS}') if args['multi'] == True else None
+    print(f'- SEND_BACK: {config.SEND_BACK}') if args['multi'] == True else None
+    print(f'- PRESIGN: {args["presign"]}')
+    print(f'- ASYNC: {args["async_mode"]}') if args['multi'] == True else None
+    print(f'- ARMED: {args["armed"]}')
+    print(f'- STREAM: {args["stream"]}') if args['multi'] == True else None
+    print(f'- RESUME: {journal_path} ({len(journaled)} steps recorded)') if journaled is not None else None
+    print(f'- LOGGING: {config.LOGGING}')
+    print(f'Using master_account {master_account.address} | balance: {config.w3.fromWei(master_account_balance, "ether")}')
+    print(f'Estimated required balance: {config.w3.fromWei(required_balance, "ether")}')
+    print(f'Estimated total transaction fees, not including mint prices: {config.w3.fromWei(total_fees, "ether")}')
     if master_account_balance < required_balance:
         raise Exception(f'Too low balance on master_acount. Balance: {master_account.get_balance()}'
                         f'Estimated required balance: {required_balance}')
 
     if input('Run? Enter y for yes ') in ['y', 'Y']:
         print('Running...')
-        logger.info('======================= NFT-MINTER =======================')
-        logger.info(f'[{"Single" if args["single"] == True else "Multi"} mode]')
-        logger.info('Settings:')
-        logger.info(f'- CHAIN_NAME: {CHAIN_NAME}')
-        logger.info(f'- CONTRACT_ADDRESS: {CONTRACT_ADDRESS}')
-        logger.info(f'- MINT_FUNCTION_NAME: {MINT_FUNCTION_NAME}')
-        logger.info(f'- MINT_PRICE: {MINT_PRICE}')
-        logger.info(f'- NUMBER_OF_MINTS: {NUMBER_OF_MINTS}')
-        logger.info(f'- EXTRA_MIXING_LAYERS: {EXTRA_MIXING_LAYERS}') if args['multi'] == True else None
-        logger.info(f'- SEND_BACK: {SEND_BACK}') if args['multi'] == True else None
-        logger.info(f'- LOGGING: {LOGGING}')
-        logger.info(f'Using master_account {master_account.address} | balance: {w3.fromWei(master_account_balance, "ether")}')
-        logger.info(f'Estimated required balance: {w3.fromWei(required_balance, "ether")}')
-        logger.info(f'Estimated total transaction fees, not including mint prices: {w3.fromWei(total_fees, "ether")}')
-        logger.info('Running...')
-
-        if args['single'] == True:
-            single_account_mint(master_account)
+        config.logger.info('======================= NFT-MINTER =======================')
+        config.logger.info(f'[{"Single" if args["single"] == True else "Multi"} mode]')
+        config.logger.info('Settings:')
+        config.logger.info(f'- CHAIN_NAME: {config.CHAIN_NAME}')
+        config.logger.info(f'- CONTRACT_ADDRESS: {config.CONTRACT_ADDRESS}')
+        config.logger.info(f'- MINT_FUNCTION_NAME: {config.MINT_FUNCTION_NAME}')
+        config.logger.info(f'- MINT_PRICE: {config.MINT_PRICE}')
+        config.logger.info(f'- NUMBER_OF_MINTS: {config.NUMBER_OF_MINTS}')
+        config.logger.info(f'- EXTRA_MIXING_LAYERS: {config.EXTRA_MIXING_LAYERS}') if args['multi'] == True else None
+        config.logger.info(f'- SEND_BACK: {config.SEND_BACK}') if args['multi'] == True else None
+        config.logger.info(f'- PRESIGN: {args["presign"]}')
+        config.logger.info(f'- ASYNC: {args["async_mode"]}') if args['multi'] == True else None
+        config.logger.info(f'- ARMED: {args["armed"]}')
+        config.logger.info(f'- STREAM: {args["stream"]}') if args['multi'] == True else None
+        config.logger.info(f'- RESUME: {journal_path} ({len(journaled)} steps recorded)') if journaled is not None else None
+        config.logger.info(f'- LOGGING: {config.LOGGING}')
+        config.logger.info(f'Using master_account {master_account.address} | balance: {config.w3.fromWei(master_account_balance, "ether")}')
+        config.logger.info(f'Estimated required balance: {config.w3.fromWei(required_balance, "ether")}')
+        config.logger.info(f'Estimated total transaction fees, not including mint prices: {config.w3.fromWei(total_fees, "ether")}')
+        config.logger.info('Running...')
+
+        if args['multi'] == True and args['async_mode'] != True and args['armed'] != True:
+            # these runs can be resumed from the journal
+            if journaled is None:
+                run_journal.start({**get_run_plan(master_account, 'stream' if args['stream'] else 'multi',
+                                                  args['presign']), 'total_fees': total_fees})
+            else:
+                run_journal.reopen(journal_path)
+        if args['single'] == True and args['armed'] == True:
+            armed_single_account_mint(master_account)
+        elif args['single'] == True:
+            single_account_mint(master_account, args['presign'])
+        elif args['multi'] == True and args['armed'] == True:
+            armed_multi_accounts_mint(master_account, total_fees)
+        elif args['multi'] == True and args['stream'] == True:
+            streaming_multi_accounts_mint(master_account, args['presign'], journaled=journaled)
+        elif args['multi'] == True and args['async_mode'] == True:
+            asyncio.run(async_multi_accounts_mint(master_account, total_fees, args['presign']))
         elif args['multi'] == True:
-            multi_accounts_mint(master_account, total_fees)
+            multi_accounts_mint(master_account, total_fees, args['presign'], journaled)
+        run_journal.finish()
+        save_rpc_metrics()
     else:
         print('Not executed.')
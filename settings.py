@@ -2,31 +2,22 @@
 For common uses editing settings.json should be enough.
 """
 import json
-import logging
+import threading
 import time
 import argparse
+import contextvars
 
-from web3 import Web3
-from requests import get
-
-
-with open('settings.json') as f:
-    SETTINGS = json.load(f)
-    CHAIN_NAME = SETTINGS['CHAIN_NAME']
-    CONTRACT_ADDRESS = SETTINGS['CONTRACT_ADDRESS']
-    MINT_FUNCTION_NAME = SETTINGS['MINT_FUNCTION_NAME']
-    NUMBER_OF_MINTS = SETTINGS['NUMBER_OF_MINTS']
-    MINT_PRICE = SETTINGS['MINT_PRICE']
-    EXTRA_MIXING_LAYERS = SETTINGS['EXTRA_MIXING_LAYERS']
-    LOGGING = SETTINGS['LOGGING']
-    SEND_BACK = SETTINGS['SEND_BACK']
+from functools import cached_property
+from typing import Callable, Dict, List
 
+from web3 import Web3
+from web3.eth import AsyncEth
 
-with open('secrets.json') as f:
-    SECRETS = json.load(f)
-    PRIVATE_KEY = SECRETS['PRIVATE_KEY']
-    PROVIDER = SECRETS['PROVIDER']
-    w3 = Web3(Web3.HTTPProvider(PROVIDER))
+from src.abi_cache import load_contract_abi
+from src.logs import EventLogger, start_logging
+from src.metrics import metrics_middleware
+from src.providers import ProviderPool, PoolProvider, LimitedAsyncHTTPProvider
+from src.ratelimit import RateLimiter
 
 
 # =========================================
@@ -48,42 +39,381 @@ DEFAULT_GAS = 21000
 # Try increasing it if encountering 'exceeds block gas limit' error.
 CONTRACT_FUNCTION_GAS = 500000
 
-# Dict with supported chains
-CHAINS = {'Ethereum': {'ID': 1,
-                       'API': f'https://api.etherscan.io/api?module=contract&action=getabi&address={CONTRACT_ADDRESS}'},
-          'Ropsten':  {'ID': 3,
-                       'API': f'https://api-ropsten.etherscan.io/api?module=contract&action=getabi&address={CONTRACT_ADDRESS}'},
-          'Rinkeby':  {'ID': 4,
-                       'API': f'https://api-rinkeby.etherscan.io/api?module=contract&action=getabi&address={CONTRACT_ADDRESS}'},
-          'Kovan':    {'ID': 42,
-                       'API': f'https://api-kovan.etherscan.io/api?module=contract&action=getabi&address={CONTRACT_ADDRESS}'},
-          'Polygon':  {'ID': 137,
-                       'API': f'https://api.polygonscan.com/api?module=contract&action=getabi&address={CONTRACT_ADDRESS}'},
-          'Mumbai':   {'ID': 80001,
-                       'API': f'https://api-testnet.polygonscan.com/api?module=contract&action=getabi&address={CONTRACT_ADDRESS}'}
+# Maximum number of accounts sending transactions at the same time in -async mode.
+# Lower it if the provider starts rejecting requests (e.g. HTTP 429 Too Many Requests).
+ASYNC_CONCURRENCY = 50
+
+# Maximum number of requests sent in one JSON-RPC batch, e.g. when reading balances and nonces of many accounts.
+# Providers limit the size of a batch, lower it if requests are rejected.
+RPC_BATCH_SIZE = 100
+
+# In -single mode, when the mint function has a version taking the number of tokens (e.g. mint(uint256 _mintAmount)),
+# many tokens are minted in one transaction instead of one transaction per token. Arguments with names from
+# QUANTITY_ARGUMENT_NAMES (compared in lowercase, without underscores) are taken as the number of tokens.
+# One transaction mints at most MAX_MINTS_PER_TX tokens, or less if the contract has a lower limit
+# readable with one of MAX_PER_TX_FUNCTIONS. Gas limit of such transaction is its estimate * BATCH_MINT_GAS_MARGIN.
+# If it can't be estimated (e.g. the sale isn't open yet), it's CONTRACT_FUNCTION_GAS for the first token
+# and BATCH_MINT_GAS_PER_TOKEN for every next one, but never above the gas limit of the latest block.
+QUANTITY_ARGUMENT_NAMES = ('quantity', 'amount', 'mintamount', 'count', 'numberoftokens', 'numtokens', 'num', 'qty')
+MAX_PER_TX_FUNCTIONS = ('maxMintAmountPerTx', 'maxMintAmount', 'maxMintPerTx', 'maxPerTx', 'MAX_PER_TX',
+                        'MAX_MINT_PER_TX')
+MAX_MINTS_PER_TX = 20
+BATCH_MINT_GAS_MARGIN = 1.2
+BATCH_MINT_GAS_PER_TOKEN = 60000
+
+# Before mint transactions are signed, each of them is simulated with eth_call from its sender with its value,
+# in JSON-RPC batches against the pending block. Transactions which would revert aren't sent (in -multi mode
+# their accounts aren't even funded), reasons of reverts are logged. Derived accounts have no funds before funding,
+# so their balances are set in the simulation with eth_call state override. False disables simulation.
+SIMULATE_MINTS = True
+
+# In -armed mode everything is prepared in advance (accounts funded, mint transactions signed) and the mint
+# transactions are fired when TRIGGER is met, checked on every new block:
+# {'block': 25000000} - fired after the previous block, so they can be included in this one
+# {'timestamp': 1650000000} - fired when the next block is expected to have at least this timestamp
+# {'function': 'saleActive'} - fired when the contract function returns True, e.g. when the sale opens,
+# value and arguments can be given too, e.g. {'function': 'saleState', 'args': [], 'value': 2}
+# New blocks come from newHeads subscription if WS_PROVIDER (e.g. "wss://...") is in secrets.json,
+# otherwise the provider is polled every TRIGGER_POLL_INTERVAL seconds.
+TRIGGER = {'function': 'saleActive'}
+TRIGGER_POLL_INTERVAL = 0.1
+
+# Fees of all transactions come from the gas oracle in src/gas.py, based on the last GAS_HISTORY_BLOCKS blocks.
+# GAS_STRATEGY is one of 'slow', 'normal', 'fast' - the higher, the faster transactions are included.
+GAS_STRATEGY = 'normal'
+GAS_HISTORY_BLOCKS = 10
+
+# In -presign mode transactions are signed before broadcasting. When there are at least PRESIGN_POOL_THRESHOLD
+# of them, they are signed in PRESIGN_PROCESSES processes (None means one per CPU core).
+# Signed transactions are then broadcast in JSON-RPC batches from FIRE_THREADS threads at the same time.
+PRESIGN_POOL_THRESHOLD = 200
+PRESIGN_PROCESSES = None
+FIRE_THREADS = 4
+
+# Transactions not included within REPLACE_AFTER_BLOCKS blocks are replaced - signed again with the same nonce
+# and fees raised by FEE_BUMP_PERCENT (nodes require at least 10%), or to the current 'fast' fees if they are higher.
+# maxFeePerGas is never raised above MAX_FEE_PER_GAS_CAP gwei. REPLACE_AFTER_BLOCKS = None disables replacements.
+REPLACE_AFTER_BLOCKS = 3
+FEE_BUMP_PERCENT = 12.5
+MAX_FEE_PER_GAS_CAP = 500
+
+# Balances and nonces of accounts are read once and then updated locally from receipts of sent transactions.
+# Cached states older than STATE_RECONCILE_INTERVAL seconds are read from the chain again when they are used,
+# in case something else changed them (e.g. incoming transfers). None means that they are never read again.
+STATE_RECONCILE_INTERVAL = 60
+
+# Transactions are tracked by reading every new block, RECEIPT_POLL_INTERVAL seconds apart.
+# Transactions not mined within RECEIPT_TIMEOUT seconds are reported as not mined.
+RECEIPT_POLL_INTERVAL = 1
+RECEIPT_TIMEOUT = 120
+
+# In -multi mode steps of different accounts which become ready at the same time
+# are sent from SCHEDULER_THREADS threads.
+SCHEDULER_THREADS = 8
+
+# In -stream mode accounts of -multi mode are derived and processed in windows of STREAM_WINDOW_SIZE chains
+# (fund -> mixing hops -> mint -> send back), so memory doesn't grow with NUMBER_OF_MINTS.
+# Up to STREAM_QUEUE_SIZE next windows are prepared (derived and simulated) while the current one runs.
+# Every chain is funded with its fees estimated when it's funded times STREAM_FEES_MARGIN,
+# as fees can rise before its mint is sent. The remaining funds are sent back at the end of the chain.
+STREAM_WINDOW_SIZE = 500
+STREAM_QUEUE_SIZE = 2
+STREAM_FEES_MARGIN = 3
+
+# -multi runs (also with -stream) record their plan, every sent transaction and results of finished steps
+# in an append-only journal in this directory. An interrupted run is continued with -resume: only transactions
+# without a recorded result are checked on the chain and the run goes on from the first unfinished step.
+JOURNAL_DIR = '.journal'
+
+# -daemon mode serves the control API on this address, only local clients should reach it.
+# Up to DAEMON_MAX_JOBS submitted jobs run at the same time, the others wait in the queue.
+# Only DAEMON_MAX_FINISHED_JOBS last finished jobs (with their results) are kept.
+# Submitted jobs can set only DAEMON_JOB_KEYS, secrets always come from secrets.json.
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = 8765
+DAEMON_MAX_JOBS = 4
+DAEMON_MAX_FINISHED_JOBS = 100
+DAEMON_JOB_KEYS = ('NAME', 'MODE', 'PRESIGN', 'CHAIN_NAME', 'CONTRACT_ADDRESS', 'MINT_FUNCTION_NAME', 'NUMBER_OF_MINTS',
+                   'MINT_PRICE', 'EXTRA_MIXING_LAYERS', 'SEND_BACK', 'LOGGING')
+
+# -inventory mode finds tokens of CONTRACT_ADDRESS owned by the master and derived accounts from Transfer events.
+# eth_getLogs queries cover at most INVENTORY_BLOCK_RANGE blocks and INVENTORY_TOPICS_CHUNK addresses,
+# a query rejected by the provider (too many blocks or results) is split in halves. INVENTORY_THREADS queries run
+# at the same time. Scanning starts at INVENTORY_START_BLOCK, None means the block where the contract was deployed.
+# Blocks scanned up to INVENTORY_CONFIRMATIONS blocks before the latest one are cached in INVENTORY_CACHE_DIR,
+# so later scans read only new blocks. When eth_getLogs isn't available, tokens are read with batched balanceOf
+# and tokenOfOwnerByIndex calls. The token map is exported as JSON and CSV to INVENTORY_DIR.
+INVENTORY_BLOCK_RANGE = 2000
+INVENTORY_TOPICS_CHUNK = 100
+INVENTORY_THREADS = 8
+INVENTORY_START_BLOCK = None
+INVENTORY_CONFIRMATIONS = 12
+INVENTORY_CACHE_DIR = '.inventory_cache'
+INVENTORY_DIR = 'logs'
+
+# Addresses of derived accounts are kept in this directory, so later runs don't derive them again.
+# Only addresses are stored there, private keys are always derived from PRIVATE_KEY.
+# Accounts are derived in chunks of DERIVE_CHUNK_SIZE. When at least DERIVE_POOL_THRESHOLD addresses have to be
+# derived, it's done in DERIVE_PROCESSES processes (None means one per CPU core).
+ACCOUNTS_CACHE_DIR = '.accounts_cache'
+DERIVE_CHUNK_SIZE = 1000
+DERIVE_POOL_THRESHOLD = 500
+DERIVE_PROCESSES = None
+
+# PROVIDER in secrets.json can be a list of endpoints. Reads are spread across them, an endpoint which fails
+# or rate limits is skipped for PROVIDER_COOLDOWN seconds, and transactions are broadcast to all of them.
+# Every endpoint keeps up to PROVIDER_POOL_MAXSIZE open connections.
+# With HEDGE_DELAY (in seconds) set, reads of HEDGED_METHODS are also sent to the next endpoint
+# if the first one doesn't answer within HEDGE_DELAY, and the first response is used. None disables it.
+PROVIDER_POOL_MAXSIZE = 50
+PROVIDER_COOLDOWN = 30
+HEDGE_DELAY = None
+HEDGED_METHODS = ('eth_blockNumber', 'eth_getBlockByNumber', 'eth_getTransactionReceipt', 'eth_getTransactionCount',
+                  'eth_getBalance', 'eth_feeHistory', 'eth_call')
+
+# Every request takes RPC_METHOD_COSTS compute units (DEFAULT_RPC_COST for other methods) from a bucket refilled
+# with RATE_LIMIT units per second - set it to the quota of your provider plan, None means no limit.
+# Number of requests in flight adapts to the provider: it grows up to MAX_IN_FLIGHT while requests succeed,
+# and halves (with the rate) when the provider rate limits (HTTP 429 or rate limit error).
+# Rate limited requests are repeated up to RATE_LIMIT_RETRIES times instead of failing.
+RATE_LIMIT = None
+MAX_IN_FLIGHT = 50
+RATE_LIMIT_RETRIES = 5
+DEFAULT_RPC_COST = 10
+RPC_METHOD_COSTS = {'eth_sendRawTransaction': 250, 'eth_estimateGas': 87, 'eth_call': 26,
+                    'eth_getTransactionCount': 26, 'eth_getBalance': 19, 'eth_getBlockByNumber': 16,
+                    'eth_getTransactionReceipt': 15, 'eth_getTransactionByHash': 17, 'eth_getLogs': 75,
+                    'eth_getCode': 26, 'eth_feeHistory': 10, 'eth_blockNumber': 10, 'eth_chainId': 0}
+
+# Log records are written by a background thread, so sending transactions never waits for console or disk.
+# Besides the text log, every transaction is recorded as a JSON line (event, phase, account id, nonce, hash,
+# duration of signing and sending) in logs/log_<time>.jsonl. With LOGGING the console shows a summary
+# of sent transactions at most every LOG_PROGRESS_INTERVAL seconds instead of a line per transaction.
+LOG_PROGRESS_INTERVAL = 2
+
+# Summaries of RPC calls (counts, errors and latency histograms per method and phase) are saved
+# in this directory at the end of minter.py run, as JSON and in Prometheus text format.
+METRICS_DIR = 'logs'
+
+# Downloaded contract ABIs are kept in this directory, so later runs don't need to fetch them.
+# ABI_CACHE_TTL is the maximum age of cached ABI in seconds, None means that it never expires.
+ABI_CACHE_DIR = '.abi_cache'
+ABI_CACHE_TTL = None
+
+# Dict with supported chains, {address} in API is replaced with CONTRACT_ADDRESS
+# BLOCK_TIME is average time between blocks in seconds, fee quotes are cached for this long
+CHAINS = {'Ethereum': {'ID': 1, 'BLOCK_TIME': 12,
+                       'API': 'https://api.etherscan.io/api?module=contract&action=getabi&address={address}'},
+          'Ropsten':  {'ID': 3, 'BLOCK_TIME': 12,
+                       'API': 'https://api-ropsten.etherscan.io/api?module=contract&action=getabi&address={address}'},
+          'Rinkeby':  {'ID': 4, 'BLOCK_TIME': 15,
+                       'API': 'https://api-rinkeby.etherscan.io/api?module=contract&action=getabi&address={address}'},
+          'Kovan':    {'ID': 42, 'BLOCK_TIME': 4,
+                       'API': 'https://api-kovan.etherscan.io/api?module=contract&action=getabi&address={address}'},
+          'Polygon':  {'ID': 137, 'BLOCK_TIME': 2,
+                       'API': 'https://api.polygonscan.com/api?module=contract&action=getabi&address={address}'},
+          'Mumbai':   {'ID': 80001, 'BLOCK_TIME': 2,
+                       'API': 'https://api-testnet.polygonscan.com/api?module=contract&action=getabi&address={address}'}
           }
 
-CHAIN_ID = CHAINS[CHAIN_NAME]['ID']
 
-CONTRACT_ABI = get(CHAINS[CHAIN_NAME]['API'], timeout=20).json()['result']
+# Keys of a job in -jobs file which replace values from secrets.json, other keys replace values from settings.json
+SECRET_KEYS = ('PRIVATE_KEY', 'PROVIDER', 'WS_PROVIDER')
+
+# Connections, rate limiters and ABIs shared by all Config objects (jobs) using the same endpoints or contract
+_shared_resources: Dict[tuple, object] = {}
+_shared_lock = threading.RLock()
+
+
+def _shared(key: tuple, factory: Callable[[], object]) -> object:
+    with _shared_lock:
+        if key not in _shared_resources:
+            _shared_resources[key] = factory()
+        return _shared_resources[key]
+
+
+class Config:
+    """Settings from settings.json and secrets.json, overrides replace some of them (e.g. for one job of -jobs mode).
+
+    Connection to the provider, contract ABI and logger are created when they are used for the first time,
+    so modes which don't need them (e.g. -newacc) start instantly and work offline. Connections and ABIs
+    are shared with other Config objects using the same endpoints or contract.
+    """
+    def __init__(self,
+                 settings_path: str = 'settings.json',
+                 secrets_path: str = 'secrets.json',
+                 overrides: dict = None):
+        overrides = overrides or {}
+        with open(settings_path) as f:
+            SETTINGS = {**json.load(f), **{key: value for key, value in overrides.items() if key not in SECRET_KEYS}}
+            self.CHAIN_NAME = SETTINGS['CHAIN_NAME']
+            self.CONTRACT_ADDRESS = SETTINGS['CONTRACT_ADDRESS']
+            self.MINT_FUNCTION_NAME = SETTINGS['MINT_FUNCTION_NAME']
+            self.NUMBER_OF_MINTS = SETTINGS['NUMBER_OF_MINTS']
+            self.MINT_PRICE = SETTINGS['MINT_PRICE']
+            self.EXTRA_MIXING_LAYERS = SETTINGS['EXTRA_MIXING_LAYERS']
+            self.LOGGING = SETTINGS['LOGGING']
+            self.SEND_BACK = SETTINGS['SEND_BACK']
+        self.CHAIN_ID = CHAINS[self.CHAIN_NAME]['ID']
+        self.secrets_path = secrets_path
+        self.secret_overrides = {key: value for key, value in overrides.items() if key in SECRET_KEYS}
+
+    @cached_property
+    def SECRETS(self) -> dict:
+        with open(self.secrets_path) as f:
+            return {**json.load(f), **self.secret_overrides}
+
+    @property
+    def PRIVATE_KEY(self) -> str:
+        return self.SECRETS['PRIVATE_KEY']
+
+    @property
+    def PROVIDERS(self) -> list:
+        providers = self.SECRETS['PROVIDER']
+        return providers if isinstance(providers, list) else [providers]
+
+    @property
+    def PROVIDER(self) -> str:
+        return self.PROVIDERS[0]
+
+    @property
+    def WS_PROVIDER(self) -> str:
+        # optional, used only for newHeads subscription in -armed mode
+        return self.SECRETS.get('WS_PROVIDER')
+
+    @cached_property
+    def rate_limiter(self) -> RateLimiter:
+        # shared by sync and async requests, and by jobs using the same endpoints, as they share the quota
+        return _shared(('rate_limiter', tuple(self.PROVIDERS)),
+                       lambda: RateLimiter(RATE_LIMIT, MAX_IN_FLIGHT, RPC_METHOD_COSTS, DEFAULT_RPC_COST))
+
+    @cached_property
+    def provider_pool(self) -> ProviderPool:
+        return _shared(('provider_pool', tuple(self.PROVIDERS)),
+                       lambda: ProviderPool(self.PROVIDERS, PROVIDER_POOL_MAXSIZE, PROVIDER_COOLDOWN, HEDGE_DELAY,
+                                            limiter=self.rate_limiter, retries=RATE_LIMIT_RETRIES))
+
+    @cached_property
+    def w3(self) -> Web3:
+        def create_w3():
+            w3 = Web3(PoolProvider(self.provider_pool, HEDGED_METHODS))
+            # innermost layer, so it measures only the request to the provider
+            w3.middleware_onion.inject(metrics_middleware, 'metrics', layer=0)
+            return w3
+        return _shared(('w3', tuple(self.PROVIDERS)), create_w3)
+
+    @cached_property
+    def async_w3(self) -> Web3:
+        # used only in -async mode, async web3.py supports a subset of methods and no middlewares,
+        # it uses only the first endpoint
+        return Web3(LimitedAsyncHTTPProvider(self.PROVIDER, self.rate_limiter, RATE_LIMIT_RETRIES),
+                    modules={'eth': (AsyncEth,)}, middlewares=[])
+
+    @cached_property
+    def CONTRACT_ABI(self) -> list:
+        api_url = CHAINS[self.CHAIN_NAME]['API'].format(address=self.CONTRACT_ADDRESS)
+        contract_abi = _shared(('abi', self.CHAIN_ID, self.CONTRACT_ADDRESS.lower()),
+                               lambda: load_contract_abi(api_url, self.CHAIN_ID, self.CONTRACT_ADDRESS,
+                                                         ABI_CACHE_DIR, ABI_CACHE_TTL))
+        if not any(d.get('name') == self.MINT_FUNCTION_NAME for d in contract_abi):
+            raise Exception(f'Function "{self.MINT_FUNCTION_NAME}" not found in CONTRACT_ABI')
+        return contract_abi
+
+    @cached_property
+    def logger(self) -> EventLogger:
+        if self.LOGGING is not True:
+            return None
+        # one pipeline for the whole process, also for jobs with their own configs
+        LOG_PATH = f'logs/log_{time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())}'  # or time.gmttime()
+        return _shared(('logger',), lambda: start_logging(LOG_PATH, LOG_PROGRESS_INTERVAL))
+
+
+current_config = contextvars.ContextVar('config')
+
+
+class ConfigProxy:
+    """Forwards attributes to Config of the current job (set in current_config), by default to the one
+    from settings.json. Threads and executors don't inherit it, functions run in them are wrapped with bind_context().
+
+    Examples:
+    >>> current_config.set(Config(overrides={'CHAIN_NAME': 'Polygon'}))
+    >>> config.CHAIN_ID
+    137
+    """
+    def __init__(self, default: Config):
+        object.__setattr__(self, 'default', default)
+
+    def current(self) -> Config:
+        return current_config.get(self.default)
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.current(), name, value)
+
+
+config = ConfigProxy(Config())
+
+
+def bind_context(func: Callable) -> Callable:
+    """Returns func running in a copy of the caller's context variables (e.g. current_config and phase),
+    for functions which run in other threads.
+
+    Examples:
+    >>> list(executor.map(bind_context(send), keys))
+    """
+    context = contextvars.copy_context()
+    # one context can't be entered by many threads at once, so every call gets its own copy
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+class PerChain:
+    """Holds one instance of factory() for every chain and forwards attributes to the one of the current chain,
+    e.g. gas_oracle = PerChain(GasOracle). Jobs on the same chain share it, e.g. nonces of the same account.
+    """
+    def __init__(self, factory: Callable[[], object]):
+        self._factory = factory
+        self._instances: Dict[int, object] = {}
+        self._lock = threading.Lock()
+
+    def current(self) -> object:
+        chain_id = config.CHAIN_ID
+        instance = self._instances.get(chain_id)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.setdefault(chain_id, self._factory())
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+
+def load_jobs(path: str) -> List[Dict]:
+    """Reads jobs of -jobs mode from JSON file - a list of objects with optional NAME, MODE ('single' or 'multi')
+    and any keys of settings.json or secrets.json, which replace their values for the job.
+
+    Examples:
+    >>> jobs = load_jobs('jobs.json')
+    >>> jobs[0]
+    {'name': 'job 1', 'mode': 'multi', 'config': <settings.Config object at 0x...>}
+    """
+    with open(path) as f:
+        jobs = json.load(f)
+    return [make_job(job, f'job {i}') for i, job in enumerate(jobs, 1)]
+
+
+def make_job(job: Dict, default_name: str) -> Dict:
+    """Makes a job from an object of the jobs file or a job submitted to -daemon (see load_jobs()).
+    """
+    job = dict(job)
+    return {'name': job.pop('NAME', default_name), 'mode': job.pop('MODE', 'single'), 'config': Config(overrides=job)}
 
-if CONTRACT_ABI == 'Contract source code not verified':
-    raise Exception(f'Contract source code not verified ({CHAINS[CHAIN_NAME]["API"]})')
 
-if not any(d.get('name') == MINT_FUNCTION_NAME for d in json.loads(CONTRACT_ABI)):
-    raise Exception(f'Function "{MINT_FUNCTION_NAME}" not found in CONTRACT_ABI')
+def __getattr__(name):
+    # settings used to be module level variables, this keeps e.g. `from settings import w3` working
+    return getattr(config, name)
 
-if LOGGING is True:
-    LOG_FILENAME = f'logs/log_{time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())}.txt'  # or time.gmttime()
-    file_handler = logging.FileHandler(filename=LOG_FILENAME, delay=True)
-    logging.basicConfig(level=logging.INFO,  # DEBUG is the lowest - the most information
-                        handlers=[file_handler],
-                        format="%(asctime)s [%(levelname)s] %(message)s",
-                        datefmt='%Y-%m-%d %H:%M:%S')
-    # logging.Formatter.converter = time.gmtime  # set to make logs timestamps in gmt (UTC+0)
-    logger = logging.getLogger(__name__)
-else:
-    logger = None
 
 parser = argparse.ArgumentParser(allow_abbrev=False,
                                  description='This program allows you to mint NFTs in a batch from single or multiple addresses. ')
@@ -99,3 +429,23 @@ mut_ex_group.add_argument("-multi", action='store_true', default=False, required
                           help='- Multi mode - uses master account to derive more accounts and mint using them')
 mut_ex_group.add_argument("-newacc", action='store_true', default=False, required=False,
                           help='- New account mode - generates a new account, displays keys and quits the program')
+parser.add_argument("-presign", action='store_true', default=False, required=False,
+                    help='- Presign mode - signs all mint transactions first and then broadcasts them at once')
+parser.add_argument("-async", dest='async_mode', action='store_true', default=False, required=False,
+                    help='- Async mode - only with -multi, sends transactions of all accounts in a layer concurrently')
+parser.add_argument("-armed", action='store_true', default=False, required=False,
+                    help='- Armed mode - prepares everything in advance and fires mint transactions when TRIGGER '
+                         'from settings.py is met')
+parser.add_argument("-stream", action='store_true', default=False, required=False,
+                    help='- Stream mode - only with -multi, processes accounts in windows of STREAM_WINDOW_SIZE, '
+                         'for very large NUMBER_OF_MINTS')
+parser.add_argument("-resume", action='store_true', default=False, required=False,
+                    help='- Resume mode - only with -multi, continues the last interrupted run from its journal')
+parser.add_argument("-jobs", metavar='JOBS_FILE', default=None, required=False,
+                    help='- Jobs mode - runs jobs from JOBS_FILE (e.g. other contracts or chains) concurrently')
+parser.add_argument("-inventory", action='store_true', default=False, required=False,
+                    help='- Inventory mode - finds tokens of CONTRACT_ADDRESS owned by the master and derived accounts '
+                         'and exports them to INVENTORY_DIR')
+parser.add_argument("-daemon", action='store_true', default=False, required=False,
+                    help='- Daemon mode - keeps connections and accounts warm and runs jobs submitted to the HTTP API '
+                         'on DAEMON_HOST:DAEMON_PORT')
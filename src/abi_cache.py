@@ -0,0 +1,55 @@
+"""This file contains local cache of contract ABIs downloaded from blockchain explorers,
+so the ABI is fetched only once per contract instead of on every run.
+It doesn't import settings.py, because settings.py uses it.
+"""
+
+import json
+import os
+import time
+
+from hashlib import sha256
+
+from requests import get
+
+
+def abi_cache_path(cache_dir: str, chain_id: int, contract_address: str) -> str:
+    """The file name is a hash of chain ID and contract address, so it's the same for any address casing.
+    """
+    key = sha256(f'{chain_id}:{contract_address.lower()}'.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f'{key}.json')
+
+
+def load_contract_abi(api_url: str,
+                      chain_id: int,
+                      contract_address: str,
+                      cache_dir: str,
+                      ttl: float = None) -> list:
+    """Returns parsed ABI from the cache, or downloads it from api_url and saves it in the cache.
+    Cached ABI older than ttl seconds is downloaded again, ttl=None means that it never expires.
+
+    Examples:
+    >>> load_contract_abi(CHAINS['Mumbai']['API'].format(address=address), 80001, address, '.abi_cache')
+    """
+    path = abi_cache_path(cache_dir, chain_id, contract_address)
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if ttl is None or time.time() - cached['fetched_at'] < ttl:
+            return cached['abi']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    contract_abi = get(api_url, timeout=20).json()['result']
+    if contract_abi == 'Contract source code not verified':
+        raise Exception(f'Contract source code not verified ({api_url})')
+    contract_abi = json.loads(contract_abi)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # written to temporary file first, so a crash never leaves broken cache file
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({'chain_id': chain_id,
+                   'address': contract_address,
+                   'fetched_at': time.time(),
+                   'abi': contract_abi}, f)
+    os.replace(f'{path}.tmp', path)
+    return contract_abi
@@ -1,18 +1,27 @@
 """This file contains functions for creating, derivating and displaying accounts,
-and it introduces new AccountExt class to add custom methods to Account from web3.py.
+and it introduces new AccountExt class to add custom methods to Account from web3.py,
+and CompactAccount holding only the key and the address, for streaming very large numbers of accounts.
 """
 
 import itertools
+import os
 import secrets
+import threading
 
+from concurrent.futures import ProcessPoolExecutor
 from hashlib import sha256
-from typing import Generator, List
+from typing import Dict, Generator, Iterator, List
 
 from eth_account import Account
 from eth_account.signers.local import LocalAccount
+from eth_keys import keys
+from eth_utils import to_checksum_address
 from eth_utils.curried import combomethod
+from hexbytes import HexBytes
 
-from settings import w3, PRIVATE_KEY, logger, LOGGING
+from src.rpc import batch_request
+from src.state import account_states
+from settings import config, ACCOUNTS_CACHE_DIR, DERIVE_CHUNK_SIZE, DERIVE_POOL_THRESHOLD, DERIVE_PROCESSES
 
 
 class LocalAccountExt(LocalAccount):
@@ -20,22 +29,74 @@ class LocalAccountExt(LocalAccount):
     """
     iter_id = itertools.count()
 
-    def __init__(self, *args):
+    def __init__(self, key, account, address: str = None):
         self.id = next(self.iter_id)
-        super().__init__(*args)
+        if address is None:
+            super().__init__(key, account)
+        else:
+            # the address is already known, so the public key isn't computed until the key object is needed
+            self._publicapi = account
+            self._address = address
+            self._private_key = HexBytes(key)
+            self._key = None
+
+    @property
+    def _key_obj(self):
+        if self._key is None:
+            self._key = keys.PrivateKey(self._private_key)
+        return self._key
+
+    @_key_obj.setter
+    def _key_obj(self, key):
+        self._key = key
 
     def get_balance(self):
-        return w3.eth.get_balance(self.address)
+        return config.w3.eth.get_balance(self.address)
 
     def get_nonce(self):
-        return w3.eth.get_transaction_count(self.address)
+        return config.w3.eth.get_transaction_count(self.address)
+
+
+class CompactAccount:
+    """Derived account with raw 32-byte key and 20-byte address in __slots__, without key objects of eth_account.
+    It has the attributes of LocalAccountExt used to send transactions, so it can be used in their place.
+
+    Examples:
+    >>> account = CompactAccount(bytes.fromhex(private_key), bytes.fromhex(address[2:]))
+    """
+    __slots__ = ('id', '_key', '_address')
+
+    def __init__(self, key: bytes, address: bytes):
+        self.id = next(LocalAccountExt.iter_id)
+        self._key = key
+        self._address = address
+
+    @property
+    def address(self) -> str:
+        return to_checksum_address(self._address)
+
+    @property
+    def key(self) -> HexBytes:
+        return HexBytes(self._key)
+
+    privateKey = key
+
+    def get_balance(self):
+        return config.w3.eth.get_balance(self.address)
+
+    def get_nonce(self):
+        return config.w3.eth.get_transaction_count(self.address)
 
 
 class AccountExt(Account):
     """Subclassed eth_account.Account to add custom methods.
     """
     @combomethod
-    def from_key(self, private_key):
+    def from_key(self, private_key, address: str = None):
+        """With address of the key given, creating the account doesn't compute its public key.
+        """
+        if address is not None:
+            return LocalAccountExt(private_key, self, address)
         key = self._parsePrivateKey(private_key)
         return LocalAccountExt(key, self)
 
@@ -46,7 +107,7 @@ def get_master_account(default: bool = True) -> AccountExt:
     >>> master_account = get_master_account(False)  # generates new account and saves the private key in logs
     """
     if default:
-        account = AccountExt.from_key(PRIVATE_KEY)
+        account = AccountExt.from_key(config.PRIVATE_KEY)
     else:
         temp_private_key = '0x' + secrets.token_hex(32)
         account = AccountExt.from_key(temp_private_key)
@@ -54,52 +115,223 @@ def get_master_account(default: bool = True) -> AccountExt:
         print("Generated new master account! Save the private key!")
         print(f"PRIVATE_KEY: {temp_private_key}")
         print(f"Address: {AccountExt.from_key(temp_private_key).address}")
-        if LOGGING == True:
-            logger.warning("[New account mode]")
-            logger.warning("Generated new master account! Save the private key!")
-            logger.warning(f"PRIVATE KEY: {temp_private_key}")
-            logger.warning(f"Address: {AccountExt.from_key(temp_private_key).address}")
+        if config.LOGGING == True:
+            config.logger.warning("[New account mode]")
+            config.logger.warning("Generated new master account! Save the private key!")
+            config.logger.warning(f"PRIVATE KEY: {temp_private_key}")
+            config.logger.warning(f"Address: {AccountExt.from_key(temp_private_key).address}")
     return account
 
 
-def create_account_generator(master_account: AccountExt) -> Generator[AccountExt, None, None]:
-    """Examples:
-    >>> account_gen = create_account_generator(master_account)
+def create_private_key_generator(master_account: AccountExt) -> Generator[str, None, None]:
+    """Private keys of derived accounts, every key is a hash of the previous one.
+    Hashing is cheap, the expensive part is computing the address of the key.
+
+    Examples:
+    >>> private_key_gen = create_private_key_generator(master_account)
     """
     private_key = master_account.privateKey.hex()
     while True:
         private_key = sha256(private_key.encode('utf-8')).hexdigest()
-        account = AccountExt.from_key(private_key)
-        yield account
+        yield private_key
+
+
+def create_account_generator(master_account: AccountExt) -> Generator[AccountExt, None, None]:
+    """Examples:
+    >>> account_gen = create_account_generator(master_account)
+    """
+    for private_key in create_private_key_generator(master_account):
+        yield AccountExt.from_key(private_key)
+
+
+def derive_address(private_key: str) -> str:
+    # module level function, so it can be sent to other processes
+    return keys.PrivateKey(bytes.fromhex(private_key)).public_key.to_checksum_address()
+
+
+def addresses_cache_path(master_address: str) -> str:
+    """The file name is a hash of the master address, one address of derived account per line.
+    """
+    key = sha256(master_address.lower().encode('utf-8')).hexdigest()
+    return os.path.join(ACCOUNTS_CACHE_DIR, f'{key}.txt')
+
+
+def cache_line(private_key: str, address: str) -> str:
+    """The address with a short hash of its private key and the address itself, so every cached address
+    is checked against its key without computing the address again.
+    """
+    check = sha256(f'{private_key}:{address}'.encode('utf-8')).hexdigest()[:16]
+    return f'{address} {check}'
+
+
+def iter_addresses_cache(master_address: str) -> Iterator[str]:
+    """Yields complete lines of the cache one by one (see cache_line()), without reading the whole file at once.
+    """
+    try:
+        f = open(addresses_cache_path(master_address))
+    except OSError:
+        return
+    with f:
+        for line in f:
+            line = line.rstrip('\n')
+            # the last line can be incomplete if the program was interrupted while writing it
+            if len(line) != 59 or not line.startswith('0x'):
+                return
+            yield line
+
+
+def read_addresses_cache(master_address: str) -> List[str]:
+    return [line[:42] for line in iter_addresses_cache(master_address)]
+
+
+def write_addresses_cache(master_address: str, lines: List[str], start: int) -> None:
+    """Appends lines of accounts with index start and next ones to the cache.
+    Nothing is written if the cache doesn't have lines of all accounts before start.
+    """
+    os.makedirs(ACCOUNTS_CACHE_DIR, exist_ok=True)
+    path = addresses_cache_path(master_address)
+    # every complete line has the same size, so the number of addresses is known without reading the file
+    line_size = 59 + len(os.linesep)
+    size = os.path.getsize(path) if os.path.isfile(path) else 0
+    if size != start * line_size:
+        # the file is shorter (e.g. incomplete line) or longer, it's written again from the valid part
+        previous_lines = list(itertools.islice(iter_addresses_cache(master_address), start))
+        if len(previous_lines) < start:
+            return
+        with open(path + '.tmp', 'w') as f:
+            f.write(''.join(f'{line}\n' for line in previous_lines + lines))
+        os.replace(path + '.tmp', path)
+    else:
+        with open(path, 'a') as f:
+            f.write(''.join(f'{line}\n' for line in lines))
+
+
+def iter_derived_accounts(master_account: AccountExt,
+                          number_of_accounts: int = None,
+                          chunk_size: int = DERIVE_CHUNK_SIZE,
+                          compact: bool = False,
+                          start: int = 0) -> Iterator[AccountExt]:
+    """Yields derived accounts one by one from index start, number_of_accounts=None yields them endlessly.
+    Addresses are read from the cache, every one checked against its key (see cache_line()). Missing ones,
+    and those from the first one which doesn't match, are derived in chunks (in a process pool if there are many)
+    and added to the cache. Only one chunk is kept in memory, with compact=True accounts are CompactAccount.
+
+    Examples:
+    >>> for account in iter_derived_accounts(master_account, 10000):
+    ...     print(account.address)
+    """
+    cached_lines = iter_addresses_cache(master_account.address)
+    # keys of skipped accounts are only hashed, their addresses aren't needed
+    private_key_gen = itertools.islice(create_private_key_generator(master_account), start, None)
+    cache_valid = sum(1 for _ in itertools.islice(cached_lines, start)) == start
+    executor = None
+    index = start
+    try:
+        while number_of_accounts is None or index < number_of_accounts:
+            size = chunk_size if number_of_accounts is None else min(chunk_size, number_of_accounts - index)
+            private_keys = list(itertools.islice(private_key_gen, size))
+            addresses = []
+            cached = itertools.islice(cached_lines, size) if cache_valid else []
+            for private_key, line in zip(private_keys, cached):
+                if line != cache_line(private_key, line[:42]):
+                    # e.g. corrupted or stale cache, a wrong address would be funded without its key
+                    info_msg = f"Cached address {line[:42]} doesn't match its key, "\
+                               f"the cache is written again from it"
+                    print(info_msg)
+                    if config.LOGGING == True:
+                        config.logger.warning(info_msg)
+                    cache_valid = False
+                    break
+                addresses.append(line[:42])
+            missing_keys = private_keys[len(addresses):]
+            if missing_keys:
+                if len(missing_keys) >= DERIVE_POOL_THRESHOLD:
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=DERIVE_PROCESSES)
+                    new_addresses = list(executor.map(derive_address, missing_keys, chunksize=64))
+                else:
+                    new_addresses = [derive_address(private_key) for private_key in missing_keys]
+                write_addresses_cache(master_account.address,
+                                      [cache_line(private_key, address)
+                                       for private_key, address in zip(missing_keys, new_addresses)],
+                                      index + len(addresses))
+                addresses = addresses + new_addresses
+            for private_key, address in zip(private_keys, addresses):
+                if compact:
+                    yield CompactAccount(bytes.fromhex(private_key), bytes.fromhex(address[2:]))
+                else:
+                    yield AccountExt.from_key(private_key, address)
+            index += size
+    finally:
+        cached_lines.close()
+        if executor is not None:
+            executor.shutdown()
+
+
+def get_accounts_states(accounts: List[AccountExt],
+                        balances: bool = True,
+                        nonces: bool = True) -> Dict[str, Dict[str, int]]:
+    """Reads balances and nonces of all accounts using JSON-RPC batches instead of request per account.
+
+    Examples:
+    >>> states = get_accounts_states(accounts)
+    >>> states[accounts[0].address]['balance'], states[accounts[0].address]['nonce']
+    """
+    fields = []
+    if balances:
+        fields.append(('balance', 'eth_getBalance', 'latest'))
+    if nonces:
+        # pending nonce is the one to use for the next transaction
+        fields.append(('nonce', 'eth_getTransactionCount', 'pending'))
+    calls = [(method, [account.address, block]) for account in accounts for _, method, block in fields]
+    results = iter(batch_request(calls))
+
+    states = {}
+    for account in accounts:
+        states[account.address] = {field: int(next(results), 16) for field, _, _ in fields}
+    return states
 
 
 def display_accounts(accounts: List[AccountExt],
                      balances: bool = False,
                      secrets: bool = False):
-    """Examples:
+    """Balances come from account_states, so only accounts which aren't cached yet are read from the chain.
+
+    Examples:
     >>> display_accounts([master_account] + accounts, balances=True, secrets=False)
     """
-    if LOGGING == True:
-        for account in accounts:
-            logger.info(f'Address ({account.id}): {account.address}  |  '
-                        f'Balance: {account.get_balance() / 10 ** 18 if balances else "?"}')
-            if secrets:
-                logger.info(f'PRIVATE KEY: {account.privateKey.hex()}')
+    if balances:
+        states = account_states.get_states(accounts, nonces=False)
+    # every line is formatted once, the console gets them in one write and the log through its queue
+    lines = []
     for account in accounts:
-        print(f'Address ({account.id}): {account.address}  |  '
-              f'Balance: {account.get_balance() / 10 ** 18 if balances else "?"}')
+        lines.append(f'Address ({account.id}): {account.address}  |  '
+                     f'Balance: {states[account.address]["balance"] / 10 ** 18 if balances else "?"}')
         if secrets:
-            print(f'PRIVATE KEY: {account.privateKey.hex()}')
-            # print(f'PRIVATE KEY (int): {int(account.privateKey.hex(), 16)}')
+            lines.append(f'PRIVATE KEY: {account.privateKey.hex()}')
+            # lines.append(f'PRIVATE KEY (int): {int(account.privateKey.hex(), 16)}')
+    if config.LOGGING == True:
+        for line in lines:
+            config.logger.info(line)
+    if lines:
+        print('\n'.join(lines))
+
+
+# accounts returned by get_derived_accounts(), master address -> derived accounts in order
+derived_accounts: Dict[str, List[AccountExt]] = {}
+derived_accounts_lock = threading.Lock()
 
 
 def get_derived_accounts(master_account: AccountExt,
-                         number_of_accounts: int):
-    """Examples:
+                         number_of_accounts: int) -> List[AccountExt]:
+    """Derived accounts are kept in memory, so later calls in the same process (e.g. jobs of -daemon mode)
+    only derive accounts which weren't derived yet.
+
+    Examples:
     >>> accounts = get_derived_accounts(default=True, number_of_accounts=10)
     """
-    account_gen = create_account_generator(master_account)
-    derived_accounts = []
-    for _ in range(0, number_of_accounts):
-        derived_accounts.append(next(account_gen))
-    return derived_accounts
+    with derived_accounts_lock:
+        accounts = derived_accounts.setdefault(master_account.address, [])
+        if len(accounts) < number_of_accounts:
+            accounts += iter_derived_accounts(master_account, number_of_accounts, start=len(accounts))
+        return accounts[:number_of_accounts]
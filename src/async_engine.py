@@ -0,0 +1,202 @@
+"""This file contains asynchronous counterparts of functions from splitter.py and interactions.py.
+Transactions of all accounts in a layer are sent concurrently, limited by ASYNC_CONCURRENCY.
+"""
+
+import asyncio
+import time
+
+from typing import Awaitable, Dict, List, Union
+
+from src.accounts import AccountExt
+from src.interactions import build_contract_tx
+from src.splitter import build_tx
+from src.gas import gas_oracle
+from src.journal import run_journal
+from src.nonces import nonce_manager
+from src.receipts import wait_for_receipts, display_receipts
+from src.replacements import tx_replacer
+from src.state import account_states
+from settings import config, bind_context, DEFAULT_GAS, CONTRACT_FUNCTION_GAS, ASYNC_CONCURRENCY
+
+
+async def gather_limited(coroutines: List[Awaitable],
+                         limit: int = ASYNC_CONCURRENCY) -> list:
+    """Runs coroutines concurrently, at most `limit` at the same time.
+    Exceptions are returned in place of results, so one failed transaction doesn't stop the others.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines), return_exceptions=True)
+
+
+async def async_get_balance(account: AccountExt) -> int:
+    return await config.async_w3.eth.get_balance(account.address)
+
+
+async def async_wait_for_receipts(tx_hashes: List[str]) -> Dict[str, Dict]:
+    """Runs the receipt tracker in a thread, so the event loop isn't blocked, and displays failures.
+    """
+    results = await asyncio.get_running_loop().run_in_executor(None, bind_context(wait_for_receipts), tx_hashes)
+    display_receipts(results)
+    return results
+
+
+async def async_send_tx(sender: AccountExt,
+                        receiver: AccountExt,
+                        amount: int,
+                        fees: Dict[str, int] = None,
+                        nonce: int = None,
+                        sweep: bool = False) -> str:
+    """Examples:
+    >>> await async_send_tx(sender_account, receiver_account, int(0.01 * 10 ** 18))
+    """
+    if fees is None:
+        fees = await gas_oracle.async_fees()
+    start = time.perf_counter()
+    managed_nonce = nonce is None
+    if managed_nonce:
+        nonce = await nonce_manager.async_next_nonce(sender.address)
+    try:
+        tx = build_tx(receiver, amount, fees, nonce)
+        signed_tx = config.w3.eth.account.sign_transaction(tx, sender.privateKey.hex())
+        run_journal.sent(sender.address, tx, signed_tx.hash.hex())
+        tx_hash = (await config.async_w3.eth.send_raw_transaction(signed_tx.rawTransaction)).hex()
+    except Exception as e:
+        if managed_nonce:
+            nonce_manager.failed(sender.address, nonce, e)
+        raise
+    tx_replacer.register(sender, tx, tx_hash, sweep)
+    account_states.sent(sender.address, tx, tx_hash)
+
+    if config.LOGGING == True:
+        config.logger.event('send', account=sender.id, address=sender.address, receiver_account=receiver.id,
+                            receiver=receiver.address, amount=int(amount), nonce=nonce, hash=tx_hash,
+                            duration=time.perf_counter() - start)
+    return tx_hash
+
+
+async def async_contract_write(sender: AccountExt,
+                               contract_func_name: str,
+                               contract_func_args: List[Union[str, int]],
+                               amount: int,
+                               gas: int = CONTRACT_FUNCTION_GAS,
+                               nonce: int = None,
+                               ) -> str:
+    """Examples:
+    >>> await async_contract_write(accounts[0], 'mint', None, int(0.1 * 10 ** 18))
+    """
+    # fees are read before the nonce is taken, so a failed request doesn't leave a gap in nonces
+    fees = await gas_oracle.async_fees()
+    start = time.perf_counter()
+    managed_nonce = nonce is None
+    if managed_nonce:
+        nonce = await nonce_manager.async_next_nonce(sender.address)
+    try:
+        # encoding the call doesn't require any request, so the cached sync contract object is used
+        contract_tx = build_contract_tx(contract_func_name, contract_func_args, amount, gas, nonce, fees)
+        signed_tx = config.w3.eth.account.sign_transaction(contract_tx, private_key=sender.privateKey.hex())
+        run_journal.sent(sender.address, contract_tx, signed_tx.hash.hex())
+        tx_hash = (await config.async_w3.eth.send_raw_transaction(signed_tx.rawTransaction)).hex()
+    except Exception as e:
+        if managed_nonce:
+            nonce_manager.failed(sender.address, nonce, e)
+        raise
+    tx_replacer.register(sender, contract_tx, tx_hash)
+    account_states.sent(sender.address, contract_tx, tx_hash)
+
+    if config.LOGGING == True:
+        config.logger.event('contract_write', account=sender.id, address=sender.address, function=contract_func_name,
+                            args=contract_func_args, amount=amount, nonce=nonce, hash=tx_hash,
+                            duration=time.perf_counter() - start)
+    return tx_hash
+
+
+def _successful(results: list) -> List[str]:
+    """Prints exceptions returned by gather_limited and returns the remaining transaction hashes.
+    """
+    tx_hashes = []
+    for result in results:
+        if isinstance(result, Exception):
+            print(result)
+        else:
+            tx_hashes.append(result)
+    return tx_hashes
+
+
+async def async_contract_write_from_many(senders: List[AccountExt],
+                                         contract_func_name: str,
+                                         contract_func_args: List[Union[str, int]],
+                                         amount: int,
+                                         gas: int = CONTRACT_FUNCTION_GAS,
+                                         ) -> List[str]:
+    """Examples:
+    >>> await async_contract_write_from_many(accounts, 'mint', None, w3.toWei(0.1, 'ether'))
+    """
+    results = await gather_limited([async_contract_write(sender, contract_func_name, contract_func_args, amount, gas)
+                                    for sender in senders])
+    tx_hashes = _successful(results)
+    await async_wait_for_receipts(tx_hashes)
+    return tx_hashes
+
+
+async def async_send_one_to_many(master_account: AccountExt,
+                                 accounts: List[AccountExt],
+                                 amount: int) -> List[str]:
+    """Examples:
+    >>> await async_send_one_to_many(master_account, accounts, int(0.01 * 10 ** 18))
+    """
+    # the state of master_account is usually cached already, otherwise it's read in a thread
+    states, fees = await asyncio.gather(
+        asyncio.get_running_loop().run_in_executor(None, bind_context(account_states.get_states), [master_account]),
+        gas_oracle.async_fees())
+    master_account_balance, nonce = states[master_account.address]['balance'], states[master_account.address]['nonce']
+    required_balance_estimation = len(accounts) * (DEFAULT_GAS * fees['maxFeePerGas'] + amount)
+    if master_account_balance < required_balance_estimation:
+        raise Exception(f'Inufficient funds! master_account: '
+                        f'{master_account_balance / 10 ** 18}, required: {required_balance_estimation / 10 ** 18}')
+
+    # nonces are handed out locally, so all transactions from master_account can be broadcast at once
+    nonce_manager.seed(master_account.address, nonce)
+    results = await gather_limited([async_send_tx(master_account, account, amount, fees)
+                                    for account in accounts])
+    tx_hashes = _successful(results)
+    await async_wait_for_receipts(tx_hashes)
+    return tx_hashes
+
+
+async def async_send_many_to_one(accounts: List[AccountExt],
+                                 master_account: AccountExt) -> List[str]:
+    """Examples:
+    >>> await async_send_many_to_one(accounts_part_2, master_account)
+    """
+    return await async_send_many_to_many(accounts, [master_account] * len(accounts))
+
+
+async def async_send_many_to_many(senders_accounts: List[AccountExt],
+                                  receivers_accounts: List[AccountExt]) -> List[str]:
+    """Sends the whole balance of every sender to the corresponding receiver.
+
+    Examples:
+    >>> await async_send_many_to_many(accounts_part_1, accounts_part_2)
+    """
+    if len(senders_accounts) != len(receivers_accounts):
+        raise Exception('Number of senders must be equal to number of receivers')
+    # balances and nonces come from account_states, missing ones are read in JSON-RPC batches in a thread
+    states, fees = await asyncio.gather(
+        asyncio.get_running_loop().run_in_executor(None, bind_context(account_states.get_states), senders_accounts),
+        gas_oracle.async_sweep_fees())
+    tx_fee = DEFAULT_GAS * fees['maxFeePerGas']
+
+    for sender_account in senders_accounts:
+        nonce_manager.seed(sender_account.address, states[sender_account.address]['nonce'])
+    results = await gather_limited([async_send_tx(sender_account, receiver_account,
+                                                  states[sender_account.address]['balance'] - tx_fee,
+                                                  fees, sweep=True)
+                                    for sender_account, receiver_account in zip(senders_accounts, receivers_accounts)])
+    tx_hashes = _successful(results)
+    await async_wait_for_receipts(tx_hashes)
+    return tx_hashes
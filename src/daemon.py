@@ -0,0 +1,213 @@
+"""This file contains the daemon of -daemon mode - a local HTTP server with JSON API to submit jobs (like jobs
+of -jobs mode), follow their progress and read their results. The process keeps provider connections, ABIs,
+contract objects and derived accounts between jobs, so a job doesn't pay any startup cost.
+Jobs spend funds of the master account, so every request needs the token printed when the daemon starts,
+and requests from web pages (with Origin header) are refused.
+"""
+
+import contextvars
+import hmac
+import itertools
+import json
+import secrets
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+from src.metrics import progress_var
+from settings import current_config, make_job, DAEMON_HOST, DAEMON_PORT, DAEMON_MAX_JOBS, DAEMON_MAX_FINISHED_JOBS,\
+    DAEMON_JOB_KEYS, SECRET_KEYS
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+class RequestError(Exception):
+    """Request refused with HTTP status.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class MintDaemon:
+    """Runs jobs submitted to its API with run_job(job), each in the context of its own config.
+    run_job returns results of the job or raises an exception when the job failed.
+    Only DAEMON_MAX_FINISHED_JOBS last finished jobs are kept.
+
+    Every request needs header "Authorization: Bearer <token>" with the token of the daemon (random if not given),
+    requests with Origin header (sent by web browsers) are refused and POST needs Content-Type: application/json.
+    A job can set only DAEMON_JOB_KEYS, never secrets like PRIVATE_KEY or PROVIDER.
+
+    API:
+    - POST /jobs       - submits a job - an object like in the jobs file of -jobs mode (without secrets),
+                         with optional PRESIGN, replies with id of the job
+    - GET /jobs        - states of all jobs
+    - GET /jobs/<id>   - state and progress of the job, with its results when it's finished
+    - GET /health
+
+    Examples:
+    >>> daemon = MintDaemon(run_daemon_job)
+    >>> daemon.serve_forever()
+    $ curl -X POST http://127.0.0.1:8765/jobs -H "Authorization: Bearer $TOKEN" -H 'Content-Type: application/json' \\
+           -d '{"MODE": "multi", "NUMBER_OF_MINTS": 10}'
+    {"id": 1, "name": "job 1", "mode": "multi", "state": "queued", ...}
+    $ curl http://127.0.0.1:8765/jobs/1 -H "Authorization: Bearer $TOKEN"
+    {"id": 1, ..., "state": "running", "progress": {"steps": {"confirmed": 12, "sent": 8, "waiting": 20}}, ...}
+    """
+    def __init__(self,
+                 run_job: Callable[[Dict], Dict],
+                 host: str = DAEMON_HOST,
+                 port: int = DAEMON_PORT,
+                 max_jobs: int = DAEMON_MAX_JOBS,
+                 token: str = None):
+        self.run_job = run_job
+        self.token = token or secrets.token_urlsafe(32)
+        self.jobs: Dict[int, Dict] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs)
+
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def check_request(self):
+                # a web page can send requests to a local server, but browsers always add Origin to them
+                if 'Origin' in self.headers:
+                    raise RequestError(403, 'Requests from web pages are not allowed')
+                if not hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {daemon.token}'):
+                    raise RequestError(401, 'Missing or wrong token in Authorization header')
+
+            def do_GET(self):
+                try:
+                    self.check_request()
+                except RequestError as e:
+                    self.reply(e.status, {'error': str(e)})
+                    return
+                parts = self.path.strip('/').split('/')
+                with daemon._lock:
+                    jobs = dict(daemon.jobs)
+                if parts == ['health']:
+                    self.reply(200, {'status': 'ok', 'jobs': len(jobs)})
+                elif parts == ['jobs']:
+                    self.reply(200, [daemon.describe(job) for job in jobs.values()])
+                elif len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit() and int(parts[1]) in jobs:
+                    self.reply(200, daemon.describe(jobs[int(parts[1])], results=True))
+                else:
+                    self.reply(404, {'error': f'Not found: {self.path}'})
+
+            def do_POST(self):
+                try:
+                    self.check_request()
+                    if self.path.strip('/') != 'jobs':
+                        raise RequestError(404, f'Not found: {self.path}')
+                    # unlike application/json, text/plain can be sent by any web page without asking the server
+                    if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+                        raise RequestError(415, 'Content-Type has to be application/json')
+                    spec = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or '{}')
+                    if not isinstance(spec, dict):
+                        raise Exception('The job has to be a JSON object')
+                    job = daemon.submit(spec)
+                except RequestError as e:
+                    self.reply(e.status, {'error': str(e)})
+                    return
+                except Exception as e:
+                    self.reply(400, {'error': f'{type(e).__name__}: {e}'})
+                    return
+                self.reply(202, daemon.describe(job))
+
+            def reply(self, status, response):
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://{host}:{self.httpd.server_address[1]}'
+
+    def submit(self, spec: Dict) -> Dict:
+        """Queues the job, raises an exception when its settings are invalid (e.g. unknown CHAIN_NAME)
+        or it sets other keys than DAEMON_JOB_KEYS.
+        """
+        secret_keys = [key for key in spec if key in SECRET_KEYS]
+        if secret_keys:
+            raise Exception(f'Jobs can not set secrets: {", ".join(secret_keys)}')
+        unknown_keys = [key for key in spec if key not in DAEMON_JOB_KEYS]
+        if unknown_keys:
+            raise Exception(f'Jobs can set only {", ".join(DAEMON_JOB_KEYS)}, not {", ".join(unknown_keys)}')
+        spec = dict(spec)
+        presign = bool(spec.pop('PRESIGN', False))
+        with self._lock:
+            job_id = next(self._ids)
+        job = make_job(spec, f'job {job_id}')
+        job.update({'id': job_id, 'presign': presign, 'state': QUEUED, 'submitted_at': time.time(),
+                    'started_at': None, 'finished_at': None, 'progress': {}, 'error': None, 'results': None})
+        # a new context, so the job doesn't inherit anything from the thread of the request
+        job['context'] = contextvars.Context()
+        job['context'].run(current_config.set, job['config'])
+        job['context'].run(progress_var.set, job['progress'])
+        with self._lock:
+            self.jobs[job_id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Dict) -> None:
+        job['state'] = RUNNING
+        job['started_at'] = time.time()
+        try:
+            job['results'] = job['context'].run(self.run_job, job)
+            job['state'] = FINISHED
+        except Exception as e:
+            print(e)
+            job['error'] = str(e)
+            job['state'] = FAILED
+        job['finished_at'] = time.time()
+        with self._lock:
+            finished = sorted((other for other in self.jobs.values() if other['state'] in (FINISHED, FAILED)),
+                              key=lambda other: other['finished_at'])
+            # results of old jobs are dropped, so memory of the daemon doesn't grow with every job
+            for old_job in finished[:-DAEMON_MAX_FINISHED_JOBS]:
+                del self.jobs[old_job['id']]
+
+    @staticmethod
+    def describe(job: Dict, results: bool = False) -> Dict:
+        """Returns JSON of the job for the API, results are included only when asked for.
+        """
+        job_config = job['config']
+        description = {'id': job['id'], 'name': job['name'], 'mode': job['mode'], 'presign': job['presign'],
+                       'chain_name': job_config.CHAIN_NAME, 'contract_address': job_config.CONTRACT_ADDRESS,
+                       'mint_function_name': job_config.MINT_FUNCTION_NAME,
+                       'number_of_mints': job_config.NUMBER_OF_MINTS, 'state': job['state'],
+                       'submitted_at': job['submitted_at'], 'started_at': job['started_at'],
+                       'finished_at': job['finished_at'], 'progress': dict(job['progress']), 'error': job['error']}
+        if results:
+            description['results'] = job['results']
+        return description
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def start(self) -> None:
+        """Serves the API in a background thread, e.g. in tests.
+        """
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,100 @@
+"""This file contains the gas oracle, which quotes EIP-1559 fees for all transactions.
+Fees are computed from eth_feeHistory, which is requested at most once per block.
+"""
+
+import statistics
+import threading
+import time
+
+from typing import Dict
+
+from settings import config, CHAINS, GAS_STRATEGY, GAS_HISTORY_BLOCKS, PerChain
+
+
+# Percentile of priority fees paid in recent blocks, used by each strategy
+STRATEGIES = {'slow': 10, 'normal': 50, 'fast': 90}
+
+
+def _to_int(value) -> int:
+    # async web3.py returns raw hex strings
+    return int(value, 16) if isinstance(value, str) else value
+
+
+class GasOracle:
+    """Quotes maxFeePerGas and maxPriorityFeePerGas.
+
+    Fee history is cached for the block time of the chain, so all transactions sent within one block
+    share one request. Chains without eth_feeHistory fall back to eth_gasPrice.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = None
+        self._fetched_at = 0
+
+    def reset(self) -> None:
+        """Drops cached fee history, e.g. after switching the provider.
+        """
+        with self._lock:
+            self._history = None
+
+    def _cache_valid(self) -> bool:
+        return self._history is not None and time.monotonic() - self._fetched_at < CHAINS[config.CHAIN_NAME]['BLOCK_TIME']
+
+    def _store(self, history: Dict) -> None:
+        self._history = history
+        self._fetched_at = time.monotonic()
+
+    def _quote(self, strategy: str) -> Dict[str, int]:
+        history = self._history
+        if 'gasPrice' in history:
+            return {'maxFeePerGas': history['gasPrice'], 'maxPriorityFeePerGas': history['gasPrice']}
+        rewards = [_to_int(block_rewards[list(STRATEGIES).index(strategy)]) for block_rewards in history['reward']]
+        priority_fee = int(statistics.median(rewards)) if rewards else 0
+        # baseFeePerGas has one more item - the base fee of the next block
+        next_base_fee = _to_int(history['baseFeePerGas'][-1])
+        # base fee can grow by 12.5% per block, doubling it keeps the transaction valid for at least 6 full blocks
+        return {'maxFeePerGas': 2 * next_base_fee + priority_fee, 'maxPriorityFeePerGas': priority_fee}
+
+    def fees(self, strategy: str = GAS_STRATEGY) -> Dict[str, int]:
+        """Examples:
+        >>> gas_oracle.fees()
+        {'maxFeePerGas': 3000000032, 'maxPriorityFeePerGas': 1500000000}
+        >>> gas_oracle.fees('fast')
+        """
+        with self._lock:
+            if not self._cache_valid():
+                try:
+                    self._store(config.w3.eth.fee_history(GAS_HISTORY_BLOCKS, 'latest', list(STRATEGIES.values())))
+                except ValueError:
+                    self._store({'gasPrice': config.w3.eth.gas_price})
+            return self._quote(strategy)
+
+    async def async_fees(self, strategy: str = GAS_STRATEGY) -> Dict[str, int]:
+        """Examples:
+        >>> await gas_oracle.async_fees()
+        """
+        if not self._cache_valid():
+            try:
+                history = await config.async_w3.eth.fee_history(GAS_HISTORY_BLOCKS, 'latest',
+                                                                 list(STRATEGIES.values()))
+            except ValueError:
+                history = {'gasPrice': await config.async_w3.eth.gas_price}
+            with self._lock:
+                self._store(history)
+        with self._lock:
+            return self._quote(strategy)
+
+    def sweep_fees(self, strategy: str = GAS_STRATEGY) -> Dict[str, int]:
+        """Fees for transactions sending the whole balance. The priority fee equals maxFeePerGas,
+        so the transaction costs exactly gas * maxFeePerGas (like legacy gasPrice) and nothing is left on the account.
+        """
+        max_fee = self.fees(strategy)['maxFeePerGas']
+        return {'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': max_fee}
+
+    async def async_sweep_fees(self, strategy: str = GAS_STRATEGY) -> Dict[str, int]:
+        max_fee = (await self.async_fees(strategy))['maxFeePerGas']
+        return {'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': max_fee}
+
+
+# one oracle per chain, shared by jobs on the same chain
+gas_oracle = PerChain(GasOracle)
@@ -2,10 +2,74 @@
 reading and writing to the blockchain.
 """
 
-from typing import List, Union
+import time
+
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from web3.contract import Contract
 
 from src.accounts import AccountExt
-from settings import CONTRACT_ADDRESS, CONTRACT_ABI, CHAIN_ID, w3, logger, LOGGING, CONTRACT_FUNCTION_GAS
+from src.gas import gas_oracle
+from src.journal import run_journal
+from src.nonces import nonce_manager
+from src.receipts import wait_for_receipts, display_receipts
+from src.replacements import tx_replacer
+from src.rpc import batch_request
+from src.simulation import is_revert, decode_revert_reason
+from src.state import account_states
+from settings import config, CONTRACT_FUNCTION_GAS, QUANTITY_ARGUMENT_NAMES, MAX_PER_TX_FUNCTIONS, MAX_MINTS_PER_TX,\
+    BATCH_MINT_GAS_MARGIN, BATCH_MINT_GAS_PER_TOKEN, SIMULATE_MINTS
+
+
+# Contract objects and encoded calls are cached, building them parses the whole ABI
+contracts: Dict[Tuple[int, str, int], Tuple[list, Contract]] = {}
+calldata_cache: Dict[Tuple[int, str, str, tuple], str] = {}
+# Estimated gas limits of batched mints, so the estimate of fees and sent transactions use the same ones
+batch_gas_cache: Dict[Tuple[int, str, str, int], int] = {}
+# Functions whose batched mints couldn't be estimated, the failure is displayed only once
+batch_gas_failures: Set[Tuple[int, str, str]] = set()
+
+
+def get_contract(contract_address: str = None,
+                 contract_abi: list = None) -> Contract:
+    """Returns contract object, created only once for every address and ABI.
+    By default the contract from settings.json is used.
+
+    Examples:
+    >>> contract = get_contract()
+    >>> contract.functions.ownerOf(63).call()
+    """
+    contract_address = contract_address or config.CONTRACT_ADDRESS
+    contract_abi = contract_abi or config.CONTRACT_ABI
+    key = (config.CHAIN_ID, contract_address, id(contract_abi))
+    if key not in contracts:
+        # the ABI is kept with the contract, so its id() can't be reused by another list
+        contracts[key] = (contract_abi, config.w3.eth.contract(address=contract_address, abi=contract_abi))
+    return contracts[key][1]
+
+
+def get_calldata(contract_func_name: str,
+                 contract_func_args: List[Union[str, int]] = None,
+                 contract_address: str = None) -> str:
+    """Returns encoded function selector and arguments, i.e. 'data' field of the transaction.
+    The result is cached, so e.g. repeated mint() calls are encoded only once.
+
+    Examples:
+    >>> get_calldata('mint')
+    '0x1249c58b'
+    """
+    contract = get_contract(contract_address)
+    args = tuple(contract_func_args) if contract_func_args else ()
+    key = (config.CHAIN_ID, contract.address, contract_func_name, args)
+    try:
+        return calldata_cache[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable arguments (e.g. arrays) are just encoded every time
+        return contract.encodeABI(fn_name=contract_func_name, args=list(args))
+    calldata_cache[key] = contract.encodeABI(fn_name=contract_func_name, args=list(args))
+    return calldata_cache[key]
 
 
 def contract_read(contract_func_name: str,
@@ -15,21 +79,41 @@ def contract_read(contract_func_name: str,
     >>> contract_read('ownerOf', [63])
     >>> contract_read('tokenOfOwnerByIndex', ['0xDD844943B20B327C5219d6710aDFDa492DAEFE50', 0])
     """
-    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
-    if contract_func_args is None:
-        contract_function = getattr(contract.functions, contract_func_name)()
-    else:
-        contract_function = getattr(contract.functions, contract_func_name)(*contract_func_args)
-    response = contract_function.call()
+    contract_function = get_contract().functions[contract_func_name]
+    response = contract_function(*(contract_func_args or [])).call()
 
-    if LOGGING == True:
+    if config.LOGGING == True:
         info_msg = f'Reading contract "{contract_func_name}({contract_func_args if contract_func_args else ""})". '\
                    f'Value: {response}'
         print(info_msg)
-        logger.info(info_msg)
+        config.logger.info(info_msg)
     return response
 
 
+def build_contract_tx(contract_func_name: str,
+                      contract_func_args: List[Union[str, int]],
+                      amount: int,
+                      gas: int = CONTRACT_FUNCTION_GAS,
+                      nonce: int = None,
+                      fees: Dict[str, int] = None,
+                      ) -> dict:
+    """Returns unsigned transaction calling the contract function, by default with fees from gas_oracle.
+    Only nonce, value and fees change between calls, the rest is cached.
+    """
+    if fees is None:
+        fees = gas_oracle.fees()
+    return {
+        'to': get_contract().address,
+        'data': get_calldata(contract_func_name, contract_func_args),
+        'value': amount,
+        'chainId': config.CHAIN_ID,
+        'gas': gas,  # using CONTRACT_FUNCTION_GAS - choose optimal amount when working with new contract, it varies
+        'maxFeePerGas': fees['maxFeePerGas'],
+        'maxPriorityFeePerGas': fees['maxPriorityFeePerGas'],
+        'nonce': nonce,
+    }
+
+
 def contract_write(sender: AccountExt,
                    contract_func_name: str,
                    contract_func_args: List[Union[str, int]],
@@ -42,32 +126,171 @@ def contract_write(sender: AccountExt,
     >>> contract_write(master_account, 'offerTokenForSale', [63, int(0.2 * 10 ** 18)], 0)
     >>> contract_write(accounts[0], 'buyToken', [63], w3.toWei('0.2', 'ether'))
     """
-    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
-    if contract_func_args is None:
-        contract_function = getattr(contract.functions, contract_func_name)()
-    else:
-        contract_function = getattr(contract.functions, contract_func_name)(*contract_func_args)
+    start = time.perf_counter()
+    managed_nonce = nonce is None
+    if managed_nonce:
+        nonce = nonce_manager.next_nonce(sender.address)
+    try:
+        contract_tx = build_contract_tx(contract_func_name, contract_func_args, amount, gas, nonce)
+        signed_tx = config.w3.eth.account.sign_transaction(contract_tx, private_key=sender.privateKey.hex())
+        run_journal.sent(sender.address, contract_tx, signed_tx.hash.hex())
+        tx_hash = config.w3.eth.send_raw_transaction(signed_tx.rawTransaction).hex()
+    except Exception as e:
+        if managed_nonce:
+            nonce_manager.failed(sender.address, nonce, e)
+        raise
+    tx_replacer.register(sender, contract_tx, tx_hash)
+    account_states.sent(sender.address, contract_tx, tx_hash)
 
-    if nonce is None:
-        nonce = sender.get_nonce()
-    contract_tx = contract_function.buildTransaction({
-        'value': amount,
-        'chainId': CHAIN_ID,
-        'gas': gas,  # using CONTRACT_FUNCTION_GAS - choose optimal amount when working with new contract, it varies
-        'maxFeePerGas': w3.toWei('2', 'gwei'),
-        'maxPriorityFeePerGas': w3.toWei('1', 'gwei'),
-        'nonce': nonce,
-    })
+    if config.LOGGING == True:
+        config.logger.event('contract_write', account=sender.id, address=sender.address, function=contract_func_name,
+                            args=contract_func_args, amount=amount, nonce=nonce, hash=tx_hash,
+                            duration=time.perf_counter() - start)
+    return tx_hash
 
-    signed_tx = w3.eth.account.sign_transaction(contract_tx, private_key=sender.privateKey.hex())
-    tx_hash = w3.eth.send_raw_transaction(signed_tx.rawTransaction).hex()
 
-    if LOGGING == True:
-        info_msg = f'Calling contract function "{contract_func_name}({contract_func_args if contract_func_args else ""})" '\
-                   f'from address ({sender.id}) {sender.address[:6]}... in tx {tx_hash}'
-        print(info_msg)
-        logger.info(info_msg)
-    return tx_hash
+def get_quantity_function(contract_func_name: str,
+                          contract_abi: list = None) -> Optional[Dict]:
+    """Returns ABI of the version of contract function which takes only the number of tokens to mint,
+    None if there isn't one. By default ABI of the contract from settings.json is used.
+
+    Examples:
+    >>> get_quantity_function('mint')
+    {'inputs': [{'internalType': 'uint256', 'name': '_mintAmount', 'type': 'uint256'}], 'name': 'mint', ...}
+    """
+    for item in contract_abi or config.CONTRACT_ABI:
+        if item.get('type') != 'function' or item.get('name') != contract_func_name \
+                or item.get('stateMutability') in ('view', 'pure'):
+            continue
+        inputs = item.get('inputs', [])
+        if len(inputs) == 1 and inputs[0]['type'].startswith('uint') \
+                and inputs[0]['name'].replace('_', '').lower() in QUANTITY_ARGUMENT_NAMES:
+            return item
+    return None
+
+
+def get_max_mints_per_tx() -> int:
+    """Returns MAX_MINTS_PER_TX, or the lower limit of tokens per transaction read from the contract.
+    """
+    view_functions = {item.get('name') for item in config.CONTRACT_ABI
+                      if item.get('type') == 'function' and item.get('stateMutability') in ('view', 'pure')
+                      and not item.get('inputs')}
+    for contract_func_name in MAX_PER_TX_FUNCTIONS:
+        if contract_func_name in view_functions:
+            try:
+                contract_limit = get_contract().functions[contract_func_name]().call()
+            except Exception as e:
+                print(e)
+                continue
+            if isinstance(contract_limit, int) and contract_limit > 0:
+                return min(MAX_MINTS_PER_TX, contract_limit)
+    return MAX_MINTS_PER_TX
+
+
+def estimate_batch_mint_gas(contract_func_name: str,
+                            quantity: int,
+                            amount: int,
+                            sender_address: str = None,
+                            gas: int = CONTRACT_FUNCTION_GAS) -> int:
+    """Returns gas limit of a transaction minting quantity tokens at once, amount is the price of one token.
+    If the estimate fails (e.g. the sale isn't open yet), gas is used for the first token
+    and BATCH_MINT_GAS_PER_TOKEN for every next one, at most the gas limit of the latest block.
+    """
+    key = (config.CHAIN_ID, config.CONTRACT_ADDRESS, contract_func_name, quantity)
+    if key not in batch_gas_cache:
+        contract_tx = {
+            'from': sender_address or '0x000000000000000000000000000000000000dEaD',
+            'to': get_contract().address,
+            'data': get_calldata(contract_func_name, [quantity]),
+            'value': amount * quantity,
+            'chainId': config.CHAIN_ID,
+        }
+        try:
+            batch_gas_cache[key] = int(config.w3.eth.estimate_gas(contract_tx) * BATCH_MINT_GAS_MARGIN)
+        except Exception as e:
+            # the fallback is cached too, so a failing estimate isn't repeated for every transaction
+            batch_gas_cache[key] = min(gas + BATCH_MINT_GAS_PER_TOKEN * (quantity - 1),
+                                       config.w3.eth.get_block('latest')['gasLimit'])
+            if key[:3] not in batch_gas_failures:
+                batch_gas_failures.add(key[:3])
+                info_msg = f'Gas of minting many tokens with "{contract_func_name}" couldn\'t be estimated ({e}), '\
+                           f'using {gas} for the first token and {BATCH_MINT_GAS_PER_TOKEN} for every next one'
+                print(info_msg)
+                if config.LOGGING == True:
+                    config.logger.info(info_msg)
+    return batch_gas_cache[key]
+
+
+def plan_mint_batches(contract_func_name: str,
+                      number_of_mints: int,
+                      amount: int,
+                      gas: int = CONTRACT_FUNCTION_GAS,
+                      sender_address: str = None) -> List[Dict]:
+    """Splits mints into transactions and returns arguments, value and gas limit of every transaction.
+    If the contract function takes the number of tokens, tokens are minted in as few transactions as possible,
+    otherwise every transaction mints one token.
+
+    Examples:
+    >>> plan_mint_batches('mint', 45, w3.toWei(0.1, 'ether'))
+    [{'args': [20], 'amount': 2000000000000000000, 'gas': 160000}, {'args': [20], ...}, {'args': [5], ...}]
+    """
+    if get_quantity_function(contract_func_name) is None:
+        return [{'args': None, 'amount': amount, 'gas': gas} for _ in range(number_of_mints)]
+    max_mints_per_tx = get_max_mints_per_tx()
+    full_batches, rest = divmod(number_of_mints, max_mints_per_tx)
+    quantities = [max_mints_per_tx] * full_batches + ([rest] if rest else [])
+    return [{'args': [quantity],
+             'amount': amount * quantity,
+             'gas': estimate_batch_mint_gas(contract_func_name, quantity, amount, sender_address, gas)}
+            for quantity in quantities]
+
+
+def simulate_contract_writes(writes: List[Dict],
+                             contract_func_name: str,
+                             override_balances: bool = False) -> List[Dict]:
+    """Simulates contract function calls with eth_call from their real senders with their real values,
+    all of them in JSON-RPC batches against the pending block. Every write is a dict with sender, args, amount
+    and gas, like those from plan_mint_batches(). Returns passed and decoded revert reason for every write.
+    With override_balances=True senders get enough balance for the call (eth_call state override),
+    e.g. derived accounts which aren't funded yet.
+    Writes are simulated independently, e.g. two mints of the last token in supply both pass.
+
+    Examples:
+    >>> simulate_contract_writes([{'sender': master_account, 'args': None, 'amount': price, 'gas': 500000}], 'mint')
+    [{'passed': False, 'reason': 'Sale is not active'}]
+    """
+    max_fee = gas_oracle.fees()['maxFeePerGas']
+    calls = []
+    for write in writes:
+        tx = {'from': write['sender'].address,
+              'to': get_contract().address,
+              'data': get_calldata(contract_func_name, write['args']),
+              'value': hex(write['amount']),
+              'gas': hex(write['gas'])}
+        params = [tx, 'pending']
+        if override_balances:
+            params.append({write['sender'].address: {'balance': hex(write['amount'] + write['gas'] * max_fee)}})
+        calls.append(('eth_call', params))
+
+    results = []
+    for write, result in zip(writes, batch_request(calls, raise_errors=False)):
+        if not isinstance(result, ValueError):
+            results.append({'passed': True, 'reason': None})
+            continue
+        error = result.args[0]
+        if not is_revert(error):
+            # e.g. state override not supported by the provider, the transaction is sent as if it passed
+            print(f'Simulation of "{contract_func_name}" from {write["sender"].address[:6]}... failed: {error}')
+            results.append({'passed': True, 'reason': None})
+            continue
+        results.append({'passed': False, 'reason': decode_revert_reason(error, config.CONTRACT_ABI)})
+        if config.LOGGING == True:
+            info_msg = f'Calling contract function "{contract_func_name}({write["args"] if write["args"] else ""})" '\
+                       f'from address ({write["sender"].id}) {write["sender"].address[:6]}... would revert: '\
+                       f'{results[-1]["reason"]}. Not sent'
+            print(info_msg)
+            config.logger.info(info_msg)
+    return results
 
 
 def contract_write_from_one(sender: AccountExt,
@@ -75,16 +298,45 @@ def contract_write_from_one(sender: AccountExt,
                             contract_func_args: List[Union[str, int]],
                             number_of_mints: int,
                             amount: int,
-                            gas: int = CONTRACT_FUNCTION_GAS,
-                            ) -> None:
-    """Examples:
-    >>> contract_write_from_one(master_account, 'mint', None, 10, amount=w3.toWei(0.1, 'ether'))
+                            gas: int = None,
+                            wait: bool = True,
+                            simulate: bool = SIMULATE_MINTS,
+                            batch: bool = False,
+                            ) -> List[str]:
+    """Returns hashes of sent transactions. With wait=True also waits for all of them and displays failures.
+    With batch=True and without contract_func_args, when the function takes the number of tokens,
+    many mints are sent in one transaction. gas is the gas limit of every transaction, by default
+    CONTRACT_FUNCTION_GAS, or the estimate for batched mints. With simulate=True transactions which would revert
+    aren't sent.
+
+    Examples:
+    >>> contract_write_from_one(master_account, 'mint', None, 10, amount=w3.toWei(0.1, 'ether'), batch=True)
     """
-    nonce = sender.get_nonce()
-    for _ in range(number_of_mints):
+    if contract_func_args is None and batch:
+        batches = plan_mint_batches(contract_func_name, number_of_mints, amount, gas or CONTRACT_FUNCTION_GAS,
+                                    sender.address)
+        if gas is not None:
+            batches = [{**planned, 'gas': gas} for planned in batches]
+    else:
+        batches = [{'args': contract_func_args, 'amount': amount, 'gas': gas or CONTRACT_FUNCTION_GAS}
+                   for _ in range(number_of_mints)]
+    if len(batches) < number_of_mints:
+        info_msg = f'Minting {number_of_mints} tokens in {len(batches)} transactions'
+        print(info_msg)
+        if config.LOGGING == True:
+            config.logger.info(info_msg)
+    if simulate and batches:
+        writes = [{'sender': sender, **batch} for batch in batches]
+        simulations = simulate_contract_writes(writes, contract_func_name)
+        batches = [batch for batch, simulation in zip(batches, simulations) if simulation['passed']]
+
+    tx_hashes = []
+    for batch in batches:
         try:
-            last_tx_hash = contract_write(sender, contract_func_name, contract_func_args, amount, gas, nonce)
-            nonce += 1
+            # nonces come from nonce_manager, failed nonce is reused by the next transaction
+            tx_hashes.append(contract_write(sender, contract_func_name, batch['args'], batch['amount'], batch['gas']))
         except Exception as e:
             print(e)
-    w3.eth.wait_for_transaction_receipt(last_tx_hash, timeout=10)
+    if wait:
+        display_receipts(wait_for_receipts(tx_hashes))
+    return tx_hashes
@@ -0,0 +1,234 @@
+"""This file contains the inventory scanner, which finds tokens of the contract owned by given accounts
+(e.g. the master and derived accounts) from ERC-721 Transfer events, and exports them as JSON and CSV.
+Scanned blocks are cached, so later scans read only new blocks. Contracts implementing ERC721Enumerable can be also
+read with batched balanceOf and tokenOfOwnerByIndex calls, when the provider doesn't serve eth_getLogs.
+"""
+
+import csv
+import json
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from typing import Dict, Iterator, List, Tuple
+
+from eth_utils import keccak
+from requests import HTTPError
+
+from src.interactions import get_calldata, get_contract
+from src.rpc import batch_request
+from settings import config, bind_context, INVENTORY_BLOCK_RANGE, INVENTORY_TOPICS_CHUNK, INVENTORY_THREADS,\
+    INVENTORY_START_BLOCK, INVENTORY_CONFIRMATIONS, INVENTORY_CACHE_DIR, INVENTORY_DIR
+
+
+TRANSFER_TOPIC = '0x' + keccak(text='Transfer(address,address,uint256)').hex()
+
+
+def address_topic(address: str) -> str:
+    return '0x' + '00' * 12 + address[2:].lower()
+
+
+def inventory_cache_path(chain_id: int, contract_address: str, cache_dir: str = INVENTORY_CACHE_DIR) -> str:
+    """The file name is a hash of chain ID and contract address, like in src/abi_cache.py.
+    """
+    key = sha256(f'{chain_id}:{contract_address.lower()}'.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f'{key}.json')
+
+
+def find_deployment_block(contract_address: str) -> int:
+    """Returns the first block with code of the contract, found by binary search with eth_getCode.
+    Needs a provider serving old state (archive node), raises ValueError otherwise.
+    """
+    low, high = 0, config.w3.eth.block_number
+    while low < high:
+        middle = (low + high) // 2
+        if config.w3.eth.get_code(contract_address, middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def is_query_rejected(error: Exception) -> bool:
+    # most providers reject too large queries with JSON-RPC error, some with HTTP 413 or 400 (response too large)
+    if isinstance(error, HTTPError):
+        return error.response is not None and error.response.status_code in (400, 413)
+    return isinstance(error, ValueError)
+
+
+def get_logs(log_filter: Dict,
+             from_block: int,
+             to_block: int) -> List[Dict]:
+    """Returns logs of one eth_getLogs query. When the provider rejects it (e.g. too many blocks or results),
+    it's split in halves until it covers one block, then it raises ValueError.
+    """
+    try:
+        return batch_request([('eth_getLogs', [{**log_filter, 'fromBlock': hex(from_block),
+                                                'toBlock': hex(to_block)}])])[0]
+    except (ValueError, HTTPError) as e:
+        if not is_query_rejected(e):
+            raise
+        if from_block >= to_block:
+            if isinstance(e, HTTPError):
+                raise ValueError(f'eth_getLogs rejected: {e}') from e
+            raise
+        middle = (from_block + to_block) // 2
+        return get_logs(log_filter, from_block, middle) + get_logs(log_filter, middle + 1, to_block)
+
+
+def iter_transfer_queries(contract_address: str,
+                          addresses: List[str],
+                          from_block: int,
+                          to_block: int) -> Iterator[Tuple[Dict, int, int]]:
+    """Yields queries of Transfer events from and to addresses, in ranges of INVENTORY_BLOCK_RANGE blocks
+    and chunks of INVENTORY_TOPICS_CHUNK addresses.
+    """
+    for start in range(from_block, to_block + 1, INVENTORY_BLOCK_RANGE):
+        end = min(start + INVENTORY_BLOCK_RANGE - 1, to_block)
+        for i in range(0, len(addresses), INVENTORY_TOPICS_CHUNK):
+            topics = [address_topic(address) for address in addresses[i:i + INVENTORY_TOPICS_CHUNK]]
+            yield {'address': contract_address, 'topics': [TRANSFER_TOPIC, topics]}, start, end
+            yield {'address': contract_address, 'topics': [TRANSFER_TOPIC, None, topics]}, start, end
+
+
+def apply_transfers(tokens: Dict[int, list],
+                    logs: List[Dict],
+                    addresses: set) -> None:
+    """Updates tokens (token ID -> [owner, block number, log index], owner is None when the token left addresses)
+    with Transfer logs. The latest transfer of every token wins, so logs can come in any order and more than once.
+    """
+    for log in logs:
+        # ERC-20 Transfer has the same topic, but its value isn't indexed
+        if len(log['topics']) != 4:
+            continue
+        position = [int(log['blockNumber'], 16), int(log['logIndex'], 16)]
+        token_id = int(log['topics'][3], 16)
+        if token_id in tokens and position < tokens[token_id][1:]:
+            continue
+        receiver = '0x' + log['topics'][2][-40:].lower()
+        tokens[token_id] = [receiver if receiver in addresses else None] + position
+
+
+def scan_inventory(owners: List[str]) -> Dict[str, List[int]]:
+    """Returns IDs of tokens of CONTRACT_ADDRESS owned by every owner, from Transfer events.
+    Only blocks after the cached ones are scanned, except for owners which weren't scanned before.
+
+    Examples:
+    >>> scan_inventory([master_account.address] + [account.address for account in accounts])
+    {'0x3f1c...': [63, 64], '0x912C...': [], ...}
+    """
+    contract_address = get_contract().address
+    path = inventory_cache_path(config.CHAIN_ID, contract_address)
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+        cache['tokens'] = {int(token_id): value for token_id, value in cache['tokens'].items()}
+    except (OSError, ValueError, KeyError):
+        if INVENTORY_START_BLOCK is not None:
+            start_block = INVENTORY_START_BLOCK
+        else:
+            try:
+                start_block = find_deployment_block(contract_address)
+            except ValueError as e:
+                # e.g. the provider doesn't serve old state, eth_getLogs can still work there
+                info_msg = f'Deployment block of the contract not found ({e}), scanning from block 0 '\
+                           f'(set INVENTORY_START_BLOCK in settings.py to skip older blocks)'
+                print(info_msg)
+                if config.LOGGING == True:
+                    config.logger.info(info_msg)
+                start_block = 0
+        cache = {'start_block': start_block, 'block': start_block - 1, 'addresses': [], 'tokens': {}}
+
+    latest_block = config.w3.eth.block_number
+    safe_block = max(latest_block - INVENTORY_CONFIRMATIONS, cache['block'])
+    requested = {owner.lower() for owner in owners}
+    new_addresses = sorted(requested - set(cache['addresses']))
+    addresses = set(cache['addresses']) | requested
+    queries = list(iter_transfer_queries(contract_address, new_addresses, cache['start_block'], cache['block']))
+    queries += iter_transfer_queries(contract_address, sorted(addresses), cache['block'] + 1, latest_block)
+    with ThreadPoolExecutor(max_workers=INVENTORY_THREADS) as executor:
+        logs = [log for query_logs in executor.map(bind_context(lambda query: get_logs(*query)), queries)
+                for log in query_logs]
+
+    # blocks which can still be reorganized are scanned again next time
+    tokens = cache['tokens']
+    apply_transfers(tokens, [log for log in logs if int(log['blockNumber'], 16) <= safe_block], addresses)
+    os.makedirs(INVENTORY_CACHE_DIR, exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({'chain_id': config.CHAIN_ID, 'address': contract_address, 'start_block': cache['start_block'],
+                   'block': safe_block, 'addresses': sorted(addresses), 'tokens': tokens}, f)
+    os.replace(f'{path}.tmp', path)
+    apply_transfers(tokens, [log for log in logs if int(log['blockNumber'], 16) > safe_block], addresses)
+
+    inventory = {owner: [] for owner in owners}
+    checksum_owners = {owner.lower(): owner for owner in owners}
+    for token_id, (owner, _, _) in sorted(tokens.items()):
+        if owner in checksum_owners:
+            inventory[checksum_owners[owner]].append(token_id)
+    return inventory
+
+
+def read_enumerable_inventory(owners: List[str]) -> Dict[str, List[int]]:
+    """Returns IDs of tokens owned by every owner with balanceOf and tokenOfOwnerByIndex calls in JSON-RPC batches,
+    for ERC721Enumerable contracts.
+    """
+    if not any(d.get('name') == 'tokenOfOwnerByIndex' for d in config.CONTRACT_ABI):
+        raise Exception('Contract has no tokenOfOwnerByIndex function, its tokens can be found only from Transfer events')
+    contract_address = get_contract().address
+    balances = batch_request([('eth_call', [{'to': contract_address, 'data': get_calldata('balanceOf', [owner])},
+                                            'latest']) for owner in owners])
+    indexes = [(owner, index) for owner, balance in zip(owners, balances) for index in range(int(balance, 16))]
+    token_ids = batch_request([('eth_call', [{'to': contract_address,
+                                              'data': get_calldata('tokenOfOwnerByIndex', [owner, index])}, 'latest'])
+                               for owner, index in indexes])
+    inventory = {owner: [] for owner in owners}
+    for (owner, _), token_id in zip(indexes, token_ids):
+        inventory[owner].append(int(token_id, 16))
+    return inventory
+
+
+def get_inventory(owners: List[str]) -> Dict[str, List[int]]:
+    """Scans Transfer events, or reads ERC721Enumerable functions when eth_getLogs isn't served by the provider.
+    """
+    try:
+        return scan_inventory(owners)
+    except ValueError as e:
+        info_msg = f'Transfer events could not be scanned ({e}), reading tokenOfOwnerByIndex instead'
+        print(info_msg)
+        if config.LOGGING == True:
+            config.logger.info(info_msg)
+        return read_enumerable_inventory(owners)
+
+
+def display_inventory(inventory: Dict[str, List[int]]) -> None:
+    """Examples:
+    >>> display_inventory(get_inventory([master_account.address]))
+    """
+    for owner, token_ids in inventory.items():
+        info_msg = f'Address: {owner}  |  Tokens: {len(token_ids)} {token_ids if token_ids else ""}'
+        print(info_msg)
+        if config.LOGGING == True:
+            config.logger.info(info_msg)
+    info_msg = f'Total tokens of {config.CONTRACT_ADDRESS}: {sum(len(token_ids) for token_ids in inventory.values())}'
+    print(info_msg)
+    if config.LOGGING == True:
+        config.logger.info(info_msg)
+
+
+def export_inventory(inventory: Dict[str, List[int]],
+                     inventory_dir: str = INVENTORY_DIR) -> str:
+    """Saves token map as JSON (owner -> token IDs) and CSV (owner, token_id rows),
+    returns path of the files without extension.
+    """
+    os.makedirs(inventory_dir, exist_ok=True)
+    path = os.path.join(inventory_dir, f'inventory_{time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())}')
+    with open(path + '.json', 'w') as f:
+        json.dump({'chain_name': config.CHAIN_NAME, 'contract_address': config.CONTRACT_ADDRESS, 'tokens': inventory},
+                  f, indent=4)
+    with open(path + '.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['owner', 'token_id'])
+        for owner, token_ids in inventory.items():
+            writer.writerows([owner, token_id] for token_id in token_ids)
+    return path
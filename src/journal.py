@@ -0,0 +1,165 @@
+"""This file contains the run journal - an append-only JSONL file with the plan of the run, every sent transaction
+(step, sender, nonce, hash, phase), its replacements and results of finished steps.
+Every record is written through at once, so when the program dies, -resume continues the run from the journal.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.metrics import current_phase
+from settings import JOURNAL_DIR
+
+
+current_step_var = contextvars.ContextVar('step', default=None)
+
+
+class RunJournal:
+    """Records the run into JOURNAL_DIR/journal_<time>.jsonl. Nothing is recorded until start() or reopen().
+
+    Examples:
+    >>> run_journal.start({'mode': 'multi', 'number_of_mints': 100})
+    >>> with run_journal.step('fund 0x3f1c...'):
+    ...     tx_hash = send_tx(master_account, account, amount)  # send_tx records the transaction
+    >>> run_journal.done('fund 0x3f1c...', tx_hash, result)
+    >>> run_journal.finish()
+    """
+    def __init__(self, journal_dir: str = JOURNAL_DIR):
+        self.journal_dir = journal_dir
+        self.path = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _write(self, record: Dict) -> None:
+        if self._file is None:
+            return
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def start(self, plan: Dict) -> None:
+        """Creates a new journal, plan holds settings which have to be the same when the run is resumed.
+        """
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.path = os.path.join(self.journal_dir, f'journal_{time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())}.jsonl')
+        self._file = open(self.path, 'a')
+        self._write({'event': 'plan', 'time': time.time(), **plan})
+
+    def reopen(self, path: str) -> None:
+        """Continues the journal of an interrupted run.
+        """
+        self.path = path
+        self._file = open(path, 'a')
+        self._write({'event': 'resume', 'time': time.time()})
+
+    @contextlib.contextmanager
+    def step(self, key: str) -> Iterator[None]:
+        """Transactions sent inside the block (in this thread or task) are recorded as the step key.
+        """
+        token = current_step_var.set(key)
+        try:
+            yield
+        finally:
+            current_step_var.reset(token)
+
+    def sent(self,
+             sender_address: str,
+             tx: dict,
+             tx_hash: str) -> None:
+        """Called with the hash of signed transaction before it's broadcast, so no broadcast transaction is missing
+        in the journal. Whether it really reached the node is checked when the run is resumed.
+        """
+        self._write({'event': 'sent', 'step': current_step_var.get(), 'sender': sender_address, 'nonce': tx['nonce'],
+                     'hash': tx_hash.lower(), 'phase': current_phase()})
+
+    def replaced(self,
+                 tx_hash: str,
+                 replacement_hash: str) -> None:
+        self._write({'event': 'replaced', 'hash': tx_hash.lower(), 'replacement': replacement_hash.lower()})
+
+    def done(self,
+             key: str,
+             tx_hash: str,
+             result: Dict) -> None:
+        """Records the result (status, gasUsed, effectiveGasPrice, blockNumber) of mined transaction of the step.
+        """
+        self._write({'event': 'done', 'step': key, 'hash': tx_hash.lower(), **result})
+
+    def finish(self) -> None:
+        self._write({'event': 'finished', 'time': time.time()})
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+
+
+def find_unfinished_journal(journal_dir: str = JOURNAL_DIR) -> Optional[str]:
+    """Returns path of the journal of the last run, if it wasn't finished.
+    """
+    try:
+        names = sorted(name for name in os.listdir(journal_dir) if name.startswith('journal_'))
+    except OSError:
+        return None
+    if not names:
+        return None
+    path = os.path.join(journal_dir, names[-1])
+    last_record = None
+    for record in _iter_records(path):
+        last_record = record
+    return path if last_record is not None and last_record['event'] != 'finished' else None
+
+
+def _iter_records(path: str) -> Iterator[Dict]:
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # the last line can be incomplete if the program was interrupted while writing it
+                return
+
+
+def load_journal(path: str) -> Tuple[Dict, Dict[str, Dict]]:
+    """Returns the plan of the run and its steps: key -> hash of the last sent transaction, its replacements
+    and result (None if it wasn't recorded as mined).
+
+    Examples:
+    >>> plan, journaled = load_journal(find_unfinished_journal())
+    >>> journaled['mint 0x3f1c...']
+    {'hash': '0x5d2e...', 'replacements': [], 'result': {'status': 1, 'gasUsed': 95432, ...}}
+    """
+    plan = {}
+    steps: Dict[str, Dict] = {}
+    step_of_hash: Dict[str, str] = {}
+    for record in _iter_records(path):
+        event = record['event']
+        if event == 'plan':
+            plan = {key: value for key, value in record.items() if key not in ('event', 'time')}
+        elif event == 'sent' and record['step'] is not None:
+            # a step sent again after resume replaces the previous record
+            steps[record['step']] = {'hash': record['hash'], 'replacements': [], 'result': None}
+            step_of_hash[record['hash']] = record['step']
+        elif event == 'replaced' and record['hash'] in step_of_hash:
+            steps[step_of_hash[record['hash']]]['replacements'].append(record['replacement'])
+        elif event == 'done' and record['step'] in steps:
+            steps[record['step']]['result'] = {key: record[key]
+                                               for key in ('status', 'gasUsed', 'effectiveGasPrice', 'blockNumber')}
+    return plan, steps
+
+
+def plan_differences(plan: Dict, current_plan: Dict) -> List[str]:
+    """Returns keys of settings in which the current run differs from the plan of the interrupted one.
+
+    Examples:
+    >>> plan_differences({'mode': 'stream', 'number_of_mints': 100}, {'mode': 'multi', 'number_of_mints': 100})
+    ['mode']
+    """
+    return [key for key, value in current_plan.items() if plan.get(key) != value]
+
+
+run_journal = RunJournal()
@@ -0,0 +1,138 @@
+"""This file contains the logging pipeline. Threads sending transactions only put log records on a queue,
+a background listener formats them and writes the text log, structured events to a JSON-lines log
+and a throttled summary of sent transactions to the console, so sending never waits for console or disk.
+It doesn't import settings.py, because settings.py creates the logger.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+from collections import Counter
+from typing import Dict
+
+from src.metrics import current_phase
+
+
+# Text of structured events in the text log, made from fields of the event by the listener.
+# ether and gwei are amount and max_fee_per_gas converted from wei
+EVENT_MESSAGES = {
+    'send': 'Sending {ether} from ({account}) {address:.6}... to ({receiver_account}) {receiver:.6}... in {hash}',
+    'contract_write': 'Calling contract function "{function}({args})" from address ({account}) {address:.6}... '
+                      'in tx {hash}',
+    'broadcast': 'Broadcast presigned transaction from address ({account}) {address:.6}... in tx {hash}',
+    'replace': 'Transaction {hash} from ({account}) {address:.6}... with nonce {nonce} replaced by {replacement} '
+               'with maxFeePerGas {gwei} gwei',
+}
+# Events counted as sent transactions in the console summary
+TRANSACTION_EVENTS = ('send', 'contract_write', 'broadcast')
+
+
+class EventLogger(logging.LoggerAdapter):
+    """Logger of Config.logger, info() and warning() work as usual, event() logs a structured record.
+
+    Examples:
+    >>> config.logger.event('send', account=sender.id, address=sender.address, nonce=7, hash=tx_hash, duration=0.012)
+    """
+    def event(self, event: str, **fields) -> None:
+        # the message is made by the listener, here only the record is created
+        self.logger.info(event, extra={'event': event, 'phase': current_phase(), 'fields': fields})
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on the queue as they are, so they are formatted by the listener instead of the sending thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def event_message(event: str, fields: Dict) -> str:
+    values = {**fields, 'args': fields.get('args') or ''}
+    if 'amount' in fields:
+        values['ether'] = fields['amount'] / 10 ** 18
+    if 'max_fee_per_gas' in fields:
+        values['gwei'] = fields['max_fee_per_gas'] / 10 ** 9
+    return EVENT_MESSAGES[event].format(**values)
+
+
+class TextFormatter(logging.Formatter):
+    """Formats structured events with EVENT_MESSAGES, other records as usual.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        if hasattr(record, 'event'):
+            record = logging.makeLogRecord({**record.__dict__, 'msg': event_message(record.event, record.fields),
+                                            'args': None})
+        return super().format(record)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({'time': record.created, 'event': record.event, 'phase': record.phase, **record.fields},
+                          default=str)
+
+
+class ProgressHandler(logging.Handler):
+    """Prints a summary of sent transactions at most every interval seconds, and the last one when it's closed.
+    """
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self.sent = Counter()  # phase -> number of sent transactions
+        self.replaced = 0
+        self.started_at = None
+        self.last_at = None
+        self.printed_at = 0
+        self.pending = False
+
+    def emit(self, record: logging.LogRecord) -> None:
+        event = getattr(record, 'event', None)
+        if event in TRANSACTION_EVENTS:
+            self.sent[record.phase] += 1
+        elif event == 'replace':
+            self.replaced += 1
+        else:
+            return
+        self.started_at = self.started_at or record.created
+        self.last_at = record.created
+        self.pending = True
+        if time.monotonic() - self.printed_at >= self.interval:
+            self.print_summary()
+
+    def print_summary(self) -> None:
+        phases = ', '.join(f'{phase}: {count}' for phase, count in self.sent.items())
+        print(f'Sent {sum(self.sent.values())} transactions in {self.last_at - self.started_at:.1f} s ({phases})'
+              f'{f" | replaced: {self.replaced}" if self.replaced else ""}')
+        self.printed_at = time.monotonic()
+        self.pending = False
+
+    def close(self) -> None:
+        if self.pending:
+            self.print_summary()
+        super().close()
+
+
+def start_logging(log_path: str, progress_interval: float) -> EventLogger:
+    """Starts the listener writing the text log to log_path.txt, structured events to log_path.jsonl
+    and the summary of sent transactions to the console. Returns the logger putting records on its queue.
+    Records left in the queue are written when the program exits.
+
+    Examples:
+    >>> logger = start_logging('logs/log_2022-01-06_10-15-00', 2)
+    """
+    log_queue = queue.SimpleQueue()
+    text_handler = logging.FileHandler(filename=f'{log_path}.txt', delay=True)
+    text_handler.setFormatter(TextFormatter("%(asctime)s [%(levelname)s] %(message)s", datefmt='%Y-%m-%d %H:%M:%S'))
+    # logging.Formatter.converter = time.gmtime  # set to make logs timestamps in gmt (UTC+0)
+    events_handler = logging.FileHandler(filename=f'{log_path}.jsonl', delay=True)
+    events_handler.setFormatter(JsonLinesFormatter())
+    events_handler.addFilter(lambda record: hasattr(record, 'event'))
+    listener = logging.handlers.QueueListener(log_queue, text_handler, events_handler, ProgressHandler(progress_interval))
+    listener.start()
+    # handlers are closed by logging.shutdown() after this, so the last summary is printed after the queue is empty
+    atexit.register(listener.stop)
+    logging.basicConfig(level=logging.INFO,  # DEBUG is the lowest - the most information
+                        handlers=[DeferredQueueHandler(log_queue)])
+    return EventLogger(logging.getLogger('settings'), {})
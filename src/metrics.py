@@ -0,0 +1,188 @@
+"""This file contains RPC metrics - number of calls, errors and latency histograms of JSON-RPC methods.
+Every call is tagged with the current phase of the run (e.g. estimate, fund, mix, mint, sweep).
+It doesn't import settings.py, because settings.py installs the middleware.
+"""
+
+import contextlib
+import contextvars
+import json
+import threading
+import time
+
+from collections import Counter
+from typing import Callable, Dict, Iterator, Tuple
+
+from requests import HTTPError
+
+
+# Upper bounds of latency histogram buckets in seconds, like Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+# Phase of calls made outside of any phase
+DEFAULT_PHASE = 'other'
+
+current_phase_var = contextvars.ContextVar('phase', default=DEFAULT_PHASE)
+# progress of the current job of -daemon mode, see report_progress()
+progress_var = contextvars.ContextVar('progress', default=None)
+
+
+def current_phase() -> str:
+    return current_phase_var.get()
+
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Tags RPC calls made inside the block (in this thread or task) with the phase name.
+
+    Examples:
+    >>> with phase('estimate'):
+    ...     total_fees = estimate_multi_mint_fees()
+    """
+    token = current_phase_var.set(name)
+    try:
+        yield
+    finally:
+        current_phase_var.reset(token)
+
+
+def in_phase(name: str, func: Callable) -> Callable:
+    """Returns func running in the given phase, e.g. for functions sent to other threads,
+    which don't inherit the phase of the caller.
+    """
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def report_progress(**values) -> None:
+    """Updates progress of the current job of -daemon mode, which is read by its API. Does nothing outside of jobs.
+
+    Examples:
+    >>> report_progress(steps={'confirmed': 12, 'sent': 8, 'waiting': 20})
+    """
+    progress = progress_var.get()
+    if progress is not None:
+        progress.update(values)
+
+
+class RpcMetrics:
+    """Counters and latency histograms keyed by (phase, method).
+
+    HTTP requests are counted separately from JSON-RPC calls, one request can carry a whole batch of calls.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = Counter()
+            self.errors = Counter()
+            self.rate_limited = Counter()
+            self.requests = Counter()
+            self.latency_buckets: Dict[Tuple[str, str], list] = {}
+            self.latency_sum = Counter()
+
+    def observe(self,
+                method: str,
+                duration: float,
+                calls: Dict[str, int] = None,
+                errors: int = 0,
+                rate_limited: bool = False) -> None:
+        """Records one HTTP request. For a batch method is 'batch' and calls holds the number of calls per method.
+        """
+        key = (current_phase(), method)
+        with self._lock:
+            self.requests[key] += 1
+            for call_method, count in (calls or {method: 1}).items():
+                self.calls[(key[0], call_method)] += count
+            self.errors[key] += errors
+            self.rate_limited[key] += rate_limited
+            buckets = self.latency_buckets.setdefault(key, [0] * len(LATENCY_BUCKETS))
+            for i, upper_bound in enumerate(LATENCY_BUCKETS):
+                if duration <= upper_bound:
+                    buckets[i] += 1
+            self.latency_sum[key] += duration
+
+    def summary(self) -> Dict:
+        """Returns all metrics grouped by phase and method.
+
+        Examples:
+        >>> rpc_metrics.summary()['mint']['eth_sendRawTransaction']
+        {'calls': 10, 'requests': 10, 'errors': 0, 'rate_limited': 0, 'latency_sum': 1.02, 'latency_buckets': {...}}
+        """
+        with self._lock:
+            keys = set(self.calls) | set(self.requests)
+            summary = {}
+            for phase_name, method in sorted(keys):
+                key = (phase_name, method)
+                buckets = self.latency_buckets.get(key, [0] * len(LATENCY_BUCKETS))
+                summary.setdefault(phase_name, {})[method] = {
+                    'calls': self.calls[key],
+                    'requests': self.requests[key],
+                    'errors': self.errors[key],
+                    'rate_limited': self.rate_limited[key],
+                    'latency_sum': round(self.latency_sum[key], 6),
+                    'latency_buckets': {str(upper_bound): count
+                                        for upper_bound, count in zip(LATENCY_BUCKETS, buckets)},
+                }
+            return summary
+
+    def dump_json(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def dump_prometheus(self, path: str) -> None:
+        """Saves metrics in Prometheus text format, e.g. for node_exporter textfile collector.
+        """
+        summary = self.summary()
+        lines = []
+        for name, field, metric_type, help_text in [
+                ('nft_minter_rpc_calls_total', 'calls', 'counter', 'JSON-RPC calls.'),
+                ('nft_minter_rpc_requests_total', 'requests', 'counter', 'HTTP requests, one batch is one request.'),
+                ('nft_minter_rpc_errors_total', 'errors', 'counter', 'JSON-RPC errors and failed requests.'),
+                ('nft_minter_rpc_rate_limited_total', 'rate_limited', 'counter', 'Requests rejected with HTTP 429.')]:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+            for phase_name, methods in summary.items():
+                for method, values in methods.items():
+                    lines.append(f'{name}{{phase="{phase_name}",method="{method}"}} {values[field]}')
+
+        name = 'nft_minter_rpc_latency_seconds'
+        lines += [f'# HELP {name} Latency of HTTP requests.', f'# TYPE {name} histogram']
+        for phase_name, methods in summary.items():
+            for method, values in methods.items():
+                if not values['requests']:
+                    continue
+                labels = f'phase="{phase_name}",method="{method}"'
+                for upper_bound, count in values['latency_buckets'].items():
+                    le = '+Inf' if upper_bound == 'inf' else upper_bound
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {values["latency_sum"]}')
+                lines.append(f'{name}_count{{{labels}}} {values["requests"]}')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+rpc_metrics = RpcMetrics()
+
+
+def metrics_middleware(make_request, w3):
+    """web3.py middleware recording every request in rpc_metrics.
+
+    Examples:
+    >>> w3.middleware_onion.inject(metrics_middleware, 'metrics', layer=0)
+    """
+    def middleware(method, params):
+        start = time.perf_counter()
+        try:
+            response = make_request(method, params)
+        except HTTPError as e:
+            rate_limited = e.response is not None and e.response.status_code == 429
+            rpc_metrics.observe(method, time.perf_counter() - start, errors=1, rate_limited=rate_limited)
+            raise
+        except Exception:
+            rpc_metrics.observe(method, time.perf_counter() - start, errors=1)
+            raise
+        rpc_metrics.observe(method, time.perf_counter() - start, errors=int('error' in response))
+        return response
+    return middleware
@@ -0,0 +1,103 @@
+"""This file contains NonceManager, which reads the nonce of an account once (or takes it from account_states)
+and then hands out the next nonces locally, instead of requesting it before every transaction.
+"""
+
+import threading
+
+from typing import Dict, Set
+
+from src.state import account_states
+from settings import config, PerChain
+
+
+class NonceManager:
+    """Hands out nonces per address, safe to use from many threads and coroutines.
+    Locks are never held across an await, so coroutines can't deadlock on them.
+
+    If broadcasting a transaction fails, call failed() with its nonce - the nonce is handed out again
+    by the next call, so later transactions from the same account don't get stuck behind a gap.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._address_locks: Dict[str, threading.Lock] = {}
+        self._next_nonces: Dict[str, int] = {}
+        self._gaps: Dict[str, Set[int]] = {}
+
+    def _address_lock(self, address: str) -> threading.Lock:
+        with self._lock:
+            return self._address_locks.setdefault(address, threading.Lock())
+
+    def _take(self, address: str) -> int:
+        gaps = self._gaps.get(address)
+        if gaps:
+            nonce = min(gaps)
+            gaps.remove(nonce)
+            return nonce
+        nonce = self._next_nonces[address]
+        self._next_nonces[address] = nonce + 1
+        return nonce
+
+    def seed(self, address: str, nonce: int) -> None:
+        """Sets the next nonce of address if it's not tracked yet, e.g. from get_accounts_states().
+        """
+        with self._address_lock(address):
+            self._next_nonces.setdefault(address, nonce)
+
+    def next_nonce(self, address: str) -> int:
+        """Examples:
+        >>> nonce = nonce_manager.next_nonce(sender.address)
+        """
+        with self._address_lock(address):
+            if address not in self._next_nonces:
+                nonce = account_states.get_nonce(address)
+                if nonce is None:
+                    nonce = config.w3.eth.get_transaction_count(address, 'pending')
+                self._next_nonces[address] = nonce
+            return self._take(address)
+
+    async def async_next_nonce(self, address: str) -> int:
+        """Examples:
+        >>> nonce = await nonce_manager.async_next_nonce(sender.address)
+        """
+        if address not in self._next_nonces:
+            nonce = account_states.get_nonce(address)
+            if nonce is None:
+                nonce = await config.async_w3.eth.get_transaction_count(address, 'pending')
+            self.seed(address, nonce)
+        with self._address_lock(address):
+            return self._take(address)
+
+    def failed(self, address: str, nonce: int, error: Exception) -> None:
+        """Repairs the nonce sequence after transaction with nonce couldn't be broadcast.
+        """
+        if 'nonce too low' in str(error) or 'already known' in str(error):
+            # local state is behind the chain (e.g. other program used the account), read it again
+            self.resync(address)
+            return
+        with self._address_lock(address):
+            if nonce == self._next_nonces.get(address, 0) - 1:
+                self._next_nonces[address] = nonce
+            else:
+                self._gaps.setdefault(address, set()).add(nonce)
+
+    def resync(self, address: str) -> None:
+        with self._address_lock(address):
+            self._next_nonces[address] = config.w3.eth.get_transaction_count(address, 'pending')
+            self._gaps.pop(address, None)
+
+    def reset(self, address: str = None) -> None:
+        """Forgets the nonce of address, or of all addresses if not specified.
+        """
+        with self._lock:
+            if address is None:
+                self._next_nonces.clear()
+                self._gaps.clear()
+                self._address_locks.clear()
+            else:
+                self._next_nonces.pop(address, None)
+                self._gaps.pop(address, None)
+                self._address_locks.pop(address, None)
+
+
+# nonces are per chain, jobs using the same account on the same chain share them
+nonce_manager = PerChain(NonceManager)
@@ -0,0 +1,173 @@
+"""This file contains functions for sending transactions in two phases.
+First all transactions are signed (prepare), then they are broadcast as fast as possible (fire),
+so signing time doesn't add up with network latency between consecutive transactions.
+"""
+
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+from eth_account import Account
+
+from src.accounts import AccountExt
+from src.interactions import build_contract_tx
+from src.journal import run_journal
+from src.nonces import nonce_manager
+from src.replacements import tx_replacer
+from src.state import account_states
+from src.rpc import batch_request
+from src.splitter import send_tx
+from settings import config, bind_context, CONTRACT_FUNCTION_GAS, PRESIGN_POOL_THRESHOLD, PRESIGN_PROCESSES,\
+    FIRE_THREADS, RPC_BATCH_SIZE
+
+
+def _sign(tx_and_key: Tuple[dict, bytes]) -> Tuple[bytes, str]:
+    # module level function, so it can be sent to other processes
+    tx, private_key = tx_and_key
+    signed_tx = Account.sign_transaction(tx, private_key)
+    return signed_tx.rawTransaction, signed_tx.hash.hex()
+
+
+def sign_transactions(txs_and_keys: List[Tuple[dict, bytes]]) -> List[Tuple[bytes, str]]:
+    """Signs transactions, in a process pool if there are at least PRESIGN_POOL_THRESHOLD of them.
+    Returns (raw transaction, transaction hash) pairs in the same order.
+    """
+    if len(txs_and_keys) < PRESIGN_POOL_THRESHOLD:
+        return [_sign(tx_and_key) for tx_and_key in txs_and_keys]
+    with ProcessPoolExecutor(max_workers=PRESIGN_PROCESSES) as executor:
+        return list(executor.map(_sign, txs_and_keys, chunksize=64))
+
+
+def prepare_contract_writes(senders: List[AccountExt],
+                            contract_func_name: str,
+                            contract_func_args: List[Union[str, int]],
+                            amount: int,
+                            gas: int = CONTRACT_FUNCTION_GAS,
+                            ) -> List[Dict]:
+    """Signs one contract function call for every sender, the same account can be repeated to call it many times.
+    Nonces are taken from nonce_manager.
+
+    Examples:
+    >>> prepared = prepare_contract_writes(accounts, 'mint', None, w3.toWei(0.1, 'ether'))
+    >>> prepared = prepare_contract_writes([master_account] * 10, 'mint', None, w3.toWei(0.1, 'ether'))
+    """
+    prepared = []
+    for sender in senders:
+        nonce = nonce_manager.next_nonce(sender.address)
+        prepared.append({'sender': sender,
+                         'nonce': nonce,
+                         'tx': build_contract_tx(contract_func_name, contract_func_args, amount, gas, nonce)})
+
+    signed_txs = sign_transactions([(item['tx'], item['sender'].key) for item in prepared])
+    for item, (raw_tx, tx_hash) in zip(prepared, signed_txs):
+        item['raw_tx'] = raw_tx
+        item['tx_hash'] = tx_hash
+    return prepared
+
+
+def fire_transaction(item: Dict) -> str:
+    """Broadcasts one signed transaction from prepare_contract_writes().
+
+    Examples:
+    >>> tx_hash = fire_transaction(prepared[0])
+    """
+    sender = item['sender']
+    start = time.perf_counter()
+    run_journal.sent(sender.address, item['tx'], item['tx_hash'])
+    try:
+        config.w3.eth.send_raw_transaction(item['raw_tx'])
+    except Exception as e:
+        nonce_manager.failed(sender.address, item['nonce'], e)
+        raise
+    tx_replacer.register(sender, item['tx'], item['tx_hash'])
+    account_states.sent(sender.address, item['tx'], item['tx_hash'])
+    if config.LOGGING == True:
+        config.logger.event('broadcast', account=sender.id, address=sender.address, nonce=item['nonce'],
+                            hash=item['tx_hash'], duration=time.perf_counter() - start)
+    return item['tx_hash']
+
+
+def fire_transactions(prepared: List[Dict]) -> List[str]:
+    """Broadcasts signed transactions from prepare_contract_writes() in JSON-RPC batches sent from FIRE_THREADS
+    threads at the same time. Returns hashes of transactions accepted by the provider.
+    Nonces of rejected transactions followed by accepted ones of the same sender are filled (see fill_nonce_gaps()),
+    so the accepted ones aren't stuck.
+
+    Examples:
+    >>> tx_hashes = fire_transactions(prepared)
+    """
+    chunks = [prepared[i:i + RPC_BATCH_SIZE] for i in range(0, len(prepared), RPC_BATCH_SIZE)]
+    # recorded before broadcasting, so transactions broadcast right before a crash are still in the journal
+    for item in prepared:
+        run_journal.sent(item['sender'].address, item['tx'], item['tx_hash'])
+
+    def fire_chunk(chunk):
+        # a failed batch (e.g. HTTP error or timeout) fails only its transactions, other chunks are already sent
+        try:
+            return batch_request([('eth_sendRawTransaction', [config.w3.toHex(item['raw_tx'])]) for item in chunk],
+                                 raise_errors=False)
+        except Exception as e:
+            return [e] * len(chunk)
+
+    with ThreadPoolExecutor(max_workers=FIRE_THREADS) as executor:
+        # threads don't inherit the phase and the config of the caller
+        results = [result for chunk_results in executor.map(bind_context(fire_chunk), chunks)
+                   for result in chunk_results]
+
+    tx_hashes = []
+    accepted, failed = [], []
+    for item, result in zip(prepared, results):
+        sender = item['sender']
+        if isinstance(result, Exception):
+            print(result)
+            nonce_manager.failed(sender.address, item['nonce'], result)
+            failed.append(item)
+            continue
+        tx_hashes.append(item['tx_hash'])
+        accepted.append(item)
+        tx_replacer.register(sender, item['tx'], item['tx_hash'])
+        account_states.sent(sender.address, item['tx'], item['tx_hash'])
+        if config.LOGGING == True:
+            config.logger.event('broadcast', account=sender.id, address=sender.address, nonce=item['nonce'],
+                                hash=item['tx_hash'])
+    return tx_hashes + fill_nonce_gaps(failed, accepted)
+
+
+def fill_nonce_gaps(failed: List[Dict],
+                    accepted: List[Dict]) -> List[str]:
+    """Sends again rejected transactions whose nonce is below a nonce of an accepted transaction of the same sender,
+    otherwise the accepted ones would wait for it until they time out. A transaction rejected again is replaced
+    with a transfer of 0 to the sender, so the gap is filled anyway. Returns hashes of sent mints.
+
+    Examples:
+    >>> tx_hashes += fill_nonce_gaps(failed, accepted)
+    """
+    last_nonces = {}
+    for item in accepted:
+        last_nonces[item['sender'].address] = max(item['nonce'], last_nonces.get(item['sender'].address, -1))
+    tx_hashes = []
+    for item in sorted(failed, key=lambda item: item['nonce']):
+        sender = item['sender']
+        if item['nonce'] > last_nonces.get(sender.address, -1):
+            continue
+        try:
+            tx_hashes.append(fire_transaction(item))
+            continue
+        except Exception as e:
+            print(e)
+            if 'already known' in str(e):
+                # the first broadcast reached the node after all
+                tx_hashes.append(item['tx_hash'])
+                tx_replacer.register(sender, item['tx'], item['tx_hash'])
+                account_states.sent(sender.address, item['tx'], item['tx_hash'])
+                continue
+            if 'nonce too low' in str(e):
+                # the nonce is used already, there is no gap
+                continue
+        # the rejected nonce is the lowest one handed out again by nonce_manager
+        try:
+            send_tx(sender, sender, 0)
+        except Exception as e:
+            print(e)
+    return tx_hashes
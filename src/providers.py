@@ -0,0 +1,245 @@
+"""This file contains the provider pool, which sends JSON-RPC requests to one of many endpoints.
+Reads are spread across endpoints, endpoints which fail are skipped for a while,
+and transactions are broadcast to all endpoints at once.
+It doesn't import settings.py, because settings.py creates the pool.
+"""
+
+import itertools
+import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Any, Dict, List, Union
+
+from aiohttp import ClientResponseError
+from requests import HTTPError, RequestException, Session
+from requests.adapters import HTTPAdapter
+from web3 import AsyncHTTPProvider
+from web3.providers.base import JSONBaseProvider
+
+from src.ratelimit import RateLimiter, is_rate_limit_error
+
+
+Payload = Union[Dict, List[Dict]]
+
+
+def is_broadcast(payload: Payload) -> bool:
+    calls = payload if isinstance(payload, list) else [payload]
+    return any(call['method'] == 'eth_sendRawTransaction' for call in calls)
+
+
+def is_http_429(error: HTTPError) -> bool:
+    return error.response is not None and error.response.status_code == 429
+
+
+class ProviderPool:
+    """Sends JSON-RPC requests (single or batch) to a list of endpoints.
+
+    - reads go to the next healthy endpoint (round robin), an endpoint which fails or rate limits
+      is skipped for cooldown seconds and the request is repeated on the next one
+    - requests with eth_sendRawTransaction are sent to all endpoints at the same time,
+      the first successful response is used
+    - with hedge=True, the request is also sent to the next endpoint if there is no response
+      within hedge_delay seconds, and the first response is used
+    - every request waits for the rate limiter, requests rate limited by all endpoints are repeated
+      up to retries times (only rate limited calls of a batch)
+
+    Examples:
+    >>> pool = ProviderPool(['https://polygon-mumbai.infura.io/v3/***', 'https://rpc-mumbai.maticvigil.com'])
+    >>> pool.request({'jsonrpc': '2.0', 'method': 'eth_blockNumber', 'params': [], 'id': 1})
+    """
+    def __init__(self,
+                 endpoints: List[str],
+                 pool_maxsize: int = 50,
+                 cooldown: float = 30,
+                 hedge_delay: float = None,
+                 timeout: float = 20,
+                 limiter: RateLimiter = None,
+                 retries: int = 5):
+        if not endpoints:
+            raise Exception('At least one provider endpoint is required')
+        self.endpoints = [{'url': url, 'session': self._create_session(pool_maxsize), 'failed_until': 0}
+                          for url in endpoints]
+        self.cooldown = cooldown
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter()
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._next_index = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(endpoints)))
+
+    @staticmethod
+    def _create_session(pool_maxsize: int) -> Session:
+        # keep-alive connections are reused, pool_maxsize of them can be open at once (e.g. from many threads)
+        session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _ordered_endpoints(self) -> List[Dict]:
+        """Endpoints starting from the next one in round robin, endpoints in cooldown at the end.
+        """
+        start = next(self._next_index) % len(self.endpoints)
+        endpoints = self.endpoints[start:] + self.endpoints[:start]
+        now = time.monotonic()
+        return [e for e in endpoints if e['failed_until'] <= now] + [e for e in endpoints if e['failed_until'] > now]
+
+    def _post(self, endpoint: Dict, payload: Payload) -> Any:
+        try:
+            response = endpoint['session'].post(endpoint['url'], json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (RequestException, ValueError):
+            # connection errors, HTTP 429 and 5xx, invalid responses
+            with self._lock:
+                endpoint['failed_until'] = time.monotonic() + self.cooldown
+            raise
+
+    def request(self, payload: Payload, hedge: bool = False) -> Any:
+        """Returns decoded JSON response. Raises the last error if no endpoint answered.
+        """
+        responses = {}
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = self._limited_request(payload, hedge)
+            except HTTPError as e:
+                if not is_http_429(e) or last_attempt:
+                    raise
+                continue
+            items = response if isinstance(response, list) else [response]
+            throttled_ids = {item.get('id') for item in items if is_rate_limit_error(item)}
+            if not isinstance(payload, list) or not isinstance(response, list):
+                # single request, or the whole batch was rejected with one error
+                if not throttled_ids or last_attempt:
+                    return response
+                continue
+            # only rate limited calls of a batch are repeated, e.g. transactions accepted before aren't sent again
+            responses.update({item.get('id'): item for item in items})
+            if not throttled_ids or last_attempt:
+                return list(responses.values())
+            payload = [call for call in payload if call.get('id') in throttled_ids]
+
+    def _limited_request(self, payload: Payload, hedge: bool) -> Any:
+        calls = payload if isinstance(payload, list) else [payload]
+        self.limiter.acquire(self.limiter.cost([call['method'] for call in calls]))
+        throttled = False
+        try:
+            response = self._request(payload, hedge)
+            throttled = any(is_rate_limit_error(item) for item in (response if isinstance(response, list)
+                                                                   else [response]))
+            return response
+        except HTTPError as e:
+            throttled = is_http_429(e)
+            raise
+        finally:
+            self.limiter.release(throttled)
+
+    def _request(self, payload: Payload, hedge: bool) -> Any:
+        if len(self.endpoints) == 1:
+            return self._post(self.endpoints[0], payload)
+        if is_broadcast(payload):
+            return self._broadcast(payload)
+        endpoints = self._ordered_endpoints()
+        if hedge and self.hedge_delay is not None:
+            return self._hedged(payload, endpoints)
+        for endpoint in endpoints[:-1]:
+            try:
+                return self._post(endpoint, payload)
+            except (RequestException, ValueError):
+                continue
+        return self._post(endpoints[-1], payload)
+
+    def _hedged(self, payload: Payload, endpoints: List[Dict]) -> Any:
+        pending = {self._executor.submit(self._post, endpoints[0], payload)}
+        next_endpoint = 1
+        error = None
+        while pending:
+            can_hedge = next_endpoint < len(endpoints)
+            done, pending = wait(pending, timeout=self.hedge_delay if can_hedge else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except (RequestException, ValueError) as e:
+                    error = e
+            # no response in time or the request failed, the next endpoint is asked too
+            if can_hedge:
+                pending.add(self._executor.submit(self._post, endpoints[next_endpoint], payload))
+                next_endpoint += 1
+        raise error
+
+    def _broadcast(self, payload: Payload) -> Any:
+        calls = payload if isinstance(payload, list) else [payload]
+        futures = [self._executor.submit(self._post, endpoint, payload) for endpoint in self.endpoints]
+        best: Dict[Any, Dict] = {}
+        error = None
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except (RequestException, ValueError) as e:
+                error = e
+                continue
+            for item in response if isinstance(response, list) else [response]:
+                # accepted by any endpoint is accepted, e.g. 'already known' from another one doesn't matter
+                if item.get('id') not in best or 'error' in best[item.get('id')]:
+                    best[item.get('id')] = item
+            if all(call.get('id') in best and 'error' not in best[call.get('id')] for call in calls):
+                break  # other endpoints finish in the background
+        if not best:
+            raise error
+        if isinstance(payload, list):
+            return list(best.values())
+        return best[payload.get('id')]
+
+
+class PoolProvider(JSONBaseProvider):
+    """web3.py provider sending requests through ProviderPool.
+
+    Examples:
+    >>> w3 = Web3(PoolProvider(pool, hedged_methods=('eth_blockNumber',)))
+    """
+    def __init__(self, pool: ProviderPool, hedged_methods: tuple = ()):
+        self.pool = pool
+        self.hedged_methods = hedged_methods
+        super().__init__()
+
+    def make_request(self, method, params):
+        payload = json.loads(self.encode_rpc_request(method, params))
+        return self.pool.request(payload, hedge=method in self.hedged_methods)
+
+    def __str__(self):
+        return f'Pool of {len(self.pool.endpoints)} endpoints'
+
+
+class LimitedAsyncHTTPProvider(AsyncHTTPProvider):
+    """AsyncHTTPProvider which waits for the rate limiter and repeats rate limited requests.
+
+    Examples:
+    >>> async_w3 = Web3(LimitedAsyncHTTPProvider(url, limiter), modules={'eth': (AsyncEth,)}, middlewares=[])
+    """
+    def __init__(self, endpoint_uri: str, limiter: RateLimiter, retries: int = 5, **kwargs):
+        self.limiter = limiter
+        self.retries = retries
+        super().__init__(endpoint_uri, **kwargs)
+
+    async def make_request(self, method, params):
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            await self.limiter.async_acquire(self.limiter.cost(method))
+            throttled = False
+            try:
+                response = await super().make_request(method, params)
+                throttled = is_rate_limit_error(response)
+            except ClientResponseError as e:
+                throttled = e.status == 429
+                if not throttled or last_attempt:
+                    raise
+                continue
+            finally:
+                self.limiter.release(throttled)
+            if not throttled or last_attempt:
+                return response
@@ -0,0 +1,131 @@
+"""This file contains the rate limiter shared by all requests to the provider.
+Requests cost compute units per method (like Alchemy compute units or Infura credits) taken from a token bucket,
+and the number of requests in flight adapts to the provider: it grows while requests succeed
+and halves when the provider rate limits (AIMD).
+It doesn't import settings.py, because settings.py creates the limiter.
+"""
+
+import asyncio
+import threading
+import time
+
+from typing import Dict, List, Union
+
+
+# Codes and messages of JSON-RPC errors returned by providers when they rate limit
+RATE_LIMIT_ERROR_CODES = (429, -32005)
+RATE_LIMIT_ERROR_MESSAGES = ('rate limit', 'too many requests', 'exceeded its compute units', 'request limit')
+# eth_getLogs queries over too many blocks or results are rejected with the same codes by some providers
+# (e.g. "query returned more than 10000 results"), repeating them wouldn't help, they have to be split
+QUERY_LIMIT_ERROR_MESSAGES = ('query returned more than', 'block range', 'response size exceeded')
+
+
+def is_rate_limit_error(item: Dict) -> bool:
+    """Checks if JSON-RPC response item is a rate limit error.
+    """
+    error = item.get('error')
+    if not isinstance(error, dict):
+        return False
+    message = str(error.get('message', '')).lower()
+    if any(text in message for text in QUERY_LIMIT_ERROR_MESSAGES):
+        return False
+    return error.get('code') in RATE_LIMIT_ERROR_CODES or any(text in message for text in RATE_LIMIT_ERROR_MESSAGES)
+
+
+class RateLimiter:
+    """Token bucket with per-method costs and AIMD window of requests in flight.
+
+    - rate is the quota in compute units per second (None - no quota), the bucket holds at most one second of it
+    - window grows by one after every window of successful requests, up to max_in_flight
+    - when the provider rate limits, window and rate are halved and new requests wait for a backoff,
+      which doubles with every next rate limit in a row
+
+    Examples:
+    >>> limiter = RateLimiter(rate=330, costs={'eth_sendRawTransaction': 250}, default_cost=10)
+    >>> limiter.acquire(limiter.cost(['eth_getBalance', 'eth_getBalance']))
+    >>> limiter.release(throttled=False)
+    """
+    def __init__(self,
+                 rate: float = None,
+                 max_in_flight: int = 50,
+                 costs: Dict[str, int] = None,
+                 default_cost: int = 10,
+                 min_backoff: float = 0.25,
+                 max_backoff: float = 8):
+        self.max_rate = rate
+        self.rate = rate
+        self.max_in_flight = max_in_flight
+        self.window = float(max_in_flight)
+        self.costs = costs or {}
+        self.default_cost = default_cost
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._tokens = rate or 0
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._backoff = 0
+        self._blocked_until = 0
+
+    def cost(self, methods: Union[str, List[str]]) -> float:
+        methods = [methods] if isinstance(methods, str) else methods
+        return sum(self.costs.get(method, self.default_cost) for method in methods)
+
+    def _try_acquire(self, cost: float) -> float:
+        """Takes a slot and tokens and returns 0, or returns how long to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self._in_flight >= int(self.window):
+                return 0.005
+            if self.rate is not None:
+                self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                # a request costing more than the bucket holds waits for the full bucket
+                cost = min(cost, self.rate)
+                if self._tokens < cost:
+                    return (cost - self._tokens) / self.rate
+                self._tokens -= cost
+            self._in_flight += 1
+            return 0
+
+    def acquire(self, cost: float) -> None:
+        """Waits until the request can be sent. Every acquire() has to be followed by release().
+        """
+        while True:
+            delay = self._try_acquire(cost)
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def async_acquire(self, cost: float) -> None:
+        while True:
+            delay = self._try_acquire(cost)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def release(self, throttled: bool) -> None:
+        """Ends the request, throttled=True if the provider rate limited it.
+        """
+        with self._lock:
+            self._in_flight -= 1
+            if throttled and time.monotonic() < self._blocked_until:
+                # requests sent before the backoff started, the limiter already reacted to this burst
+                return
+            if throttled:
+                # multiplicative decrease
+                self.window = max(1.0, self.window / 2)
+                if self.rate is not None:
+                    self.rate = max(self.max_rate / 16, self.rate / 2)
+                    self._tokens = min(self._tokens, self.rate)
+                self._backoff = min(self.max_backoff, max(self.min_backoff, self._backoff * 2))
+                self._blocked_until = time.monotonic() + self._backoff
+            else:
+                # additive increase, by one request per window of successful ones
+                self.window = min(float(self.max_in_flight), self.window + 1 / self.window)
+                if self.rate is not None:
+                    self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+                self._backoff = 0
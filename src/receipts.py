@@ -0,0 +1,168 @@
+"""This file contains the receipt tracker, which waits for many transactions at once.
+Instead of polling every transaction, it reads new blocks and matches them against pending transactions.
+Pending transactions which are stuck are replaced with higher fees by tx_replacer,
+and receipts of mined transactions update cached balances in account_states.
+"""
+
+import itertools
+import time
+
+from typing import Dict, List
+
+from src.metrics import report_progress
+from src.replacements import tx_replacer
+from src.rpc import batch_request
+from src.state import account_states
+from settings import config, RECEIPT_POLL_INTERVAL, RECEIPT_TIMEOUT
+
+
+# Result of a transaction which wasn't mined before timeout
+NOT_MINED = {'status': None, 'gasUsed': None, 'effectiveGasPrice': None, 'blockNumber': None}
+
+
+def _read_receipts(tx_hashes: List[str], results: Dict[str, Dict]) -> None:
+    receipts = batch_request([('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes])
+    for tx_hash, receipt in zip(tx_hashes, receipts):
+        if receipt is not None:
+            results[tx_hash] = {'status': int(receipt['status'], 16),
+                                'gasUsed': int(receipt['gasUsed'], 16),
+                                'effectiveGasPrice': int(receipt.get('effectiveGasPrice', '0x0'), 16),
+                                'blockNumber': int(receipt['blockNumber'], 16)}
+
+
+class ReceiptTracker:
+    """Tracks receipts of transactions added at any time. Every poll() reads blocks mined since the previous one
+    and returns results of transactions found in them. When a stuck transaction was replaced,
+    the result of its replacement is returned under the original hash.
+    Blocks which didn't come back and mined transactions whose receipts aren't served yet (e.g. by an endpoint
+    behind the others) are read again by the next poll(), so a mined transaction is never missed.
+
+    Examples:
+    >>> tracker = ReceiptTracker()
+    >>> results = tracker.add(tx_hashes)
+    >>> results.update(tracker.poll())
+    """
+    def __init__(self):
+        self.pending = set()
+        self.replacements: Dict[str, str] = {}  # replacement hash -> original hash
+        self.unreceipted = set()  # hashes found in blocks, without a receipt yet
+        self.last_block = None
+
+    def add(self,
+            tx_hashes: List[str],
+            replacements: Dict[str, str] = None) -> Dict[str, Dict]:
+        """Starts tracking transactions, returns results of those already mined.
+        replacements ({replacement hash: original hash}) are known replacements of them, e.g. from the journal.
+        """
+        tx_hashes = [tx_hash.lower() for tx_hash in tx_hashes]
+        replacements = {replacement.lower(): original.lower()
+                        for replacement, original in (replacements or {}).items()}
+        results = {}
+        if not tx_hashes:
+            return results
+        if self.last_block is None:
+            self.last_block = config.w3.eth.block_number
+        # transactions mined before tracking started are found with one batch of receipts
+        receipts = {}
+        _read_receipts(tx_hashes + list(replacements), receipts)
+        for tx_hash, receipt in receipts.items():
+            account_states.apply_receipt(tx_hash, receipt)
+            tx_replacer.forget(tx_hash)
+            results[replacements.get(tx_hash, tx_hash)] = receipt
+        self.pending |= set(tx_hashes) - set(results)
+        self.replacements.update({replacement: original for replacement, original in replacements.items()
+                                  if original in self.pending})
+        return results
+
+    def discard(self, tx_hash: str) -> None:
+        """Stops tracking the transaction and its replacements, e.g. after timeout.
+        """
+        self.pending.discard(tx_hash)
+        self.replacements = {replacement: original for replacement, original in self.replacements.items()
+                             if original != tx_hash}
+        self.unreceipted = {mined for mined in self.unreceipted
+                            if mined in self.pending or mined in self.replacements}
+        tx_replacer.forget(tx_hash)
+        account_states.forget(tx_hash)
+
+    def poll(self) -> Dict[str, Dict]:
+        """Reads new blocks and returns results of pending transactions mined in them.
+        """
+        results = {}
+        if not self.pending:
+            return results
+        block_number = config.w3.eth.block_number
+        blocks = []
+        if block_number > self.last_block:
+            blocks = batch_request([('eth_getBlockByNumber', [hex(number), False])
+                                    for number in range(self.last_block + 1, block_number + 1)])
+        # blocks from the first one which didn't come back are read again next time
+        blocks = list(itertools.takewhile(lambda block: block is not None, blocks))
+        watched = {**{tx_hash: tx_hash for tx_hash in self.pending}, **self.replacements}
+        mined = list(self.unreceipted) + [tx_hash for block in blocks
+                                          for tx_hash in block['transactions'] if tx_hash in watched]
+        if mined:
+            receipts = {}
+            _read_receipts(mined, receipts)
+            self.unreceipted = set(mined) - set(receipts)
+            for tx_hash, receipt in receipts.items():
+                # the mined transaction, not the original one, decides the value sent
+                account_states.apply_receipt(tx_hash, receipt)
+                results[watched[tx_hash]] = receipt
+            for tx_hash in results:
+                self.discard(tx_hash)
+        self.last_block += len(blocks)
+        # transactions still pending after this block may be stuck, unless they are mined already
+        mined_originals = {watched[tx_hash] for tx_hash in self.unreceipted}
+        self.replacements.update(tx_replacer.replace_stuck([tx_hash for tx_hash in self.pending
+                                                            if tx_hash not in mined_originals], block_number))
+        return results
+
+
+def wait_for_receipts(tx_hashes: List[str],
+                      timeout: float = RECEIPT_TIMEOUT,
+                      poll_interval: float = RECEIPT_POLL_INTERVAL) -> Dict[str, Dict]:
+    """Waits for all transactions and returns a table with status, gasUsed, effectiveGasPrice and blockNumber
+    of every transaction. Status is 1 for success, 0 for reverted, None if it wasn't mined before timeout.
+
+    Examples:
+    >>> results = wait_for_receipts(tx_hashes)
+    >>> failed = [tx_hash for tx_hash, result in results.items() if result['status'] != 1]
+    """
+    tx_hashes = [tx_hash.lower() for tx_hash in tx_hashes]
+    tracker = ReceiptTracker()
+    results = tracker.add(tx_hashes)
+
+    start = time.monotonic()
+    while tracker.pending and time.monotonic() - start < timeout:
+        report_progress(mined=len(tx_hashes) - len(tracker.pending), pending=len(tracker.pending))
+        time.sleep(poll_interval)
+        results.update(tracker.poll())
+
+    report_progress(mined=len(tx_hashes) - len(tracker.pending), pending=0, not_mined=len(tracker.pending))
+    for tx_hash in list(tracker.pending):
+        results[tx_hash] = NOT_MINED.copy()
+        tracker.discard(tx_hash)
+    return {tx_hash: results[tx_hash] for tx_hash in tx_hashes}
+
+
+def display_receipts(results: Dict[str, Dict]) -> None:
+    """Prints and logs transactions which failed or weren't mined, and a summary.
+
+    Examples:
+    >>> display_receipts(wait_for_receipts(tx_hashes))
+    """
+    messages = []
+    for tx_hash, result in results.items():
+        if result['status'] == 0:
+            messages.append(f'Transaction {tx_hash} reverted in block {result["blockNumber"]}, '
+                            f'gas used: {result["gasUsed"]}')
+        elif result['status'] is None:
+            messages.append(f'Transaction {tx_hash} not mined before timeout')
+    succeeded = sum(result['status'] == 1 for result in results.values())
+    messages.append(f'Transactions succeeded: {succeeded}/{len(results)}')
+
+    for info_msg in messages:
+        print(info_msg)
+        if config.LOGGING == True:
+            config.logger.info(info_msg)
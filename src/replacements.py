@@ -0,0 +1,158 @@
+"""This file contains the replacement engine, which raises fees of transactions stuck in the mempool.
+Transactions are tracked by (sender, nonce). When one isn't included within REPLACE_AFTER_BLOCKS blocks,
+it's signed again with the same nonce and higher fees, so later transactions of the account don't stall behind it.
+"""
+
+import math
+import threading
+
+from typing import Dict, List
+
+from src.accounts import AccountExt
+from src.gas import gas_oracle
+from src.journal import run_journal
+from src.state import account_states
+from settings import config, REPLACE_AFTER_BLOCKS, FEE_BUMP_PERCENT, MAX_FEE_PER_GAS_CAP, PerChain
+
+
+class TxReplacer:
+    """Keeps sent transactions until they are mined and replaces those which are stuck.
+
+    All hashes of one (sender, nonce) - the original and its replacements - are tracked together,
+    whichever of them is mined, the result belongs to the original hash.
+
+    Examples:
+    >>> tx_replacer.register(sender, tx, tx_hash)
+    >>> new_hashes = tx_replacer.replace_stuck([tx_hash], block_number)  # {replacement hash: original hash}
+    """
+    def __init__(self,
+                 replace_after_blocks: int = REPLACE_AFTER_BLOCKS,
+                 fee_bump_percent: float = FEE_BUMP_PERCENT,
+                 max_fee_cap: float = MAX_FEE_PER_GAS_CAP):
+        self.replace_after_blocks = replace_after_blocks
+        self.fee_bump_percent = fee_bump_percent
+        # the cap is given in gwei
+        self.max_fee_cap = int(max_fee_cap * 10 ** 9) if max_fee_cap is not None else None
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}  # original hash -> sender, last signed tx, all hashes
+        self.originals: Dict[str, str] = {}  # any hash -> original hash
+
+    def register(self,
+                 sender: AccountExt,
+                 tx: dict,
+                 tx_hash: str,
+                 sweep: bool = False) -> None:
+        """Starts tracking sent transaction. sweep=True means that it sends the whole balance,
+        so its replacements send less by the raised fee.
+        """
+        if self.replace_after_blocks is None:
+            return
+        tx_hash = tx_hash.lower()
+        with self._lock:
+            self.entries[tx_hash] = {'sender': sender, 'tx': dict(tx), 'hashes': [tx_hash], 'sweep': sweep,
+                                     'sent_block': None, 'gave_up': False}
+            self.originals[tx_hash] = tx_hash
+
+    def original(self, tx_hash: str) -> str:
+        return self.originals.get(tx_hash.lower(), tx_hash.lower())
+
+    def forget(self, tx_hash: str) -> None:
+        """Stops tracking the transaction and its replacements, e.g. when one of them was mined.
+        """
+        with self._lock:
+            entry = self.entries.pop(self.original(tx_hash), None)
+            for replaced_hash in entry['hashes'] if entry is not None else []:
+                self.originals.pop(replaced_hash, None)
+
+    def _bumped_fees(self, tx: dict) -> Dict[str, int]:
+        """Returns fees raised by at least fee_bump_percent, or to the current fast quote if it's higher.
+        None if the cap doesn't allow the minimal raise accepted by nodes (10%).
+        """
+        quote = gas_oracle.fees('fast')
+        multiplier = 1 + self.fee_bump_percent / 100
+        priority_fee = max(math.ceil(tx['maxPriorityFeePerGas'] * multiplier), quote['maxPriorityFeePerGas'])
+        max_fee = max(math.ceil(tx['maxFeePerGas'] * multiplier), quote['maxFeePerGas'], priority_fee)
+        if self.max_fee_cap is not None:
+            max_fee = min(max_fee, self.max_fee_cap)
+        priority_fee = min(priority_fee, max_fee)
+        # nodes accept a replacement only if both fees are raised by 10%
+        if max_fee * 10 < tx['maxFeePerGas'] * 11 or priority_fee * 10 < tx['maxPriorityFeePerGas'] * 11:
+            return None
+        return {'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': priority_fee}
+
+    def _replace(self, entry: Dict) -> str:
+        tx = entry['tx']
+        fees = self._bumped_fees(tx)
+        if fees is None:
+            raise Exception('fees would exceed MAX_FEE_PER_GAS_CAP')
+        new_tx = {**tx, **fees}
+        if entry['sweep']:
+            # the total cost stays equal to the balance
+            new_tx['value'] = tx['value'] - tx['gas'] * (fees['maxFeePerGas'] - tx['maxFeePerGas'])
+            if new_tx['value'] <= 0:
+                raise Exception('the balance doesn\'t cover raised fees')
+        signed_tx = config.w3.eth.account.sign_transaction(new_tx, entry['sender'].privateKey.hex())
+        run_journal.replaced(entry['hashes'][0], signed_tx.hash.hex())
+        tx_hash = config.w3.eth.send_raw_transaction(signed_tx.rawTransaction).hex().lower()
+        entry['tx'] = new_tx
+        entry['hashes'].append(tx_hash)
+        account_states.sent(entry['sender'].address, new_tx, tx_hash)
+        return tx_hash
+
+    def replace_stuck(self,
+                      tx_hashes: List[str],
+                      block_number: int) -> Dict[str, str]:
+        """Replaces transactions from tx_hashes (original hashes) which weren't mined within replace_after_blocks
+        blocks since they were sent or last replaced. Returns {replacement hash: original hash}.
+        """
+        replacements = {}
+        if self.replace_after_blocks is None:
+            return replacements
+        # later nonces of an account wait for the lowest one, so only the lowest one is replaced
+        lowest: Dict[str, Dict] = {}
+        for tx_hash in tx_hashes:
+            entry = self.entries.get(self.original(tx_hash))
+            if entry is None or entry['gave_up']:
+                continue
+            if entry['sent_block'] is None:
+                # the block in which tracking started, it's close enough to the block of sending
+                entry['sent_block'] = block_number
+            address = entry['sender'].address
+            if address not in lowest or entry['tx']['nonce'] < lowest[address]['tx']['nonce']:
+                if address in lowest:
+                    # a transaction waiting for a lower nonce isn't stuck, its time counts from now
+                    lowest[address]['sent_block'] = block_number
+                lowest[address] = entry
+            else:
+                entry['sent_block'] = block_number
+
+        for entry in lowest.values():
+            if block_number - entry['sent_block'] < self.replace_after_blocks:
+                continue
+            sender = entry['sender']
+            try:
+                new_hash = self._replace(entry)
+            except Exception as e:
+                if 'already known' in str(e) or 'nonce too low' in str(e):
+                    # the previous transaction is being mined, it will show up in the next blocks
+                    continue
+                entry['gave_up'] = True
+                info_msg = f'Transaction {entry["hashes"][-1]} from ({sender.id}) {sender.address[:6]}... '\
+                           f'with nonce {entry["tx"]["nonce"]} is stuck and can\'t be replaced: {e}'
+                print(info_msg)
+                if config.LOGGING == True:
+                    config.logger.info(info_msg)
+                continue
+            entry['sent_block'] = block_number
+            with self._lock:
+                self.originals[new_hash] = entry['hashes'][0]
+            replacements[new_hash] = entry['hashes'][0]
+            if config.LOGGING == True:
+                config.logger.event('replace', account=sender.id, address=sender.address, nonce=entry['tx']['nonce'],
+                                    hash=entry['hashes'][-2], replacement=new_hash,
+                                    max_fee_per_gas=entry['tx']['maxFeePerGas'])
+        return replacements
+
+
+# transactions are tracked per chain, the same (sender, nonce) can be pending on many chains
+tx_replacer = PerChain(TxReplacer)
@@ -0,0 +1,57 @@
+"""This file contains functions for sending JSON-RPC requests in batches,
+web3.py sends every request separately.
+"""
+
+import itertools
+import time
+
+from collections import Counter
+from typing import Any, List, Tuple
+
+from requests import HTTPError
+
+from src.metrics import rpc_metrics
+from settings import config, RPC_BATCH_SIZE, HEDGED_METHODS
+
+
+request_ids = itertools.count()
+
+
+def batch_request(calls: List[Tuple[str, list]],
+                  batch_size: int = RPC_BATCH_SIZE,
+                  raise_errors: bool = True) -> List[Any]:
+    """Sends calls in JSON-RPC batches of at most batch_size requests through the provider pool.
+    Batches of HEDGED_METHODS only can be hedged, batches with transactions are broadcast to all endpoints.
+    Returns raw results in the same order as calls, raises ValueError if any request failed.
+    With raise_errors=False the ValueError is returned in place of the result of failed request.
+
+    Examples:
+    >>> batch_request([('eth_getBalance', [address, 'latest']), ('eth_blockNumber', [])])
+    """
+    results = []
+    for i in range(0, len(calls), batch_size):
+        payload = [{'jsonrpc': '2.0', 'method': method, 'params': params, 'id': next(request_ids)}
+                   for method, params in calls[i:i + batch_size]]
+        calls_count = Counter(request['method'] for request in payload)
+        start = time.perf_counter()
+        try:
+            response_json = config.provider_pool.request(payload, hedge=set(calls_count) <= set(HEDGED_METHODS))
+        except Exception as e:
+            rate_limited = isinstance(e, HTTPError) and e.response is not None and e.response.status_code == 429
+            rpc_metrics.observe('batch', time.perf_counter() - start, calls_count, len(payload), rate_limited)
+            raise
+        if not isinstance(response_json, list):
+            rpc_metrics.observe('batch', time.perf_counter() - start, calls_count, len(payload))
+            # some providers reply with a single error object when the whole batch is rejected
+            raise ValueError(response_json.get('error', response_json))
+        rpc_metrics.observe('batch', time.perf_counter() - start, calls_count,
+                            sum('error' in item for item in response_json))
+
+        # responses in a batch can come in any order
+        responses = {item['id']: item for item in response_json}
+        for request in payload:
+            item = responses[request['id']]
+            if 'error' in item and raise_errors:
+                raise ValueError(item['error'])
+            results.append(ValueError(item['error']) if 'error' in item else item['result'])
+    return results
@@ -0,0 +1,189 @@
+"""This file contains the transaction scheduler, which runs transactions as a dependency graph.
+Every step is sent as soon as the steps it depends on are confirmed, so independent chains of transactions
+(e.g. fund -> mixing hops -> mint -> send back of every derived account) don't wait for each other.
+"""
+
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from src.journal import run_journal
+from src.metrics import current_phase, phase, report_progress
+from src.receipts import ReceiptTracker, NOT_MINED
+from src.rpc import batch_request
+from settings import config, bind_context, RECEIPT_POLL_INTERVAL, RECEIPT_TIMEOUT, SCHEDULER_THREADS
+
+
+# States of a step
+WAITING, SENT, CONFIRMED, REVERTED, FAILED, SKIPPED = 'waiting', 'sent', 'confirmed', 'reverted', 'failed', 'skipped'
+FINISHED = (CONFIRMED, REVERTED, FAILED, SKIPPED)
+
+
+class TxScheduler:
+    """Sends transactions in order given by dependencies between them.
+
+    A step is an action sending one transaction and returning its hash. It is sent once all steps it depends on
+    are confirmed, or also reverted if run_on_revert=True (then also failed or skipped, when steps before them
+    were confirmed). Other steps depending on a step which failed are skipped.
+    Sent transactions and results of steps are recorded in run_journal (if it was started), under keys of steps.
+
+    Examples:
+    >>> scheduler = TxScheduler()
+    >>> fund = scheduler.add('fund 1', partial(send_tx, master_account, accounts[0], amount))
+    >>> mint = scheduler.add('mint 1', partial(contract_write, accounts[0], 'mint', None, price), [fund])
+    >>> scheduler.add('send back 1', partial(send_all, accounts[0], master_account), [mint], run_on_revert=True)
+    >>> results = scheduler.run()
+    """
+    def __init__(self,
+                 timeout: float = RECEIPT_TIMEOUT,
+                 poll_interval: float = RECEIPT_POLL_INTERVAL):
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.steps: Dict[str, Dict] = {}
+
+    def add(self,
+            key: str,
+            action: Callable[[], str],
+            depends_on: List[str] = None,
+            run_on_revert: bool = False,
+            phase_name: str = None) -> str:
+        """Adds a step and returns its key, so it can be used in depends_on of next steps.
+        RPC calls of the step are tagged with phase_name, by default with the phase in which it was added.
+        """
+        if key in self.steps:
+            raise Exception(f'Step {key} already added')
+        for dependency in depends_on or []:
+            if dependency not in self.steps:
+                raise Exception(f'Step {key} depends on unknown step {dependency}')
+        self.steps[key] = {'action': action, 'depends_on': list(depends_on or []), 'run_on_revert': run_on_revert,
+                           'phase': phase_name or current_phase(),
+                           'state': WAITING, 'tx_hash': None, 'replacements': [], 'sent_at': None, 'result': None}
+        return key
+
+    def _passed(self, dependency: Dict) -> bool:
+        # for run_on_revert steps a failed or skipped step counts as reverted when steps before it were confirmed,
+        # e.g. a mint which wasn't sent or mined still leaves funds of the confirmed fund hop to send back
+        return dependency['state'] == REVERTED or (dependency['state'] in (FAILED, SKIPPED) and all(
+            self.steps[key]['state'] == CONFIRMED for key in dependency['depends_on']))
+
+    def _ready(self, step: Dict) -> bool:
+        return all(self.steps[dependency]['state'] == CONFIRMED
+                   or (step['run_on_revert'] and self._passed(self.steps[dependency]))
+                   for dependency in step['depends_on'])
+
+    def _blocked(self, step: Dict) -> bool:
+        return any(self.steps[dependency]['state'] in (REVERTED, FAILED, SKIPPED)
+                   and not (step['run_on_revert'] and self._passed(self.steps[dependency]))
+                   for dependency in step['depends_on'])
+
+    def _send(self, key: str) -> None:
+        step = self.steps[key]
+        try:
+            with phase(step['phase']), run_journal.step(key):
+                step['tx_hash'] = step['action']().lower()
+            step['sent_at'] = time.monotonic()
+            step['state'] = SENT
+        except Exception as e:
+            print(e)
+            step['state'] = FAILED
+            step['result'] = NOT_MINED.copy()
+
+    def _finish(self, results: Dict[str, Dict], sent: Dict[str, str]) -> None:
+        for tx_hash, result in results.items():
+            key = sent.pop(tx_hash)
+            step = self.steps[key]
+            step['result'] = result
+            step['state'] = CONFIRMED if result['status'] == 1 else REVERTED
+            run_journal.done(key, tx_hash, result)
+            if config.LOGGING == True and step['state'] == REVERTED:
+                info_msg = f'Transaction {tx_hash} reverted, steps depending on it are skipped'
+                print(info_msg)
+                config.logger.info(info_msg)
+
+    def restore(self, journaled: Dict[str, Dict]) -> None:
+        """Sets states of steps recorded in the journal of an interrupted run (see load_journal()).
+        Steps with a recorded result aren't sent again, steps which were only sent are checked when run() starts
+        and sent again if their transactions never reached the node.
+        Keys which aren't steps of this scheduler are ignored.
+        """
+        for key, record in journaled.items():
+            step = self.steps.get(key)
+            if step is None:
+                continue
+            step['tx_hash'] = record['hash']
+            if record['result'] is not None:
+                step['result'] = record['result']
+                step['state'] = CONFIRMED if record['result']['status'] == 1 else REVERTED
+            else:
+                step['replacements'] = list(record['replacements'])
+                step['sent_at'] = time.monotonic()
+                step['state'] = SENT
+
+    def _track_restored(self, tracker: ReceiptTracker, sent: Dict[str, str]) -> None:
+        # transactions restored from the journal are checked in one batch of receipts, with their replacements
+        restored = {step['tx_hash']: key for key, step in self.steps.items() if step['state'] == SENT}
+        if not restored:
+            return
+        sent.update(restored)
+        replacements = {replacement: tx_hash for tx_hash, key in restored.items()
+                        for replacement in self.steps[key]['replacements']}
+        self._finish(tracker.add(list(restored), replacements), sent)
+        # transactions are recorded before broadcasting, those which the node doesn't know were never broadcast
+        # (or were dropped), so their steps are sent again
+        unresolved = [tx_hash for tx_hash in restored if tx_hash in sent]
+        calls = [('eth_getTransactionByHash', [tx_hash]) for original in unresolved
+                 for tx_hash in [original] + self.steps[sent[original]]['replacements']]
+        known = {call[1][0] for call, tx in zip(calls, batch_request(calls)) if tx is not None}
+        for tx_hash in unresolved:
+            step = self.steps[sent[tx_hash]]
+            if not known.intersection([tx_hash] + step['replacements']):
+                tracker.discard(tx_hash)
+                sent.pop(tx_hash)
+                step['state'] = WAITING
+                step['tx_hash'] = None
+
+    def run(self) -> Dict[str, Dict]:
+        """Runs all steps and returns their results: receipt fields of the transaction (status is None when
+        it wasn't sent or mined), its hash and the final state of the step.
+        """
+        tracker = ReceiptTracker()
+        sent: Dict[str, str] = {}  # hash of transaction in flight -> key of its step
+        self._track_restored(tracker, sent)
+        with ThreadPoolExecutor(max_workers=SCHEDULER_THREADS) as executor:
+            while True:
+                # skipping one step can block steps depending on it, so it's repeated until nothing changes
+                skipped = True
+                while skipped:
+                    skipped = False
+                    for step in self.steps.values():
+                        if step['state'] == WAITING and self._blocked(step):
+                            step['state'] = SKIPPED
+                            step['result'] = NOT_MINED.copy()
+                            skipped = True
+
+                report_progress(steps=dict(Counter(step['state'] for step in self.steps.values())))
+                ready = [key for key, step in self.steps.items() if step['state'] == WAITING and self._ready(step)]
+                list(executor.map(bind_context(self._send), ready))
+                new_hashes = {self.steps[key]['tx_hash']: key for key in ready if self.steps[key]['state'] == SENT}
+                sent.update(new_hashes)
+                self._finish(tracker.add(list(new_hashes)), sent)
+                if any(self.steps[key]['state'] in FINISHED for key in ready):
+                    continue  # steps sent and mined immediately can release next ones right away
+                if not sent:
+                    break
+
+                time.sleep(self.poll_interval)
+                self._finish(tracker.poll(), sent)
+                for tx_hash, key in list(sent.items()):
+                    step = self.steps[key]
+                    if time.monotonic() - step['sent_at'] > self.timeout:
+                        tracker.discard(tx_hash)
+                        sent.pop(tx_hash)
+                        step['state'] = FAILED
+                        step['result'] = NOT_MINED.copy()
+
+        report_progress(steps=dict(Counter(step['state'] for step in self.steps.values())))
+        return {key: {**step['result'], 'tx_hash': step['tx_hash'], 'state': step['state']}
+                for key, step in self.steps.items()}
@@ -0,0 +1,60 @@
+"""This file contains decoding of revert reasons returned by simulated contract calls (eth_call).
+Reverts with a message (Error(string)), failed assertions (Panic(uint256)) and custom errors from the ABI are decoded.
+"""
+
+from typing import Dict, Union
+
+from eth_abi import decode_abi, decode_single
+from eth_utils import function_abi_to_4byte_selector
+
+
+ERROR_SELECTOR = '0x08c379a0'  # Error(string), e.g. require(supply < MAX_SUPPLY, "Sold out")
+PANIC_SELECTOR = '0x4e487b71'  # Panic(uint256), e.g. failed assert or arithmetic overflow
+PANIC_CODES = {0x01: 'assertion failed', 0x11: 'arithmetic overflow or underflow', 0x12: 'division by zero',
+               0x21: 'invalid enum value', 0x22: 'invalid storage byte array', 0x31: 'pop on empty array',
+               0x32: 'array index out of bounds', 0x41: 'out of memory', 0x51: 'call to invalid function'}
+
+
+def is_revert(error: Union[Dict, str]) -> bool:
+    """Checks if JSON-RPC error means that the call reverted, not e.g. that the provider rejected the request.
+    """
+    if not isinstance(error, dict):
+        return 'revert' in str(error).lower()
+    return error.get('code') == 3 or 'revert' in str(error.get('message', '')).lower()
+
+
+def decode_revert_reason(error: Union[Dict, str],
+                         contract_abi: list = None) -> str:
+    """Returns readable reason of reverted call from its JSON-RPC error.
+    Custom errors are decoded when they are in contract_abi.
+
+    Examples:
+    >>> decode_revert_reason({'code': 3, 'message': 'execution reverted: Sold out', 'data': '0x08c379a0...'})
+    'Sold out'
+    >>> decode_revert_reason({'code': 3, 'message': 'execution reverted', 'data': '0x4e487b71...11'})
+    'Panic: arithmetic overflow or underflow'
+    """
+    if not isinstance(error, dict):
+        return str(error)
+    data = error.get('data')
+    if isinstance(data, dict):
+        # some nodes (e.g. Ganache, Hardhat) nest the revert data
+        data = data.get('data') or data.get('result')
+    if not isinstance(data, str) or len(data) < 10:
+        return error.get('message', 'execution reverted')
+
+    selector, payload = data[:10].lower(), bytes.fromhex(data[10:])
+    try:
+        if selector == ERROR_SELECTOR:
+            return decode_single('string', payload)
+        if selector == PANIC_SELECTOR:
+            code = decode_single('uint256', payload)
+            return f'Panic: {PANIC_CODES.get(code, hex(code))}'
+        for item in contract_abi or []:
+            if item.get('type') == 'error' and '0x' + function_abi_to_4byte_selector(item).hex() == selector:
+                types = [argument['type'] for argument in item.get('inputs', [])]
+                args = decode_abi(types, payload) if types else ()
+                return f'{item["name"]}({", ".join(str(arg) for arg in args)})'
+    except Exception as e:
+        print(e)
+    return f'{error.get("message", "execution reverted")} (data: {data})'
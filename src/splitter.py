@@ -2,110 +2,166 @@
 supports one to many, many to many, many to one.
 """
 
-from typing import List
+import time
+
+from typing import Dict, List
 
 from src.accounts import AccountExt
-from settings import w3, CHAIN_ID, DEFAULT_GAS, logger, LOGGING
+from src.gas import gas_oracle
+from src.journal import run_journal
+from src.nonces import nonce_manager
+from src.receipts import wait_for_receipts, display_receipts
+from src.replacements import tx_replacer
+from src.state import account_states
+from settings import config, DEFAULT_GAS
 
 
-def send_tx(sender: AccountExt,
-            receiver: AccountExt,
-            amount: int,
-            gas_price: int = None,
-            nonce: int = None):
-    """Examples:
-    >>> send_tx(sender_account, receiver_account, sender_account.get_balance())
+def build_tx(receiver: AccountExt,
+             amount: int,
+             fees: Dict[str, int],
+             nonce: int) -> dict:
+    """Returns unsigned EIP-1559 transaction sending amount to receiver, fees come from gas_oracle.
     """
-    if nonce is None:
-        nonce = sender.get_nonce()
-    if gas_price is None:
-        gas_price = w3.eth.gas_price
-    tx = {
+    return {
         'to': receiver.address,
         'value': int(amount),
         'nonce': nonce,
         'gas': DEFAULT_GAS,
-        'gasPrice': gas_price,
-        'chainId': CHAIN_ID
+        'maxFeePerGas': fees['maxFeePerGas'],
+        'maxPriorityFeePerGas': fees['maxPriorityFeePerGas'],
+        'chainId': config.CHAIN_ID
     }
-    signed_tx = w3.eth.account.sign_transaction(tx, sender.privateKey.hex())
-    tx_hash = w3.eth.send_raw_transaction(signed_tx.rawTransaction).hex()
+
+
+def send_tx(sender: AccountExt,
+            receiver: AccountExt,
+            amount: int,
+            fees: Dict[str, int] = None,
+            nonce: int = None,
+            sweep: bool = False):
+    """sweep=True means that amount is the whole balance, replacements of stuck transaction then send less.
+
+    Examples:
+    >>> send_tx(sender_account, receiver_account, int(0.01 * 10 ** 18))
+    >>> send_tx(sender_account, receiver_account, int(0.01 * 10 ** 18), gas_oracle.fees('fast'))
+    """
+    if fees is None:
+        fees = gas_oracle.fees()
+    start = time.perf_counter()
+    managed_nonce = nonce is None
+    if managed_nonce:
+        nonce = nonce_manager.next_nonce(sender.address)
+    try:
+        tx = build_tx(receiver, amount, fees, nonce)
+        signed_tx = config.w3.eth.account.sign_transaction(tx, sender.privateKey.hex())
+        # recorded before broadcasting, so a transaction broadcast right before a crash is still in the journal
+        run_journal.sent(sender.address, tx, signed_tx.hash.hex())
+        tx_hash = config.w3.eth.send_raw_transaction(signed_tx.rawTransaction).hex()
+    except Exception as e:
+        if managed_nonce:
+            nonce_manager.failed(sender.address, nonce, e)
+        raise
+    tx_replacer.register(sender, tx, tx_hash, sweep)
+    account_states.sent(sender.address, tx, tx_hash)
+    if config.LOGGING == True:
+        config.logger.event('send', account=sender.id, address=sender.address, receiver_account=receiver.id,
+                            receiver=receiver.address, amount=int(amount), nonce=nonce, hash=tx_hash,
+                            duration=time.perf_counter() - start)
     return tx_hash
 
 
+def send_all(sender: AccountExt,
+             receiver: AccountExt) -> str:
+    """Sends the whole balance of sender to receiver.
+
+    Examples:
+    >>> send_all(accounts[0], master_account)
+    """
+    # the whole balance is sent, so the fee has to be exact
+    fees = gas_oracle.sweep_fees()
+    amount = account_states.get_balance(sender) - DEFAULT_GAS * fees['maxFeePerGas']
+    return send_tx(sender, receiver, amount, fees, sweep=True)
+
+
 def send_one_to_many(master_account: AccountExt,
                      accounts: List[AccountExt],
-                     amount: int):
-    """Examples:
+                     amount: int,
+                     wait: bool = True) -> List[str]:
+    """Returns hashes of sent transactions. With wait=True also waits for all of them and displays failures.
+
+    Examples:
     >>> send_one_to_many(master_account, accounts, int(0.01 * 10 ** 18))
     """
-    master_account_balance = master_account.get_balance()
-    required_balance_estimation = len(accounts) * (DEFAULT_GAS * w3.eth.gas_price + amount)
+    master_account_state = account_states.get_states([master_account])[master_account.address]
+    master_account_balance = master_account_state['balance']
+    fees = gas_oracle.fees()
+    required_balance_estimation = len(accounts) * (DEFAULT_GAS * fees['maxFeePerGas'] + amount)
     if master_account_balance < required_balance_estimation:
         raise Exception(f'Inufficient funds! master_account: '
                         f'{master_account_balance / 10 ** 18}, required: {required_balance_estimation / 10 ** 18}')
 
-    gas_price = w3.eth.gas_price
-    nonce = master_account.get_nonce()
+    nonce_manager.seed(master_account.address, master_account_state['nonce'])
+    tx_hashes = []
     for account in accounts:
         try:
-            last_tx_hash = send_tx(master_account, account, amount, gas_price, nonce)
-            nonce += 1
-            if LOGGING == True:
-                info_msg = f'Sending {amount / 10 ** 18} from ({master_account.id}) {master_account.address[:6]}... '\
-                           f'to ({account.id}) {account.address[:6]}... in {last_tx_hash}'
-                print(info_msg)
-                logger.info(info_msg)
+            tx_hashes.append(send_tx(master_account, account, amount, fees))
         except Exception as e:
             print(e)
-    w3.eth.wait_for_transaction_receipt(last_tx_hash, timeout=10)
+    if wait:
+        display_receipts(wait_for_receipts(tx_hashes))
+    return tx_hashes
 
 
 def send_many_to_one(accounts: List[AccountExt],
-                     master_account: AccountExt):
-    """Examples:
+                     master_account: AccountExt,
+                     wait: bool = True) -> List[str]:
+    """Returns hashes of sent transactions. With wait=True also waits for all of them and displays failures.
+
+    Examples:
     >>> send_many_to_one(accounts_part_2, master_account)
     """
-    old_balances = {account.address: account.get_balance() for account in accounts}
-    gas_price = w3.eth.gas_price
-    tx_fee = DEFAULT_GAS * gas_price
-    available_balances = {account.address: old_balances[account.address] - tx_fee for account in accounts}
+    states = account_states.get_states(accounts)
+    # the whole balance is sent, so the fee has to be exact
+    fees = gas_oracle.sweep_fees()
+    tx_fee = DEFAULT_GAS * fees['maxFeePerGas']
+    available_balances = {account.address: states[account.address]['balance'] - tx_fee for account in accounts}
 
+    tx_hashes = []
     for account in accounts:
-        nonce = account.get_nonce()
+        nonce_manager.seed(account.address, states[account.address]['nonce'])
         try:
-            last_tx_hash = send_tx(account, master_account, available_balances[account.address], gas_price, nonce)
-            if LOGGING == True:
-                info_msg = f'Sending {available_balances[account.address] / 10 ** 18} from ({account.id}) '\
-                           f'{account.address[:6]}... to ({master_account.id}) {master_account.address[:6]}... in {last_tx_hash}'
-                print(info_msg)
-                logger.info(info_msg)
+            tx_hashes.append(send_tx(account, master_account, available_balances[account.address], fees, sweep=True))
         except Exception as e:
             print(e)
-    w3.eth.wait_for_transaction_receipt(last_tx_hash, timeout=10)
+    if wait:
+        display_receipts(wait_for_receipts(tx_hashes))
+    return tx_hashes
 
 
 def send_many_to_many(senders_accounts: List[AccountExt],
-                      receivers_accounts: List[AccountExt]):
-    """Examples:
+                      receivers_accounts: List[AccountExt],
+                      wait: bool = True) -> List[str]:
+    """Returns hashes of sent transactions. With wait=True also waits for all of them and displays failures.
+
+    Examples:
     >>> send_many_to_many(accounts_part_1, accounts_part_2)
     """
     if len(senders_accounts) != len(receivers_accounts):
         raise Exception('Number of senders must be equal to number of receivers')
-    old_balances = {sender_account.address: sender_account.get_balance() for sender_account in senders_accounts}
-    gas_price = w3.eth.gas_price
-    tx_fee = DEFAULT_GAS * gas_price
-    available_balances = {sender_account.address: old_balances[sender_account.address] - tx_fee for sender_account in senders_accounts}
+    states = account_states.get_states(senders_accounts)
+    # the whole balance is sent, so the fee has to be exact
+    fees = gas_oracle.sweep_fees()
+    tx_fee = DEFAULT_GAS * fees['maxFeePerGas']
+    available_balances = {sender_account.address: states[sender_account.address]['balance'] - tx_fee for sender_account in senders_accounts}
 
+    tx_hashes = []
     for sender_account, receiver_account in zip(senders_accounts, receivers_accounts):
-        nonce = sender_account.get_nonce()
+        nonce_manager.seed(sender_account.address, states[sender_account.address]['nonce'])
         try:
-            last_tx_hash = send_tx(sender_account, receiver_account, available_balances[sender_account.address], gas_price, nonce)
-            if LOGGING == True:
-                info_msg = f'Sending {available_balances[sender_account.address] / 10 ** 18} from ({sender_account.id}) '\
-                           f'{sender_account.address[:6]}... to ({receiver_account.id}) {receiver_account.address[:6]}... in {last_tx_hash}'
-                print(info_msg)
-                logger.info(info_msg)
+            tx_hashes.append(send_tx(sender_account, receiver_account, available_balances[sender_account.address],
+                                     fees, sweep=True))
         except Exception as e:
             print(e)
-    w3.eth.wait_for_transaction_receipt(last_tx_hash, timeout=10)
+    if wait:
+        display_receipts(wait_for_receipts(tx_hashes))
+    return tx_hashes
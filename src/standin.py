@@ -0,0 +1,562 @@
+"""This file contains a local stand-in for the blockchain, used by benchmark.py.
+It is an in-process JSON-RPC server which keeps balances and nonces, accepts signed transactions,
+mines them in blocks every block_time seconds and emulates a simple NFT contract with payable mint() and mint(quantity),
+transferFrom() and tokenOfOwnerByIndex(), with Transfer events returned by eth_getLogs.
+Latency can be added to every HTTP request to emulate a remote provider.
+"""
+
+import json
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import rlp
+
+from eth_abi import encode_single
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_account._utils.typed_transactions import TypedTransaction
+from eth_utils import function_signature_to_4byte_selector, keccak, to_checksum_address
+from hexbytes import HexBytes
+
+
+# ABI of the emulated contract, mint() is payable and requires at least the mint price,
+# mint(quantity) mints up to MAX_MINT_AMOUNT_PER_TX tokens for quantity times the mint price,
+# both revert while saleActive() is false. Minted and transferred tokens emit ERC-721 Transfer events
+STANDIN_ABI = [
+    {'inputs': [], 'name': 'mint', 'outputs': [], 'stateMutability': 'payable', 'type': 'function'},
+    {'inputs': [{'internalType': 'uint256', 'name': '_mintAmount', 'type': 'uint256'}], 'name': 'mint',
+     'outputs': [], 'stateMutability': 'payable', 'type': 'function'},
+    {'inputs': [], 'name': 'saleActive', 'outputs': [{'internalType': 'bool', 'name': '', 'type': 'bool'}],
+     'stateMutability': 'view', 'type': 'function'},
+    {'inputs': [], 'name': 'maxMintAmountPerTx',
+     'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view',
+     'type': 'function'},
+    {'inputs': [], 'name': 'totalSupply', 'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}],
+     'stateMutability': 'view', 'type': 'function'},
+    {'inputs': [{'internalType': 'address', 'name': 'owner', 'type': 'address'}], 'name': 'balanceOf',
+     'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view',
+     'type': 'function'},
+    {'inputs': [{'internalType': 'uint256', 'name': 'tokenId', 'type': 'uint256'}], 'name': 'ownerOf',
+     'outputs': [{'internalType': 'address', 'name': '', 'type': 'address'}], 'stateMutability': 'view',
+     'type': 'function'},
+    {'inputs': [{'internalType': 'address', 'name': 'owner', 'type': 'address'},
+                {'internalType': 'uint256', 'name': 'index', 'type': 'uint256'}], 'name': 'tokenOfOwnerByIndex',
+     'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}], 'stateMutability': 'view',
+     'type': 'function'},
+    {'inputs': [{'internalType': 'address', 'name': 'from', 'type': 'address'},
+                {'internalType': 'address', 'name': 'to', 'type': 'address'},
+                {'internalType': 'uint256', 'name': 'tokenId', 'type': 'uint256'}], 'name': 'transferFrom',
+     'outputs': [], 'stateMutability': 'nonpayable', 'type': 'function'},
+    {'anonymous': False, 'name': 'Transfer', 'type': 'event',
+     'inputs': [{'indexed': True, 'internalType': 'address', 'name': 'from', 'type': 'address'},
+                {'indexed': True, 'internalType': 'address', 'name': 'to', 'type': 'address'},
+                {'indexed': True, 'internalType': 'uint256', 'name': 'tokenId', 'type': 'uint256'}]},
+]
+STANDIN_CONTRACT_ADDRESS = to_checksum_address('0x00000000000000000000000000000000000a11ce')
+
+MINT_SELECTOR = function_signature_to_4byte_selector('mint()')
+MINT_AMOUNT_SELECTOR = function_signature_to_4byte_selector('mint(uint256)')
+MAX_MINT_AMOUNT_PER_TX_SELECTOR = function_signature_to_4byte_selector('maxMintAmountPerTx()')
+SALE_ACTIVE_SELECTOR = function_signature_to_4byte_selector('saleActive()')
+TOTAL_SUPPLY_SELECTOR = function_signature_to_4byte_selector('totalSupply()')
+BALANCE_OF_SELECTOR = function_signature_to_4byte_selector('balanceOf(address)')
+OWNER_OF_SELECTOR = function_signature_to_4byte_selector('ownerOf(uint256)')
+TOKEN_OF_OWNER_BY_INDEX_SELECTOR = function_signature_to_4byte_selector('tokenOfOwnerByIndex(address,uint256)')
+TRANSFER_FROM_SELECTOR = function_signature_to_4byte_selector('transferFrom(address,address,uint256)')
+TRANSFER_TOPIC = '0x' + keccak(text='Transfer(address,address,uint256)').hex()
+
+TRANSFER_GAS = 21000
+MINT_GAS = 90000
+# like ERC721A, every next token minted in the same transaction is much cheaper
+NEXT_TOKEN_MINT_GAS = 2500
+MAX_MINT_AMOUNT_PER_TX = 10
+REVERTED_MINT_GAS = 30000
+TRANSFER_FROM_GAS = 50000
+BASE_FEE = 10 ** 9
+DEFAULT_PRIORITY_FEE = 10 ** 9
+
+
+class RpcError(Exception):
+    def __init__(self, message: str, code: int = -32000, data: str = None):
+        super().__init__(message)
+        self.code = code
+        self.data = data
+
+
+def decode_raw_transaction(raw_tx: bytes) -> Dict:
+    """Returns fields of signed transaction (EIP-1559 or legacy) with sender in 'from' and hash in 'hash'.
+    """
+    if raw_tx[0] <= 0x7f:
+        tx = TypedTransaction.from_bytes(HexBytes(raw_tx)).as_dict()
+        tx['to'] = to_checksum_address(tx['to']) if tx['to'] else None
+    else:
+        tx = rlp.decode(raw_tx, Transaction).as_dict()
+        tx['to'] = to_checksum_address(tx['to']) if tx['to'] else None
+        tx['maxFeePerGas'] = tx['maxPriorityFeePerGas'] = tx['gasPrice']
+        # chain ID is encoded in v since EIP-155
+        tx['chainId'] = (tx['v'] - 35) // 2 if tx['v'] >= 35 else None
+    tx['from'] = Account.recover_transaction(raw_tx)
+    tx['hash'] = '0x' + keccak(raw_tx).hex()
+    return tx
+
+
+class StandInChain:
+    """State of the emulated chain. All methods are called with the lock held by the server.
+    """
+    def __init__(self,
+                 chain_id: int,
+                 genesis_balances: Dict[str, int],
+                 mint_price: int,
+                 contract_address: str = STANDIN_CONTRACT_ADDRESS,
+                 max_logs_block_range: int = None):
+        self.chain_id = chain_id
+        self.genesis_balances = dict(genesis_balances)
+        self.mint_price = mint_price
+        self.contract_address = to_checksum_address(contract_address)
+        # like providers limiting eth_getLogs, None means no limit
+        self.max_logs_block_range = max_logs_block_range
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Returns the chain to its genesis state.
+        """
+        self.balances = Counter({address.lower(): balance for address, balance in self.genesis_balances.items()})
+        self.nonces = Counter()
+        self.mempool: Dict[str, Dict[int, Dict]] = {}  # sender -> nonce -> transaction
+        self.transactions: Dict[str, Dict] = {}
+        self.receipts: Dict[str, Dict] = {}
+        self.token_owners: Dict[int, str] = {}
+        self.token_balances = Counter()
+        self.logs: List[Dict] = []
+        self.sale_active = True
+        # transactions with lower maxFeePerGas stay in the mempool, raise it to emulate a fee spike
+        self.base_fee = BASE_FEE
+        self.blocks = [{'number': 0, 'timestamp': int(time.time()), 'transactions': [], 'rewards': [],
+                        'balances_before': {}}]
+
+    # ================== state ==================
+    def balance_at(self, address: str, number: int) -> int:
+        """Balance after block number, earlier balances are restored from values changed by later blocks.
+        """
+        balance = self.balances[address]
+        for block in reversed(self.blocks[number + 1:]):
+            balance = block['balances_before'].get(address, balance)
+        return balance
+
+    def pending_nonce(self, address: str) -> int:
+        nonce = self.nonces[address]
+        while nonce in self.mempool.get(address, {}):
+            nonce += 1
+        return nonce
+
+    def send_raw_transaction(self, raw_tx: bytes) -> str:
+        tx = decode_raw_transaction(raw_tx)
+        sender = tx['from'].lower()
+        if tx['hash'] in self.transactions:
+            raise RpcError('already known')
+        if tx['chainId'] != self.chain_id:
+            raise RpcError('invalid chain id')
+        if tx['nonce'] < self.nonces[sender]:
+            raise RpcError('nonce too low')
+        if tx['maxFeePerGas'] < BASE_FEE:
+            raise RpcError('max fee per gas less than block base fee')
+        if self.balances[sender] < tx['gas'] * tx['maxFeePerGas'] + tx['value']:
+            raise RpcError('insufficient funds for gas * price + value')
+        replaced = self.mempool.get(sender, {}).get(tx['nonce'])
+        if replaced is not None:
+            # like geth, a replacement has to raise both fees by at least 10%
+            if tx['maxFeePerGas'] * 10 < replaced['maxFeePerGas'] * 11 or \
+                    tx['maxPriorityFeePerGas'] * 10 < replaced['maxPriorityFeePerGas'] * 11:
+                raise RpcError('replacement transaction underpriced')
+            del self.transactions[replaced['hash']]
+        self.mempool.setdefault(sender, {})[tx['nonce']] = tx
+        self.transactions[tx['hash']] = tx
+        return tx['hash']
+
+    def _execute(self, tx: Dict) -> Dict:
+        sender = tx['from'].lower()
+        effective_gas_price = min(tx['maxFeePerGas'], self.base_fee + tx['maxPriorityFeePerGas'])
+        data = bytes(tx['data'])
+        status, gas_used, transfers = 1, TRANSFER_GAS, []
+        if tx['to'] == self.contract_address and data[:4] == TRANSFER_FROM_SELECTOR:
+            owner, receiver = '0x' + data[16:36].hex(), '0x' + data[48:68].hex()
+            token_id = int.from_bytes(data[68:100], 'big')
+            if self.token_owners.get(token_id) == owner == sender:
+                gas_used = TRANSFER_FROM_GAS
+                self.token_owners[token_id] = receiver
+                self.token_balances[owner] -= 1
+                self.token_balances[receiver] += 1
+                transfers.append((owner, receiver, token_id))
+            else:
+                status, gas_used = 0, REVERTED_MINT_GAS
+        elif tx['to'] == self.contract_address:
+            quantity = self._mint_quantity(data)
+            if quantity and self.sale_active and tx['value'] >= quantity * self.mint_price:
+                gas_used = MINT_GAS + (quantity - 1) * NEXT_TOKEN_MINT_GAS
+                for _ in range(quantity):
+                    token_id = len(self.token_owners)
+                    self.token_owners[token_id] = sender
+                    self.token_balances[sender] += 1
+                    transfers.append(('0x' + '00' * 20, sender, token_id))
+            else:
+                status, gas_used = 0, REVERTED_MINT_GAS
+        gas_used = min(gas_used, tx['gas'])
+        self.balances[sender] -= gas_used * effective_gas_price
+        if status == 1:
+            self.balances[sender] -= tx['value']
+            if tx['to'] != self.contract_address:
+                self.balances[tx['to'].lower()] += tx['value']
+        self.nonces[sender] += 1
+        return {'status': status, 'gasUsed': gas_used, 'effectiveGasPrice': effective_gas_price,
+                'transfers': transfers}
+
+    def mine_block(self) -> None:
+        """Includes all executable transactions from the mempool in a new block.
+        """
+        block = {'number': len(self.blocks), 'timestamp': int(time.time()), 'transactions': [], 'rewards': [],
+                 'balances_before': {}, 'logs': 0}
+        for sender in list(self.mempool):
+            queue = self.mempool[sender]
+            while self.nonces[sender] in queue:
+                tx = queue[self.nonces[sender]]
+                if self.balances[sender] < tx['gas'] * tx['maxFeePerGas'] + tx['value'] \
+                        or tx['maxFeePerGas'] < self.base_fee:
+                    break
+                del queue[self.nonces[sender]]
+                for address in (sender, tx['to'].lower()):
+                    block['balances_before'].setdefault(address, self.balances[address])
+                result = self._execute(tx)
+                logs = [{'address': self.contract_address,
+                         'topics': [TRANSFER_TOPIC, self.address_topic(owner), self.address_topic(receiver),
+                                    '0x' + encode_single('uint256', token_id).hex()],
+                         'data': '0x',
+                         'blockNumber': hex(block['number']),
+                         'blockHash': self.block_hash(block['number']),
+                         'transactionHash': tx['hash'],
+                         'transactionIndex': hex(len(block['transactions'])),
+                         'logIndex': hex(block['logs'] + i),
+                         'removed': False} for i, (owner, receiver, token_id) in enumerate(result['transfers'])]
+                block['logs'] += len(logs)
+                self.logs += logs
+                self.receipts[tx['hash']] = {
+                    'transactionHash': tx['hash'],
+                    'transactionIndex': hex(len(block['transactions'])),
+                    'blockNumber': hex(block['number']),
+                    'blockHash': self.block_hash(block['number']),
+                    'from': tx['from'],
+                    'to': tx['to'],
+                    'status': hex(result['status']),
+                    'gasUsed': hex(result['gasUsed']),
+                    'cumulativeGasUsed': hex(result['gasUsed']),
+                    'effectiveGasPrice': hex(result['effectiveGasPrice']),
+                    'contractAddress': None,
+                    'logs': logs,
+                    'logsBloom': '0x' + '00' * 256,
+                    'type': '0x2',
+                }
+                block['transactions'].append(tx['hash'])
+                block['rewards'].append(result['effectiveGasPrice'] - self.base_fee)
+            if not queue:
+                del self.mempool[sender]
+        self.blocks.append(block)
+
+    @staticmethod
+    def address_topic(address: str) -> str:
+        return '0x' + '00' * 12 + address[2:].lower()
+
+    @staticmethod
+    def block_hash(number: int) -> str:
+        return '0x' + keccak(number.to_bytes(32, 'big')).hex()
+
+    def block_number(self, block: str) -> int:
+        if block in ('latest', 'pending', 'safe', 'finalized'):
+            return len(self.blocks) - 1
+        if block == 'earliest':
+            return 0
+        return int(block, 16)
+
+    def format_block(self, number: int) -> Dict:
+        block = self.blocks[number]
+        return {'number': hex(number),
+                'hash': self.block_hash(number),
+                'parentHash': self.block_hash(number - 1) if number > 0 else '0x' + '00' * 32,
+                'timestamp': hex(block['timestamp']),
+                'baseFeePerGas': hex(self.base_fee),
+                'gasLimit': hex(30000000),
+                'gasUsed': hex(sum(int(self.receipts[tx_hash]['gasUsed'], 16) for tx_hash in block['transactions'])),
+                'miner': '0x' + '00' * 20,
+                'transactions': list(block['transactions'])}
+
+    # ================== contract ==================
+    @staticmethod
+    def _mint_quantity(data: bytes) -> int:
+        """Returns number of tokens minted by the call, 0 if it isn't a valid mint.
+        """
+        if data[:4] == MINT_SELECTOR:
+            return 1
+        if data[:4] == MINT_AMOUNT_SELECTOR and len(data) >= 36:
+            quantity = int.from_bytes(data[4:36], 'big')
+            return quantity if 0 < quantity <= MAX_MINT_AMOUNT_PER_TX else 0
+        return 0
+
+    def call(self, tx: Dict) -> str:
+        data = bytes.fromhex(tx.get('data', tx.get('input', '0x'))[2:])
+        if tx.get('to') is None or to_checksum_address(tx['to']) != self.contract_address:
+            return '0x'
+        selector, args = data[:4], data[4:]
+        if selector in (MINT_SELECTOR, MINT_AMOUNT_SELECTOR):
+            quantity = self._mint_quantity(data)
+            if not quantity:
+                raise RpcError('execution reverted: Invalid mint amount', 3,
+                               '0x08c379a0' + encode_single('string', 'Invalid mint amount').hex())
+            if not self.sale_active:
+                raise RpcError('execution reverted: Sale is not active', 3,
+                               '0x08c379a0' + encode_single('string', 'Sale is not active').hex())
+            if int(tx.get('value', '0x0'), 16) < quantity * self.mint_price:
+                raise RpcError('execution reverted: Not enough ETH sent', 3,
+                               '0x08c379a0' + encode_single('string', 'Not enough ETH sent').hex())
+            return '0x'
+        if selector == SALE_ACTIVE_SELECTOR:
+            return '0x' + encode_single('bool', self.sale_active).hex()
+        if selector == MAX_MINT_AMOUNT_PER_TX_SELECTOR:
+            return '0x' + encode_single('uint256', MAX_MINT_AMOUNT_PER_TX).hex()
+        if selector == TOTAL_SUPPLY_SELECTOR:
+            return '0x' + encode_single('uint256', len(self.token_owners)).hex()
+        if selector == BALANCE_OF_SELECTOR:
+            owner = '0x' + args[12:32].hex()
+            return '0x' + encode_single('uint256', self.token_balances[owner]).hex()
+        if selector == OWNER_OF_SELECTOR:
+            token_id = int.from_bytes(args[:32], 'big')
+            if token_id not in self.token_owners:
+                raise RpcError('execution reverted: Nonexistent token', 3,
+                               '0x08c379a0' + encode_single('string', 'Nonexistent token').hex())
+            return '0x' + encode_single('address', self.token_owners[token_id]).hex()
+        if selector == TOKEN_OF_OWNER_BY_INDEX_SELECTOR:
+            owner, index = '0x' + args[12:32].hex(), int.from_bytes(args[32:64], 'big')
+            tokens = sorted(token_id for token_id, token_owner in self.token_owners.items() if token_owner == owner)
+            if index >= len(tokens):
+                raise RpcError('execution reverted: Owner index out of bounds', 3,
+                               '0x08c379a0' + encode_single('string', 'Owner index out of bounds').hex())
+            return '0x' + encode_single('uint256', tokens[index]).hex()
+        if selector == TRANSFER_FROM_SELECTOR:
+            return '0x'
+        raise RpcError('execution reverted', 3, '0x')
+
+    def get_logs(self, log_filter: Dict) -> List[Dict]:
+        """Supports address and topics filters, position in topics can be None, a topic or a list of topics.
+        """
+        from_block = self.block_number(log_filter.get('fromBlock', 'latest'))
+        to_block = self.block_number(log_filter.get('toBlock', 'latest'))
+        if self.max_logs_block_range is not None and to_block - from_block + 1 > self.max_logs_block_range:
+            raise RpcError(f'query exceeds max block range {self.max_logs_block_range}', -32005)
+        addresses = log_filter.get('address')
+        addresses = None if addresses is None else \
+            {address.lower() for address in (addresses if isinstance(addresses, list) else [addresses])}
+        topics_filter = log_filter.get('topics') or []
+        logs = []
+        for log in self.logs:
+            if not from_block <= int(log['blockNumber'], 16) <= to_block:
+                continue
+            if addresses is not None and log['address'].lower() not in addresses:
+                continue
+            if all(expected is None or log['topics'][i] in (expected if isinstance(expected, list) else [expected])
+                   for i, expected in enumerate(topics_filter)):
+                logs.append(log)
+        return logs
+
+    def estimate_gas(self, tx: Dict) -> int:
+        if tx.get('to') is not None and to_checksum_address(tx['to']) == self.contract_address:
+            self.call(tx)
+            data = bytes.fromhex(tx.get('data', tx.get('input', '0x'))[2:])
+            if data[:4] == TRANSFER_FROM_SELECTOR:
+                return TRANSFER_FROM_GAS
+            return MINT_GAS + (max(1, self._mint_quantity(data)) - 1) * NEXT_TOKEN_MINT_GAS
+        return TRANSFER_GAS
+
+    def fee_history(self, block_count: int, newest_block: str, percentiles: List[float]) -> Dict:
+        newest = self.block_number(newest_block)
+        oldest = max(0, newest - block_count + 1)
+        rewards = []
+        for number in range(oldest, newest + 1):
+            block_rewards = sorted(self.blocks[number]['rewards']) or [DEFAULT_PRIORITY_FEE]
+            rewards.append([hex(block_rewards[min(len(block_rewards) - 1, int(len(block_rewards) * p / 100))])
+                            for p in percentiles])
+        return {'oldestBlock': hex(oldest),
+                'baseFeePerGas': [hex(self.base_fee)] * (newest - oldest + 2),
+                'gasUsedRatio': [0.5] * (newest - oldest + 1),
+                'reward': rewards}
+
+    # ================== JSON-RPC ==================
+    def handle(self, method: str, params: list):
+        if method == 'eth_chainId':
+            return hex(self.chain_id)
+        if method == 'net_version':
+            return str(self.chain_id)
+        if method == 'eth_blockNumber':
+            return hex(len(self.blocks) - 1)
+        if method == 'eth_gasPrice':
+            return hex(self.base_fee + DEFAULT_PRIORITY_FEE)
+        if method == 'eth_maxPriorityFeePerGas':
+            return hex(DEFAULT_PRIORITY_FEE)
+        if method == 'eth_feeHistory':
+            return self.fee_history(int(params[0], 16) if isinstance(params[0], str) else params[0],
+                                    params[1], params[2] if len(params) > 2 else [])
+        if method == 'eth_getBalance':
+            return hex(self.balance_at(params[0].lower(), self.block_number(params[1] if len(params) > 1 else 'latest')))
+        if method == 'eth_getTransactionCount':
+            address = params[0].lower()
+            return hex(self.pending_nonce(address) if params[1] == 'pending' else self.nonces[address])
+        if method == 'eth_getCode':
+            return '0x6080' if to_checksum_address(params[0]) == self.contract_address else '0x'
+        if method == 'eth_sendRawTransaction':
+            return self.send_raw_transaction(bytes.fromhex(params[0][2:]))
+        if method == 'eth_getTransactionReceipt':
+            return self.receipts.get(params[0].lower())
+        if method == 'eth_getTransactionByHash':
+            tx = self.transactions.get(params[0].lower())
+            if tx is None:
+                return None
+            receipt = self.receipts.get(tx['hash'], {})
+            return {'hash': tx['hash'], 'from': tx['from'], 'to': tx['to'], 'nonce': hex(tx['nonce']),
+                    'value': hex(tx['value']), 'blockNumber': receipt.get('blockNumber')}
+        if method == 'eth_getBlockByNumber':
+            number = self.block_number(params[0])
+            return self.format_block(number) if number < len(self.blocks) else None
+        if method == 'eth_call':
+            return self.call(params[0])
+        if method == 'eth_estimateGas':
+            return hex(self.estimate_gas(params[0]))
+        if method == 'eth_getLogs':
+            return self.get_logs(params[0])
+        raise RpcError(f'the method {method} does not exist/is not available', -32601)
+
+
+class StandInServer:
+    """Runs StandInChain behind a local HTTP JSON-RPC endpoint and mines a block every block_time seconds.
+    Counts HTTP requests and JSON-RPC calls per method. Many servers can share one chain, each with its own
+    latency, like many endpoints of one network - then only one of them should mine, others get block_time=None.
+
+    Examples:
+    >>> server = StandInServer(StandInChain(80001, {master_account.address: 10 ** 24}, 10 ** 17), block_time=1)
+    >>> server.start()
+    >>> server.url
+    'http://127.0.0.1:51234'
+    >>> server.stop()
+    """
+    def __init__(self,
+                 chain: StandInChain,
+                 block_time: float = 1,
+                 latency: float = 0,
+                 rate_limit: float = None,
+                 host: str = '127.0.0.1',
+                 port: int = 0):
+        self.chain = chain
+        self.block_time = block_time
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limited = 0
+        self._allowance = rate_limit or 0
+        self._allowance_at = time.monotonic()
+        self.http_requests = 0
+        self.rpc_calls = Counter()
+        self._stopped = threading.Event()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, with Nagle's algorithm keep-alive requests wait for ACK
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server.chain.lock:
+                    server.http_requests += 1
+                    throttled = server.throttle()
+                if throttled:
+                    self.reply(429, {'jsonrpc': '2.0', 'id': None,
+                                     'error': {'code': 429, 'message': 'Too Many Requests'}})
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+                self.reply(200, [server.dispatch(call) for call in body] if isinstance(body, list)
+                           else server.dispatch(body))
+
+            def reply(self, status, response):
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://{host}:{self.httpd.server_address[1]}'
+
+    def throttle(self) -> bool:
+        """Returns True if the request exceeds rate_limit requests per second, like providers answering HTTP 429.
+        """
+        if self.rate_limit is None:
+            return False
+        now = time.monotonic()
+        self._allowance = min(self.rate_limit, self._allowance + (now - self._allowance_at) * self.rate_limit)
+        self._allowance_at = now
+        if self._allowance < 1:
+            self.rate_limited += 1
+            return True
+        self._allowance -= 1
+        return False
+
+    def dispatch(self, call: Dict) -> Dict:
+        with self.chain.lock:
+            self.rpc_calls[call['method']] += 1
+            try:
+                return {'jsonrpc': '2.0', 'id': call.get('id'), 'result': self.chain.handle(call['method'],
+                                                                                        call.get('params', []))}
+            except RpcError as e:
+                error = {'code': e.code, 'message': str(e)}
+                if e.data is not None:
+                    error['data'] = e.data
+                return {'jsonrpc': '2.0', 'id': call.get('id'), 'error': error}
+            except Exception as e:
+                # e.g. transaction which can't be decoded
+                return {'jsonrpc': '2.0', 'id': call.get('id'), 'error': {'code': -32602, 'message': str(e)}}
+
+    def _mine(self) -> None:
+        # many servers can share one chain (e.g. to test the provider pool), only one of them mines
+        if self.block_time is None:
+            return
+        while not self._stopped.wait(self.block_time):
+            with self.chain.lock:
+                self.chain.mine_block()
+
+    def start(self) -> None:
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        threading.Thread(target=self._mine, daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset(self) -> None:
+        """Returns the chain to its genesis state and clears the counters.
+        """
+        with self.chain.lock:
+            self.chain.reset()
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        with self.chain.lock:
+            self.http_requests = 0
+            self.rate_limited = 0
+            self.rpc_calls = Counter()
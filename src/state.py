@@ -0,0 +1,171 @@
+"""This file contains the local cache of account states (balance, nonce and last seen block).
+Balances are read from the chain once and then updated from receipts of our own transactions
+(value, gasUsed and effectiveGasPrice), so displaying accounts and sending whole balances don't query them again.
+"""
+
+import threading
+import time
+
+from typing import Dict, List, Tuple
+
+from eth_account.signers.local import LocalAccount
+
+from src.rpc import batch_request
+from settings import config, STATE_RECONCILE_INTERVAL, PerChain
+
+
+class AccountStateCache:
+    """Balances and nonces of accounts, kept up to date with receipts of transactions sent by this program.
+
+    The balance of an account is read at a known block. Receipts from later blocks are applied on top of it,
+    receipts from that block or earlier ones are already included and skipped. Transactions from other programs
+    aren't seen, so states older than reconcile_interval seconds are read from the chain again.
+
+    Examples:
+    >>> states = account_states.get_states(accounts)  # reads only accounts which aren't cached yet
+    >>> account_states.sent(sender.address, tx, tx_hash)
+    >>> account_states.apply_receipt(tx_hash, receipt)  # called by ReceiptTracker
+    >>> states[accounts[0].address]['balance'], states[accounts[0].address]['nonce']
+    """
+    def __init__(self, reconcile_interval: float = STATE_RECONCILE_INTERVAL):
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self.states: Dict[str, Dict] = {}  # address -> balance, nonce, block, last_seen_block, synced_at
+        self.in_flight: Dict[Tuple[str, int], Dict[str, Dict]] = {}  # (sender, nonce) -> hash -> from, to, value
+        self.hashes: Dict[str, Tuple[str, int]] = {}  # hash -> (sender, nonce)
+
+    def _expired(self, state: Dict) -> bool:
+        return self.reconcile_interval is not None and time.monotonic() - state['synced_at'] > self.reconcile_interval
+
+    def _busy_addresses(self) -> set:
+        # addresses with transactions which are sent but not mined yet, their states are expected to change
+        return {address for txs in self.in_flight.values() for tx in txs.values()
+                for address in (tx['from'], tx['to']) if address is not None}
+
+    def load(self, addresses: List[str]) -> None:
+        """Reads balances (at the current block) and pending nonces of addresses from the chain in JSON-RPC batches.
+        Already cached states are replaced, differences are logged.
+        """
+        if not addresses:
+            return
+        # the balance is read at an explicit block, so it's known which receipts it already includes
+        block_number = config.w3.eth.block_number
+        calls = [call for address in addresses for call in (('eth_getBalance', [address, hex(block_number)]),
+                                                            ('eth_getTransactionCount', [address, 'pending']))]
+        results = iter(batch_request(calls))
+        synced_at = time.monotonic()
+        with self._lock:
+            busy = self._busy_addresses()
+            for address in addresses:
+                balance, nonce = int(next(results), 16), int(next(results), 16)
+                cached = self.states.get(address)
+                if cached is not None:
+                    if config.LOGGING == True and address not in busy and cached['balance'] != balance:
+                        info_msg = f'Cached balance of {address[:6]}... differed from the chain by '\
+                                   f'{(balance - cached["balance"]) / 10 ** 18}, reconciled'
+                        print(info_msg)
+                        config.logger.info(info_msg)
+                    # transactions sent but not mined yet may not be visible to the provider
+                    nonce = max(nonce, cached['nonce'])
+                self.states[address] = {'balance': balance, 'nonce': nonce, 'block': block_number,
+                                        'last_seen_block': block_number, 'synced_at': synced_at}
+
+    def get_states(self,
+                   accounts: List[LocalAccount],
+                   balances: bool = True,
+                   nonces: bool = True) -> Dict[str, Dict[str, int]]:
+        """Same as get_accounts_states(), but only accounts which aren't cached (or were cached longer than
+        reconcile_interval seconds ago) are read from the chain. Nonce is the next nonce to use.
+        """
+        with self._lock:
+            missing = [account.address for account in accounts
+                       if account.address not in self.states or self._expired(self.states[account.address])]
+        self.load(list(dict.fromkeys(missing)))
+        fields = [field for field, selected in (('balance', balances), ('nonce', nonces)) if selected]
+        with self._lock:
+            return {account.address: {field: self.states[account.address][field] for field in fields}
+                    for account in accounts}
+
+    def get_balance(self, account: LocalAccount) -> int:
+        return self.get_states([account], nonces=False)[account.address]['balance']
+
+    def get_nonce(self, address: str) -> int:
+        """Returns cached next nonce of address without reading it from the chain, None if it isn't cached.
+        """
+        with self._lock:
+            state = self.states.get(address)
+            return state['nonce'] if state is not None else None
+
+    def sent(self,
+             sender_address: str,
+             tx: dict,
+             tx_hash: str) -> None:
+        """Remembers value and receiver of sent transaction until its receipt is applied.
+        Replacements are registered the same way, whichever of them is mined is applied.
+        """
+        key = (sender_address, tx['nonce'])
+        with self._lock:
+            self.in_flight.setdefault(key, {})[tx_hash.lower()] = {'from': sender_address, 'to': tx.get('to'),
+                                                                   'value': tx.get('value', 0)}
+            self.hashes[tx_hash.lower()] = key
+            state = self.states.get(sender_address)
+            if state is not None:
+                state['nonce'] = max(state['nonce'], tx['nonce'] + 1)
+
+    def apply_receipt(self,
+                      tx_hash: str,
+                      receipt: Dict[str, int]) -> None:
+        """Updates states of the sender and the receiver with mined transaction sent by sent().
+        receipt has status, gasUsed, effectiveGasPrice and blockNumber as integers.
+        """
+        with self._lock:
+            key = self.hashes.get(tx_hash.lower())
+            if key is None:
+                return
+            txs = self.in_flight.pop(key)
+            for other_hash in txs:
+                self.hashes.pop(other_hash, None)
+            tx = txs[tx_hash.lower()]
+            block_number = receipt['blockNumber']
+            sender_state = self.states.get(tx['from'])
+            if sender_state is not None and block_number > sender_state['block']:
+                sender_state['balance'] -= receipt['gasUsed'] * receipt['effectiveGasPrice']
+                if receipt['status'] == 1:
+                    sender_state['balance'] -= tx['value']
+                sender_state['nonce'] = max(sender_state['nonce'], key[1] + 1)
+                sender_state['last_seen_block'] = max(sender_state['last_seen_block'], block_number)
+            receiver_state = self.states.get(tx['to'])
+            if receiver_state is not None and receipt['status'] == 1 and block_number > receiver_state['block']:
+                receiver_state['balance'] += tx['value']
+                receiver_state['last_seen_block'] = max(receiver_state['last_seen_block'], block_number)
+
+    def forget(self, tx_hash: str) -> None:
+        """Drops transaction which won't be applied, e.g. not mined before timeout.
+        """
+        with self._lock:
+            key = self.hashes.get(tx_hash.lower())
+            for other_hash in self.in_flight.pop(key, {}) if key is not None else []:
+                self.hashes.pop(other_hash, None)
+
+    def reconcile(self, accounts: List[LocalAccount] = None) -> None:
+        """Reads states of accounts (all cached ones if not specified) from the chain again.
+        """
+        with self._lock:
+            addresses = [account.address for account in accounts] if accounts is not None else list(self.states)
+        self.load(addresses)
+
+    def evict(self, addresses: List[str]) -> None:
+        """Drops states of accounts which won't be used anymore, e.g. after their window in streaming mode.
+        """
+        with self._lock:
+            for address in addresses:
+                self.states.pop(address, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.states.clear()
+            self.in_flight.clear()
+            self.hashes.clear()
+
+
+account_states = PerChain(AccountStateCache)
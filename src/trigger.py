@@ -0,0 +1,136 @@
+"""This file contains the trigger of -armed mode, which waits for the moment to fire prepared transactions.
+New blocks come from newHeads subscription over WebSocket (WS_PROVIDER in secrets.json),
+or from polling the provider every TRIGGER_POLL_INTERVAL seconds.
+"""
+
+import asyncio
+import json
+import time
+
+from typing import Callable, Dict
+
+import websockets
+
+from src.interactions import get_contract
+from settings import config, CHAINS, TRIGGER_POLL_INTERVAL
+
+
+def describe_trigger(trigger: Dict) -> str:
+    """Examples:
+    >>> describe_trigger({'function': 'saleState', 'value': 1})
+    'saleState() == 1'
+    """
+    if 'block' in trigger:
+        return f'block {trigger["block"]}'
+    if 'timestamp' in trigger:
+        local_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trigger['timestamp']))
+        return f'timestamp {trigger["timestamp"]} ({local_time})'
+    args = ', '.join(str(arg) for arg in trigger.get('args', []))
+    return f'{trigger["function"]}({args}) == {trigger.get("value", True)}'
+
+
+def create_condition(trigger: Dict) -> Callable[[Dict], bool]:
+    """Returns function checking the trigger on a new block (dict with number and timestamp).
+
+    - {'block': 25000000} - transactions are fired after block 24999999, so they can be included in block 25000000
+    - {'timestamp': 1650000000} - fired when the next block is expected to have at least this timestamp
+    - {'function': 'saleActive'} - fired when the contract function returns True in the new block,
+      value and args can be given, e.g. {'function': 'saleState', 'args': [], 'value': 2}
+
+    Examples:
+    >>> condition = create_condition({'block': 25000000})
+    >>> condition({'number': 24999999, 'timestamp': 1650000000})
+    True
+    """
+    if 'block' in trigger:
+        return lambda head: head['number'] + 1 >= trigger['block']
+    if 'timestamp' in trigger:
+        block_time = CHAINS[config.CHAIN_NAME]['BLOCK_TIME']
+        return lambda head: max(head['timestamp'], time.time()) + block_time >= trigger['timestamp']
+    if 'function' in trigger:
+        # contract function is built once, only the call is on the critical path
+        contract_function = get_contract().functions[trigger['function']](*trigger.get('args', []))
+        expected_value = trigger.get('value', True)
+        return lambda head: contract_function.call(block_identifier=head['number']) == expected_value
+    raise Exception(f'Unknown trigger {trigger}, expected block, timestamp or function')
+
+
+def _check_condition(condition: Callable[[Dict], bool], head: Dict) -> bool:
+    # a failed or reverted call of the trigger function means the trigger isn't met yet, the next block is checked
+    try:
+        return condition(head)
+    except Exception as e:
+        info_msg = f'Trigger not checked in block {head["number"]}: {e}'
+        print(info_msg)
+        if config.LOGGING == True:
+            config.logger.warning(info_msg)
+        return False
+
+
+def _head_from_block(block: Dict) -> Dict:
+    return {'number': int(block['number'], 16) if isinstance(block['number'], str) else block['number'],
+            'timestamp': int(block['timestamp'], 16) if isinstance(block['timestamp'], str) else block['timestamp']}
+
+
+async def _wait_for_head_subscription(ws_provider: str, condition: Callable[[Dict], bool]) -> Dict:
+    async with websockets.connect(ws_provider) as ws:
+        await ws.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+        response = json.loads(await ws.recv())
+        if 'error' in response:
+            raise Exception(response['error'])
+        while True:
+            message = json.loads(await ws.recv())
+            head = _head_from_block(message['params']['result'])
+            if _check_condition(condition, head):
+                return head
+
+
+def _wait_for_head_polling(condition: Callable[[Dict], bool], poll_interval: float) -> Dict:
+    last_number = None
+    while True:
+        try:
+            head = _head_from_block(config.w3.eth.get_block('latest'))
+        except Exception as e:
+            # funds are already sent to the accounts, so an RPC error doesn't stop waiting
+            print(e)
+            time.sleep(poll_interval)
+            continue
+        if head['number'] != last_number:
+            last_number = head['number']
+            if _check_condition(condition, head):
+                return head
+        time.sleep(poll_interval)
+
+
+def wait_for_trigger(trigger: Dict,
+                     ws_provider: str = None,
+                     poll_interval: float = TRIGGER_POLL_INTERVAL) -> Dict:
+    """Blocks until the trigger is met and returns the block which met it.
+    With ws_provider new blocks come from newHeads subscription, if it fails the provider is polled.
+
+    Examples:
+    >>> wait_for_trigger({'function': 'saleActive'}, 'wss://polygon-mumbai.g.alchemy.com/v2/***')
+    {'number': 25000000, 'timestamp': 1650000000}
+    """
+    condition = create_condition(trigger)
+    if config.LOGGING == True:
+        info_msg = f'Armed, waiting for {describe_trigger(trigger)} '\
+                   f'({"newHeads subscription" if ws_provider else f"polling every {poll_interval} s"})'
+        print(info_msg)
+        config.logger.info(info_msg)
+
+    head = None
+    if ws_provider:
+        try:
+            head = asyncio.run(_wait_for_head_subscription(ws_provider, condition))
+        except Exception as e:
+            print(e)
+            print('newHeads subscription failed, polling the provider instead')
+    if head is None:
+        head = _wait_for_head_polling(condition, poll_interval)
+
+    if config.LOGGING == True:
+        info_msg = f'Trigger {describe_trigger(trigger)} met in block {head["number"]}, firing'
+        print(info_msg)
+        config.logger.info(info_msg)
+    return head
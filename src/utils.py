@@ -1,36 +1,59 @@
 """This file contains functions for estimating gas fees.
 """
-from settings import MINT_FUNCTION_NAME, NUMBER_OF_MINTS, EXTRA_MIXING_LAYERS, MINT_PRICE,\
-    DEFAULT_GAS, CONTRACT_ADDRESS, CONTRACT_ABI, CHAIN_ID, CONTRACT_FUNCTION_GAS, w3
+from src.gas import gas_oracle
+from src.interactions import get_contract, get_calldata, get_quantity_function, plan_mint_batches
+from settings import config, DEFAULT_GAS, CONTRACT_FUNCTION_GAS
 
 
 def estimate_single_mint_fee() -> int:
     """Estimates single mint fee in Wei unit.
     """
-    current_gas_price = w3.eth.gas_price
-    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
-    contract_mint = contract.functions[MINT_FUNCTION_NAME]()
-    contract_tx = contract_mint.buildTransaction({
+    fees = gas_oracle.fees()
+    contract_tx = {
         'from': '0x000000000000000000000000000000000000dEaD',
-        'value': w3.toWei(MINT_PRICE, 'ether'),
-        'chainId': CHAIN_ID,
+        'to': get_contract().address,
+        'data': get_calldata(config.MINT_FUNCTION_NAME),
+        'value': config.w3.toWei(config.MINT_PRICE, 'ether'),
+        'chainId': config.CHAIN_ID,
         'gas': CONTRACT_FUNCTION_GAS,
-        'maxFeePerGas': w3.toWei('2', 'gwei'),
-        'maxPriorityFeePerGas': w3.toWei('1', 'gwei')
-    })
-    estimated_gas_used = w3.eth.estimate_gas(contract_tx)
-    estimated_mint_fee = estimated_gas_used * current_gas_price
+        **fees
+    }
+    estimated_gas_used = config.w3.eth.estimate_gas(contract_tx)
+    estimated_mint_fee = estimated_gas_used * fees['maxFeePerGas']
     return estimated_mint_fee
 
 
-def estimate_multi_mint_fees(single_mint_fee: int = None) -> int:
-    """Estimates total fees used by multi_accounts_mint() function from minter.py in Wei unit.
+def estimate_single_account_mint_fees(single_mint_fee: int = None) -> int:
+    """Estimates total fees used by single_account_mint() function from minter.py in Wei unit.
+    When the mint function takes the number of tokens, fees of batched transactions are used.
+    """
+    if get_quantity_function(config.MINT_FUNCTION_NAME) is None:
+        if single_mint_fee is None:
+            single_mint_fee = estimate_single_mint_fee()
+        return single_mint_fee * config.NUMBER_OF_MINTS
+    # the balance has to cover the whole gas limit of every batch at maxFeePerGas
+    max_fee = gas_oracle.fees()['maxFeePerGas']
+    batches = plan_mint_batches(config.MINT_FUNCTION_NAME, config.NUMBER_OF_MINTS,
+                                config.w3.toWei(config.MINT_PRICE, 'ether'))
+    return sum(batch['gas'] for batch in batches) * max_fee
+
+
+def estimate_chain_fees(single_mint_fee: int = None) -> int:
+    """Estimates fees used by chain of transactions of one derived account in Multi mode
+    (funding, mixing hops and mint) in Wei unit.
     """
-    current_gas_price = w3.eth.gas_price
-    single_tx_fee = DEFAULT_GAS * current_gas_price
-    number_of_tx = NUMBER_OF_MINTS + NUMBER_OF_MINTS * EXTRA_MIXING_LAYERS
+    max_fee = gas_oracle.fees()['maxFeePerGas']
+    single_tx_fee = DEFAULT_GAS * max_fee
     if single_mint_fee is None:
         single_mint_fee = estimate_single_mint_fee()
+    # mint transaction is accepted only if the balance covers its whole gas limit at maxFeePerGas,
+    # the unused part is sent back with the remaining funds
+    single_mint_fee = max(single_mint_fee, CONTRACT_FUNCTION_GAS * max_fee)
+    return single_tx_fee * (1 + config.EXTRA_MIXING_LAYERS) + single_mint_fee
 
-    total_fees = single_tx_fee * number_of_tx + single_mint_fee * NUMBER_OF_MINTS
+
+def estimate_multi_mint_fees(single_mint_fee: int = None) -> int:
+    """Estimates total fees used by multi_accounts_mint() function from minter.py in Wei unit.
+    """
+    total_fees = estimate_chain_fees(single_mint_fee) * config.NUMBER_OF_MINTS
     return total_fees
@@ -4,13 +4,47 @@ WARNING - tests use settings.json and secrets.json files and work with ExampleCo
 To run them against your contract you have to treat this as an example and adjust them manually.
 """
 
+import contextvars
+import itertools
+import json
+import logging
+import os
+import secrets
+import tempfile
+import time
 import unittest
+import urllib.error
+import urllib.request
 
-from src.accounts import get_master_account, get_derived_accounts, display_accounts
-from src.splitter import send_one_to_many, send_many_to_one, send_many_to_many
-from src.interactions import contract_read, contract_write, contract_write_from_one
+from functools import partial
+
+from eth_abi import encode_single
+from eth_utils import function_abi_to_4byte_selector
+
+from src.accounts import get_master_account, get_derived_accounts, display_accounts, get_accounts_states,\
+    create_account_generator, iter_derived_accounts, read_addresses_cache, addresses_cache_path, AccountExt,\
+    CompactAccount
+from src.splitter import send_one_to_many, send_many_to_one, send_many_to_many, send_tx, send_all
+from src.interactions import contract_read, contract_write, contract_write_from_one, get_contract, get_calldata,\
+    get_quantity_function
+from src.nonces import NonceManager
+from src.receipts import wait_for_receipts
+from src.gas import GasOracle
+from src.replacements import TxReplacer
+from src.state import AccountStateCache
+from src.scheduler import TxScheduler, CONFIRMED, SENT, SKIPPED, WAITING
+from src.journal import RunJournal, find_unfinished_journal, load_journal, plan_differences
+from src.providers import ProviderPool
+from src.standin import StandInChain, StandInServer, STANDIN_ABI
 from src.utils import estimate_single_mint_fee, estimate_multi_mint_fees
-from settings import w3, logger, LOGGING, MINT_PRICE
+from src.abi_cache import abi_cache_path, load_contract_abi
+from src.simulation import decode_revert_reason
+from src.trigger import create_condition, _check_condition
+from src.daemon import MintDaemon
+from src.inventory import TRANSFER_TOPIC, address_topic, apply_transfers
+from src.metrics import report_progress
+from src.logs import TextFormatter, JsonLinesFormatter, ProgressHandler
+from settings import config, ABI_CACHE_DIR, Config, PerChain, current_config
 
 
 class TestMinter(unittest.TestCase):
@@ -18,16 +52,170 @@ class TestMinter(unittest.TestCase):
     def setUpClass(cls):
         super(TestMinter, cls).setUpClass()
         # this way it runs only once
-        if LOGGING == True:
-            logger.info('[Test Mode]')
+        if config.LOGGING == True:
+            config.logger.info('[Test Mode]')
+
+    def test_settings_abi_cache(self):
+        contract_abi = config.CONTRACT_ABI
+        path = abi_cache_path(ABI_CACHE_DIR, config.CHAIN_ID, config.CONTRACT_ADDRESS)
+        self.assertTrue(os.path.isfile(path))
+        # second load doesn't need the network, it's read from the cache file
+        cached_abi = load_contract_abi('http://unused', config.CHAIN_ID, config.CONTRACT_ADDRESS, ABI_CACHE_DIR)
+        self.assertEqual(cached_abi, contract_abi)
+
+    def test_settings_jobs_configs(self):
+        other_chain = 'Polygon' if config.CHAIN_NAME != 'Polygon' else 'Mumbai'
+        job_config = Config(overrides={'CHAIN_NAME': other_chain, 'NUMBER_OF_MINTS': 3})
+        oracles = PerChain(GasOracle)
+        context = contextvars.copy_context()
+        context.run(current_config.set, job_config)
+        self.assertEqual(context.run(lambda: (config.CHAIN_NAME, config.NUMBER_OF_MINTS)), (other_chain, 3))
+        self.assertNotEqual(config.CHAIN_NAME, other_chain)
+        # every chain has its own instance, connections are shared by configs with the same endpoints
+        self.assertIsNot(context.run(oracles.current), oracles.current())
+        self.assertIs(context.run(oracles.current), context.run(oracles.current))
+        self.assertIs(job_config.w3, config.w3)
+
+    def test_inventory_transfers(self):
+        ours, other = '0x' + '11' * 20, '0x' + '22' * 20
+
+        def transfer_log(sender, receiver, token_id, block, log_index=0):
+            return {'topics': [TRANSFER_TOPIC, address_topic(sender), address_topic(receiver), hex(token_id)],
+                    'blockNumber': hex(block), 'logIndex': hex(log_index)}
+
+        # logs of different queries come in any order and a transfer between own accounts comes twice
+        logs = [transfer_log(ours, other, 1, 20), transfer_log('0x' + '00' * 20, ours, 1, 10),
+                transfer_log('0x' + '00' * 20, ours, 2, 10, 1), transfer_log(ours, ours, 2, 15),
+                transfer_log(ours, ours, 2, 15)]
+        # ERC-20 Transfer, its value isn't a topic
+        logs.append({'topics': logs[0]['topics'][:3], 'blockNumber': '0x1', 'logIndex': '0x0'})
+        tokens = {}
+        apply_transfers(tokens, logs, {ours})
+        self.assertEqual(tokens, {1: [None, 20, 0], 2: [ours, 15, 0]})
+
+    def test_logs_events(self):
+        sender, receiver = '0x' + '11' * 20, '0x' + '22' * 20
+        record = logging.makeLogRecord({'msg': 'send', 'levelname': 'INFO', 'event': 'send', 'phase': 'fund',
+                                        'fields': {'account': 0, 'address': sender, 'receiver_account': 1,
+                                                   'receiver': receiver, 'amount': 5 * 10 ** 17, 'nonce': 7,
+                                                   'hash': '0xabc', 'duration': 0.01}})
+        # the text log keeps messages of sent transactions, JSON lines keep all fields of the event
+        self.assertEqual(TextFormatter('%(message)s').format(record),
+                         'Sending 0.5 from (0) 0x1111... to (1) 0x2222... in 0xabc')
+        event = json.loads(JsonLinesFormatter().format(record))
+        self.assertEqual((event['event'], event['phase'], event['nonce']), ('send', 'fund', 7))
+        progress = ProgressHandler(interval=3600)
+        for _ in range(3):
+            progress.handle(record)
+        progress.handle(logging.makeLogRecord({'msg': 'info'}))
+        self.assertEqual((dict(progress.sent), progress.replaced), ({'fund': 3}, 0))
+
+    def test_daemon_api(self):
+        def run_job(job):
+            report_progress(steps={'confirmed': 1})
+            return {'number_of_mints': config.NUMBER_OF_MINTS}
+
+        def post_job(spec, **headers):
+            request = urllib.request.Request(f'{daemon.url}/jobs', method='POST', data=json.dumps(spec).encode('utf-8'),
+                                             headers={'Authorization': f'Bearer {daemon.token}',
+                                                      'Content-Type': 'application/json', **headers})
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+
+        daemon = MintDaemon(run_job, port=0)
+        daemon.start()
+        job_id = post_job({'MODE': 'multi', 'NUMBER_OF_MINTS': 3})['id']
+        for _ in range(50):
+            request = urllib.request.Request(f'{daemon.url}/jobs/{job_id}',
+                                             headers={'Authorization': f'Bearer {daemon.token}'})
+            with urllib.request.urlopen(request) as response:
+                job = json.loads(response.read())
+            if job['state'] == 'finished':
+                break
+            time.sleep(0.1)
+        # a job can't be submitted without the token, by a web page, as text/plain or with secrets
+        refused = [({'Authorization': 'Bearer wrong'}, 401), ({'Origin': 'https://example.com'}, 403),
+                   ({'Content-Type': 'text/plain'}, 415)]
+        for headers, status in refused:
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                post_job({'MODE': 'single'}, **headers)
+            self.assertEqual(error.exception.code, status)
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            post_job({'MODE': 'single', 'PRIVATE_KEY': '0x' + '11' * 32})
+        self.assertEqual(error.exception.code, 400)
+        daemon.stop()
+        # the job runs in the context of its own settings
+        self.assertEqual(job['results'], {'number_of_mints': 3})
+        self.assertEqual(job['progress'], {'steps': {'confirmed': 1}})
+        self.assertEqual(job['mode'], 'multi')
 
     def test_accounts_new(self):
         master_account = get_master_account(default=False)
         self.assertEqual(master_account.privateKey.hex()[:2], '0x')
 
+    def test_accounts_states(self):
+        master_account = get_master_account(default=True)
+        accounts = get_derived_accounts(master_account, number_of_accounts=3)
+        states = get_accounts_states([master_account] + accounts)
+        self.assertEqual(states[master_account.address]['balance'], master_account.get_balance())
+        self.assertEqual(states[master_account.address]['nonce'], master_account.get_nonce())
+        self.assertEqual(len(states), 4)
+
+    def test_accounts_derived_cache(self):
+        master_account = get_master_account(default=True)
+        account_gen = create_account_generator(master_account)
+        expected_addresses = [next(account_gen).address for _ in range(5)]
+        accounts = get_derived_accounts(master_account, number_of_accounts=5)
+        self.assertEqual([account.address for account in accounts], expected_addresses)
+        self.assertEqual(read_addresses_cache(master_account.address)[:5], expected_addresses)
+        # second time addresses come from the cache, private keys still match them
+        streamed_accounts = list(iter_derived_accounts(master_account, 5))
+        self.assertEqual(streamed_accounts[4].address, AccountExt.from_key(streamed_accounts[4].privateKey).address)
+
+    def test_accounts_stale_cache(self):
+        master_account = AccountExt.from_key('0x' + secrets.token_hex(32))
+        expected_addresses = [account.address for account in iter_derived_accounts(master_account, 3)]
+        path = addresses_cache_path(master_account.address)
+        with open(path) as f:
+            lines = f.readlines()
+        # an address in the middle of the cache doesn't belong to the derived key
+        lines[1] = master_account.address + lines[1][42:]
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        try:
+            self.assertEqual([account.address for account in iter_derived_accounts(master_account, 3)],
+                             expected_addresses)
+            self.assertEqual(read_addresses_cache(master_account.address), expected_addresses)
+        finally:
+            os.remove(path)
+
+    def test_accounts_derived_extended(self):
+        master_account = AccountExt.from_key('0x' + secrets.token_hex(32))
+        try:
+            first_accounts = get_derived_accounts(master_account, number_of_accounts=2)
+            accounts = get_derived_accounts(master_account, number_of_accounts=4)
+            # only new accounts are derived, so ids of accounts don't skip the ones derived before
+            self.assertEqual(accounts[:2], first_accounts)
+            self.assertEqual([account.id for account in accounts],
+                             list(range(first_accounts[0].id, first_accounts[0].id + 4)))
+            self.assertEqual([account.address for account in accounts],
+                             [account.address for account in itertools.islice(create_account_generator(master_account), 4)])
+        finally:
+            os.remove(addresses_cache_path(master_account.address))
+
+    def test_accounts_compact(self):
+        master_account = get_master_account(default=True)
+        accounts = get_derived_accounts(master_account, number_of_accounts=3)
+        compact_accounts = list(iter_derived_accounts(master_account, 3, compact=True))
+        self.assertTrue(all(isinstance(account, CompactAccount) for account in compact_accounts))
+        self.assertEqual([account.address for account in compact_accounts], [account.address for account in accounts])
+        self.assertEqual(compact_accounts[2].privateKey, accounts[2].privateKey)
+        # only the slots, no __dict__ per account
+        self.assertFalse(hasattr(compact_accounts[0], '__dict__'))
+
     # @unittest.skip('Skipped, takes ~30 seconds')
     def test_splitter_split_mix_send_back(self):
-        split_amount = int(MINT_PRICE * 1.2 * 10 ** 18)  # not estimating fees here, just * 1.2 instead
+        split_amount = int(config.MINT_PRICE * 1.2 * 10 ** 18)  # not estimating fees here, just * 1.2 instead
         master_account = get_master_account(default=True)
         accounts = get_derived_accounts(master_account, number_of_accounts=6)
         self.assertEqual(len(accounts), 6)
@@ -50,20 +238,209 @@ class TestMinter(unittest.TestCase):
         self.assertEqual(accounts_part_2[2].get_balance(), 0)
         self.assertGreater(master_account.get_balance(), master_balance_after_split)
 
+    def test_scheduler_chains(self):
+        amount = int(config.MINT_PRICE * 1.2 * 10 ** 18)
+        master_account = get_master_account(default=True)
+        accounts = get_derived_accounts(master_account, number_of_accounts=4)
+        scheduler = TxScheduler()
+        for sender, receiver in [accounts[:2], accounts[2:]]:
+            step = scheduler.add(f'fund {sender.id}', partial(send_tx, master_account, sender, amount))
+            step = scheduler.add(f'hop {sender.id}', partial(send_all, sender, receiver), [step])
+            scheduler.add(f'send back {receiver.id}', partial(send_all, receiver, master_account), [step])
+        results = scheduler.run()
+        self.assertEqual(len(results), 6)
+        self.assertEqual([result['state'] for result in results.values()], ['confirmed'] * 6)
+        self.assertEqual(accounts[3].get_balance(), 0)
+
     def test_interactions_read_write(self):
         master_account = get_master_account(default=True)
         mint_price = contract_read('claimPrice', None)
         last_tx_hash = contract_write(master_account, 'mint', None, mint_price)
-        receipt = w3.eth.wait_for_transaction_receipt(last_tx_hash)
+        receipt = config.w3.eth.wait_for_transaction_receipt(last_tx_hash)
         self.assertEqual(receipt['status'], 1)
 
+    def test_interactions_contract_cache(self):
+        self.assertIs(get_contract(), get_contract())
+        self.assertEqual(get_calldata('mint'), '0x1249c58b')
+        self.assertEqual(get_calldata('ownerOf', [63]), get_contract().encodeABI(fn_name='ownerOf', args=[63]))
+
     def test_interactions_write_from_one(self):
         master_account = get_master_account(default=True)
         old_nonce = master_account.get_nonce()
         number_of_mints = 3
-        contract_write_from_one(master_account, 'mint', None, number_of_mints, amount=w3.toWei(MINT_PRICE, 'ether'))
+        contract_write_from_one(master_account, 'mint', None, number_of_mints,
+                                amount=config.w3.toWei(config.MINT_PRICE, 'ether'))
         self.assertEqual(old_nonce + number_of_mints, master_account.get_nonce())
 
+    def test_interactions_quantity_function(self):
+        # the stand-in contract has both mint() and mint(uint256 _mintAmount)
+        self.assertEqual(get_quantity_function('mint', STANDIN_ABI)['inputs'][0]['name'], '_mintAmount')
+        self.assertIsNone(get_quantity_function('ownerOf', STANDIN_ABI))
+
+    def test_simulation_revert_reasons(self):
+        error = {'code': 3, 'message': 'execution reverted: Sold out',
+                 'data': '0x08c379a0' + encode_single('string', 'Sold out').hex()}
+        self.assertEqual(decode_revert_reason(error), 'Sold out')
+        error = {'code': 3, 'message': 'execution reverted',
+                 'data': '0x4e487b71' + encode_single('uint256', 0x11).hex()}
+        self.assertEqual(decode_revert_reason(error), 'Panic: arithmetic overflow or underflow')
+        abi = [{'inputs': [{'name': 'limit', 'type': 'uint256'}], 'name': 'WalletLimitExceeded', 'type': 'error'}]
+        error = {'code': 3, 'message': 'execution reverted',
+                 'data': '0x' + function_abi_to_4byte_selector(abi[0]).hex() + encode_single('uint256', 3).hex()}
+        self.assertEqual(decode_revert_reason(error, abi), 'WalletLimitExceeded(3)')
+
+    def test_trigger_conditions(self):
+        self.assertFalse(create_condition({'block': 100})({'number': 98, 'timestamp': 0}))
+        # fired after the previous block, so transactions can be included in the block itself
+        self.assertTrue(create_condition({'block': 100})({'number': 99, 'timestamp': 0}))
+        self.assertFalse(create_condition({'timestamp': 4102444800})({'number': 1, 'timestamp': 0}))
+        # a trigger function which reverts or can't be called means the trigger isn't met yet
+        self.assertFalse(_check_condition(lambda head: 1 / 0, {'number': 1, 'timestamp': 0}))
+
+    def test_nonces_manager(self):
+        master_account = get_master_account(default=True)
+        nonce_manager = NonceManager()
+        nonce = nonce_manager.next_nonce(master_account.address)
+        self.assertEqual(nonce, master_account.get_nonce())
+        self.assertEqual(nonce_manager.next_nonce(master_account.address), nonce + 1)
+        self.assertEqual(nonce_manager.next_nonce(master_account.address), nonce + 2)
+        # broadcast of nonce + 1 failed, it has to be handed out again before nonce + 3
+        nonce_manager.failed(master_account.address, nonce + 1, Exception('underpriced'))
+        self.assertEqual(nonce_manager.next_nonce(master_account.address), nonce + 1)
+        self.assertEqual(nonce_manager.next_nonce(master_account.address), nonce + 3)
+
+    def test_state_receipts(self):
+        master_account = get_master_account(default=True)
+        accounts = get_derived_accounts(master_account, number_of_accounts=1)
+        account_states = AccountStateCache()
+        states = account_states.get_states([master_account] + accounts)
+        self.assertEqual(states[master_account.address]['balance'], master_account.get_balance())
+        block_number = account_states.states[master_account.address]['block']
+        nonce = states[master_account.address]['nonce']
+        tx = {'to': accounts[0].address, 'value': 5, 'nonce': nonce}
+        account_states.sent(master_account.address, tx, '0x01')
+        self.assertEqual(account_states.get_nonce(master_account.address), nonce + 1)
+        account_states.apply_receipt('0x01', {'status': 1, 'gasUsed': 21000, 'effectiveGasPrice': 1,
+                                              'blockNumber': block_number + 1})
+        new_states = account_states.get_states([master_account] + accounts)
+        self.assertEqual(new_states[master_account.address]['balance'], states[master_account.address]['balance'] - 21005)
+        self.assertEqual(new_states[accounts[0].address]['balance'], states[accounts[0].address]['balance'] + 5)
+        # the balance read at block_number already includes transactions mined in it
+        account_states.sent(master_account.address, {**tx, 'nonce': nonce + 1}, '0x02')
+        account_states.apply_receipt('0x02', {'status': 1, 'gasUsed': 21000, 'effectiveGasPrice': 1,
+                                              'blockNumber': block_number})
+        self.assertEqual(account_states.get_balance(accounts[0]), states[accounts[0].address]['balance'] + 5)
+
+    def test_journal_resume(self):
+        journal_dir = tempfile.mkdtemp()
+        journal = RunJournal(journal_dir)
+        journal.start({'number_of_mints': 1})
+        result = {'status': 1, 'gasUsed': 21000, 'effectiveGasPrice': 1, 'blockNumber': 10}
+        with journal.step('fund 1'):
+            journal.sent('0xA', {'nonce': 0}, '0x01')
+        journal.done('fund 1', '0x01', result)
+        with journal.step('mint 1'):
+            journal.sent('0xB', {'nonce': 0}, '0x02')
+        journal.replaced('0x02', '0x03')
+        # the run was interrupted, the journal isn't finished
+        self.assertEqual(find_unfinished_journal(journal_dir), journal.path)
+        plan, journaled = load_journal(journal.path)
+        self.assertEqual(plan, {'number_of_mints': 1})
+        self.assertEqual(journaled['fund 1']['result'], result)
+        self.assertEqual(journaled['mint 1'], {'hash': '0x02', 'replacements': ['0x03'], 'result': None})
+
+        scheduler = TxScheduler()
+        fund = scheduler.add('fund 1', lambda: '0x01')
+        mint = scheduler.add('mint 1', lambda: '0x02', [fund])
+        scheduler.add('send back 1', lambda: '0x04', [mint], run_on_revert=True)
+        scheduler.restore(journaled)
+        self.assertEqual([step['state'] for step in scheduler.steps.values()], [CONFIRMED, SENT, WAITING])
+        journal.finish()
+        self.assertIsNone(find_unfinished_journal(journal_dir))
+
+    def test_scheduler_send_back_after_failed_mint(self):
+        def fail(key):
+            sent_steps.append(key)
+            raise Exception(f'{key} not sent')
+
+        sent_steps = []
+        result = {'status': 1, 'gasUsed': 21000, 'effectiveGasPrice': 1, 'blockNumber': 10}
+        scheduler = TxScheduler()
+        for chain_id in (1, 2):
+            fund = scheduler.add(f'fund {chain_id}', lambda: '0x01')
+            mint = scheduler.add(f'mint {chain_id}', partial(fail, f'mint {chain_id}'), [fund])
+            scheduler.add(f'send back {chain_id}', partial(fail, f'send back {chain_id}'), [mint], run_on_revert=True)
+        # funding of the first chain was confirmed, of the second one reverted
+        scheduler.restore({'fund 1': {'hash': '0x01', 'replacements': [], 'result': result},
+                           'fund 2': {'hash': '0x02', 'replacements': [], 'result': {**result, 'status': 0}}})
+        results = scheduler.run()
+        self.assertEqual(sent_steps, ['mint 1', 'send back 1'])
+        self.assertEqual(results['send back 2']['state'], SKIPPED)
+
+    def test_journal_plan_mismatch(self):
+        journal_dir = tempfile.mkdtemp()
+        journal = RunJournal(journal_dir)
+        journal.start({'number_of_mints': 10, 'extra_mixing_layers': 1, 'mode': 'stream', 'presign': False,
+                       'total_fees': 1000})
+        plan, _ = load_journal(journal.path)
+        # -multi puts other accounts in chains than -stream, so the run can't be resumed with it
+        self.assertEqual(plan_differences(plan, {'number_of_mints': 10, 'extra_mixing_layers': 1, 'mode': 'multi',
+                                                 'presign': False}), ['mode'])
+        self.assertEqual(plan_differences(plan, {'number_of_mints': 10, 'extra_mixing_layers': 1, 'mode': 'stream',
+                                                 'presign': False}), [])
+
+    def test_receipts_wait_for_many(self):
+        master_account = get_master_account(default=True)
+        tx_hashes = contract_write_from_one(master_account, 'mint', None, 2,
+                                            amount=config.w3.toWei(config.MINT_PRICE, 'ether'), wait=False)
+        results = wait_for_receipts(tx_hashes)
+        self.assertEqual(list(results), tx_hashes)
+        self.assertEqual([result['status'] for result in results.values()], [1, 1])
+        self.assertGreater(results[tx_hashes[0]]['gasUsed'], 0)
+
+    def test_gas_oracle(self):
+        gas_oracle = GasOracle()
+        fees = gas_oracle.fees()
+        self.assertGreaterEqual(fees['maxFeePerGas'], fees['maxPriorityFeePerGas'])
+        self.assertLessEqual(gas_oracle.fees('slow')['maxPriorityFeePerGas'],
+                             gas_oracle.fees('fast')['maxPriorityFeePerGas'])
+        sweep_fees = gas_oracle.sweep_fees()
+        self.assertEqual(sweep_fees['maxFeePerGas'], sweep_fees['maxPriorityFeePerGas'])
+
+    def test_replacements_bumped_fees(self):
+        fees = GasOracle().fees()
+        bumped_fees = TxReplacer(fee_bump_percent=12.5, max_fee_cap=None)._bumped_fees(fees)
+        self.assertGreaterEqual(bumped_fees['maxFeePerGas'] * 10, fees['maxFeePerGas'] * 11)
+        self.assertGreaterEqual(bumped_fees['maxPriorityFeePerGas'] * 10, fees['maxPriorityFeePerGas'] * 11)
+        # no room for 10% raise under the cap
+        self.assertIsNone(TxReplacer(max_fee_cap=fees['maxFeePerGas'] / 10 ** 9)._bumped_fees(fees))
+
+    def test_providers_pool(self):
+        # two endpoints of one local stand-in chain, the first one is slow
+        master_account = get_master_account(default=True)
+        chain = StandInChain(config.CHAIN_ID, {master_account.address: 10 ** 20}, 10 ** 17)
+        slow_server = StandInServer(chain, block_time=None, latency=1)
+        fast_server = StandInServer(chain, block_time=None)
+        slow_server.start()
+        fast_server.start()
+        try:
+            pool = ProviderPool([slow_server.url, fast_server.url], hedge_delay=0.1)
+            call = {'jsonrpc': '2.0', 'method': 'eth_blockNumber', 'params': [], 'id': 1}
+            self.assertEqual(pool.request(call, hedge=True)['result'], '0x0')
+            self.assertEqual(fast_server.http_requests, 1)
+
+            tx = {'to': master_account.address, 'value': 1, 'nonce': 0, 'gas': 21000, 'chainId': config.CHAIN_ID,
+                  'maxFeePerGas': 2 * 10 ** 9, 'maxPriorityFeePerGas': 10 ** 9}
+            signed_tx = master_account.sign_transaction(tx)
+            call = {'jsonrpc': '2.0', 'method': 'eth_sendRawTransaction',
+                    'params': [signed_tx.rawTransaction.hex()], 'id': 2}
+            # broadcast to both endpoints, the first accepting one answers
+            self.assertEqual(pool.request(call)['result'], signed_tx.hash.hex())
+            self.assertEqual(fast_server.rpc_calls['eth_sendRawTransaction'], 1)
+        finally:
+            slow_server.stop()
+            fast_server.stop()
+
     def test_utils_estimate_single(self):
         estimated_mint_fee = estimate_single_mint_fee()
         self.assertGreater(estimated_mint_fee, 0)